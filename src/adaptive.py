@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.design import EXTRA_AXES, ordered_levels
+
+
+# ============================================================
+# Adaptive allocation of calls across configs
+# ============================================================
+#
+# A fixed grid spends the same k repeats on every config, including the ones
+# whose accuracy is already pinned down. With --adaptive POLICY the runner
+# instead takes its units from AdaptiveScheduler:
+#
+#   1. warm-up: every config (grid or --plan point) answers the first
+#      --adaptive-warmup questions once (default: every question), question
+#      by question in the same shuffled order, so configs start out paired.
+#   2. then batches of --adaptive-batch calls. Each batch draws configs from
+#      an allocation distribution recomputed from the live aggregates
+#      (src.answer_counts.RunningAnswerCounts over the rows written so far).
+#      A config's calls walk the shared question order round-robin, so every
+#      config still covers the questions evenly and the repeats stay paired
+#      across configs.
+#
+# Policies (per-config posterior Beta(1 + correct, 1 + wrong), pooled over
+# questions):
+#
+#   top-two   top-two Thompson sampling: the leader is the argmax of a
+#             posterior draw, the challenger the argmax of another draw (its
+#             runner-up when it is the leader). P(config) = beta * P(leader)
+#             + (1 - beta) * P(challenger), by Monte Carlo. Spends the budget
+#             on the close calls at the top.
+#   contrast  the treatment-vs-baseline log odds ratios at matching
+#             temperature / top_p / max_tokens. A contrast is open while its
+#             95% interval covers 0 (or is wider than --adaptive-target-width).
+#             Each config has a target share of the calls that minimises the
+#             summed variance of the open contrasts (many-to-one Neyman
+#             allocation): proportional to sqrt(sum over its open contrasts
+#             of its per-call variance n * var, var(logit) ~ 1/a + 1/b). A
+#             shared baseline in m open contrasts thus gets sqrt(m) times a
+#             treatment's calls at equal accuracies. P(config) is
+#             proportional to its shortfall from that target after the
+#             batch (calls issued so far, in flight included).
+#
+# Every distribution is mixed with --adaptive-floor of uniform, so no config is
+# starved and every call has a known, non-zero selection probability. Rows
+# carry alloc_batch (0 = warm-up) and alloc_prob; <out stem>.alloc.jsonl logs
+# one record per batch (per-config n / accuracy / probability, the contrasts,
+# the draw). Allocation depends only on earlier outcomes, so likelihood-based
+# fits (the clustered logit) remain valid; alloc_prob is there for
+# design-based (inverse-probability weighted) estimates.
+
+POLICIES = ("top-two", "contrast")
+
+
+def add_adaptive_args(ap) -> None:
+    ap.add_argument(
+        "--adaptive",
+        choices=POLICIES,
+        default=None,
+        help="Allocate calls across configs adaptively (src.adaptive) instead of a fixed k per config.",
+    )
+    ap.add_argument(
+        "--adaptive-budget",
+        type=int,
+        default=None,
+        help="Total calls incl. warm-up (default: what the fixed grid would cost, configs x questions x k).",
+    )
+    ap.add_argument("--adaptive-batch", type=int, default=20, help="Calls allocated per decision.")
+    ap.add_argument(
+        "--adaptive-warmup",
+        type=int,
+        default=None,
+        help="Questions every config answers once before adapting (default: all).",
+    )
+    ap.add_argument("--adaptive-floor", type=float, default=0.1, help="Share of each batch allocated uniformly.")
+    ap.add_argument("--adaptive-beta", type=float, default=0.5, help="top-two: probability of sampling the leader.")
+    ap.add_argument(
+        "--adaptive-target-width",
+        type=float,
+        default=None,
+        help="contrast: a contrast stays open until its 95%% CI (log OR) is narrower than this, even if it excludes 0.",
+    )
+    ap.add_argument("--adaptive-seed", type=int, default=0)
+    ap.add_argument(
+        "--adaptive-log",
+        default=None,
+        help="Allocation log JSONL (default: <out-jsonl stem>.alloc.jsonl).",
+    )
+
+
+def arms_from_units(units: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One arm per config_id, in first-seen order, from grid_units / plan_units."""
+    arms: Dict[str, Dict[str, Any]] = {}
+    for u in units:
+        if u["config_id"] not in arms:
+            arms[u["config_id"]] = {
+                "config_id": u["config_id"],
+                "treatment": u["treatment"],
+                "temperature": u["temperature"],
+                **{a: u[a] for a in EXTRA_AXES if a in u},
+            }
+    return list(arms.values())
+
+
+class AdaptiveScheduler:
+    def __init__(
+        self,
+        arms: Sequence[Dict[str, Any]],
+        items: Sequence[Dict[str, Any]],
+        policy: str = "top-two",
+        budget: Optional[int] = None,
+        batch: int = 20,
+        warmup: Optional[int] = None,
+        floor: float = 0.1,
+        beta: float = 0.5,
+        target_width: Optional[float] = None,
+        seed: int = 0,
+        log_path: Optional[str] = None,
+        draws: int = 2000,
+    ) -> None:
+        import numpy as np
+
+        from src.answer_counts import RunningAnswerCounts
+
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown adaptive policy: {policy}")
+        self.np = np
+        self.arms = list(arms)
+        self.policy = policy
+        self.batch = max(1, batch)
+        self.floor = min(max(floor, 0.0), 1.0)
+        self.beta = beta
+        self.target_width = target_width
+        self.draws = draws
+        self.rng = np.random.default_rng(seed)
+
+        q_ids = [item["id"] for item in items]
+        random.Random(seed).shuffle(q_ids)
+        self.q_order = q_ids
+        self.warmup = len(q_ids) if warmup is None else max(0, min(warmup, len(q_ids)))
+        self.budget = budget if budget is not None else len(self.arms) * len(q_ids)
+        self.issued = [0] * len(self.arms)
+        self.n_batches = 0
+
+        self.counts = RunningAnswerCounts()
+        self.contrasts = self._contrast_pairs()
+        self.log_path = log_path
+        self._log = open(log_path, "w", encoding="utf-8") if log_path else None
+
+    # ---------------- live aggregates ----------------
+
+    def observe(self, row: Dict[str, Any]) -> None:
+        """Fold a written row into the running counts the next batch is planned from."""
+        self.counts.add(row)
+
+    def _posterior(self) -> Tuple[Any, Any]:
+        """Beta(1 + correct, 1 + wrong) parameters per arm."""
+        a = self.np.ones(len(self.arms))
+        b = self.np.ones(len(self.arms))
+        for i, arm in enumerate(self.arms):
+            c = self.counts.configs.get(arm["config_id"])
+            if c is not None:
+                runs, correct = self.counts.cfg_sums[c][0], self.counts.cfg_sums[c][1]
+                a[i] += correct
+                b[i] += runs - correct
+        return a, b
+
+    def _contrast_pairs(self) -> List[Tuple[int, int]]:
+        """(arm, baseline arm) pairs: each non-baseline treatment vs the baseline at the same settings."""
+        levels = ordered_levels([arm["treatment"] for arm in self.arms])
+        base = levels[0]
+
+        def settings(arm: Dict[str, Any]) -> tuple:
+            return (float(arm["temperature"]),) + tuple(arm.get(a) for a in EXTRA_AXES)
+
+        baseline = {settings(arm): i for i, arm in enumerate(self.arms) if arm["treatment"] == base}
+        return [
+            (i, baseline[settings(arm)])
+            for i, arm in enumerate(self.arms)
+            if arm["treatment"] != base and settings(arm) in baseline
+        ]
+
+    def contrast_table(self) -> List[Dict[str, Any]]:
+        a, b = self._posterior()
+        out = []
+        for i, j in self.contrasts:
+            est = math.log(a[i] / b[i]) - math.log(a[j] / b[j])
+            var_i, var_j = 1.0 / a[i] + 1.0 / b[i], 1.0 / a[j] + 1.0 / b[j]
+            se = math.sqrt(var_i + var_j)
+            open_ = abs(est) < 1.96 * se or (self.target_width is not None and 2 * 1.96 * se > self.target_width)
+            out.append({
+                "config_id": self.arms[i]["config_id"],
+                "baseline": self.arms[j]["config_id"],
+                "log_or": round(est, 4),
+                "se": round(se, 4),
+                "open": bool(open_),
+                "_arms": (i, j),
+                "_var": (var_i, var_j),
+            })
+        return out
+
+    # ---------------- policies ----------------
+
+    def _top_two(self) -> Tuple[Any, Dict[str, Any]]:
+        np = self.np
+        a, b = self._posterior()
+        A = len(self.arms)
+        lead = np.argmax(self.rng.beta(a, b, size=(self.draws, A)), axis=1)
+        second = self.rng.beta(a, b, size=(self.draws, A))
+        order = np.argsort(-second, axis=1)
+        chal = np.where(order[:, 0] == lead, order[:, 1] if A > 1 else order[:, 0], order[:, 0])
+        p_lead = np.bincount(lead, minlength=A) / self.draws
+        p_chal = np.bincount(chal, minlength=A) / self.draws
+        return self.beta * p_lead + (1.0 - self.beta) * p_chal, {"p_best": p_lead}
+
+    def _contrast(self) -> Tuple[Any, Dict[str, Any]]:
+        np = self.np
+        a, b = self._posterior()
+        table = self.contrast_table()
+        live = [c for c in table if c["open"]] or table
+        # Per-call variance summed over the open contrasts each arm is in
+        unit_var = np.zeros(len(self.arms))
+        for c in live:
+            for arm, var in zip(c["_arms"], c["_var"]):
+                unit_var[arm] += var * (a[arm] + b[arm])
+        issued = np.array(self.issued, dtype=float)
+        weight = np.sqrt(unit_var)
+        shortfall = np.zeros(len(self.arms))
+        if weight.sum() > 0:
+            target = weight / weight.sum() * (issued.sum() + self.batch)
+            shortfall = np.maximum(target - issued, 0.0)
+        if shortfall.sum() <= 0:
+            shortfall = (weight > 0).astype(float) if weight.sum() > 0 else np.ones(len(self.arms))
+        return shortfall / shortfall.sum(), {"open_contrasts": sum(c["open"] for c in table)}
+
+    def allocation(self) -> Tuple[Any, Dict[str, Any]]:
+        probs, extra = self._top_two() if self.policy == "top-two" else self._contrast()
+        probs = (1.0 - self.floor) * probs + self.floor / len(self.arms)
+        return probs / probs.sum(), extra
+
+    # ---------------- units ----------------
+
+    def _unit(self, i: int, batch: int, prob: Optional[float]) -> Dict[str, Any]:
+        arm = self.arms[i]
+        n = self.issued[i]
+        self.issued[i] += 1
+        qid = self.q_order[n % len(self.q_order)]
+        rep = n // len(self.q_order)
+        unit = {
+            **arm,
+            "run_id": f"{arm['config_id']}__{qid}__r{rep}",
+            "question_id": qid,
+            "rep": rep,
+            "alloc_batch": batch,
+        }
+        if prob is not None:
+            unit["alloc_prob"] = round(float(prob), 6)
+        return unit
+
+    def _write_log(self, rec: Dict[str, Any]) -> None:
+        if self._log is not None:
+            self._log.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._log.flush()
+
+    def units(self) -> Iterator[Dict[str, Any]]:
+        """Warm-up units, then one adaptive batch at a time until the budget is spent."""
+        total = 0
+        warm = min(self.warmup * len(self.arms), self.budget)
+        self._write_log({
+            "batch": 0,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "policy": "warmup",
+            "calls": warm,
+            "questions_per_config": self.warmup,
+            "configs": [arm["config_id"] for arm in self.arms],
+        })
+        for _ in range(self.warmup):
+            for i in range(len(self.arms)):
+                if total >= self.budget:
+                    return
+                total += 1
+                yield self._unit(i, 0, None)
+
+        while total < self.budget:
+            self.n_batches += 1
+            probs, extra = self.allocation()
+            size = min(self.batch, self.budget - total)
+            draw = self.rng.multinomial(size, probs)
+            a, b = self._posterior()
+            rec: Dict[str, Any] = {
+                "batch": self.n_batches,
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "policy": self.policy,
+                "calls_done": int(self.counts.n_rows),
+                "calls_issued": total,
+                "arms": [
+                    {
+                        "config_id": arm["config_id"],
+                        "n": int(a[i] + b[i] - 2),
+                        "accuracy": round(float((a[i] - 1) / max(a[i] + b[i] - 2, 1)), 4),
+                        "prob": round(float(probs[i]), 6),
+                        "allocated": int(draw[i]),
+                        **({"p_best": round(float(extra["p_best"][i]), 4)} if "p_best" in extra else {}),
+                    }
+                    for i, arm in enumerate(self.arms)
+                ],
+                "contrasts": [{k: v for k, v in c.items() if not k.startswith("_")} for c in self.contrast_table()],
+            }
+            if "open_contrasts" in extra:
+                rec["open_contrasts"] = int(extra["open_contrasts"])
+            self._write_log(rec)
+
+            for i in self.rng.permutation(len(self.arms)):
+                for _ in range(int(draw[i])):
+                    total += 1
+                    yield self._unit(int(i), self.n_batches, probs[i])
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def start_scheduler(args, arms: Sequence[Dict[str, Any]], items: Sequence[Dict[str, Any]], k: int) -> Optional[AdaptiveScheduler]:
+    """AdaptiveScheduler for a runner when --adaptive is given, else None."""
+    if not getattr(args, "adaptive", None):
+        return None
+    log_path = args.adaptive_log or os.path.splitext(args.out_jsonl)[0] + ".alloc.jsonl"
+    budget = args.adaptive_budget if args.adaptive_budget is not None else len(arms) * len(items) * k
+    return AdaptiveScheduler(
+        arms,
+        items,
+        policy=args.adaptive,
+        budget=budget,
+        batch=args.adaptive_batch,
+        warmup=args.adaptive_warmup,
+        floor=args.adaptive_floor,
+        beta=args.adaptive_beta,
+        target_width=args.adaptive_target_width,
+        seed=args.adaptive_seed,
+        log_path=log_path,
+    )
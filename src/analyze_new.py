@@ -7,18 +7,20 @@ from typing import Tuple
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-import statsmodels.formula.api as smf
-import statsmodels.api as sm
+from src.answer_counts import read_per_question
+from src.count_logit import prepare_cells
+from src.profiling import add_profile_args, finish_profile, stage, start_profile
+from src.render import PlotSpec, add_plot_args, pyplot, run_render_stage
+from src.logit_fit import TreatmentTempDesign, fit_models
 
 
 def split_config_id(config_id: str) -> Tuple[str, float]:
-    # expects: T0_temp0.2
+    # expects: T0_temp0.2 (design plans may append _topp0.9 / _max128 / _model-x)
     if isinstance(config_id, str) and "_temp" in config_id:
         t, temp = config_id.split("_temp", 1)
         try:
-            return t, float(temp)
+            return t, float(temp.split("_", 1)[0])
         except ValueError:
             return t, float("nan")
     return str(config_id), float("nan")
@@ -72,13 +74,18 @@ def fit_binomial_glm(df_perq: pd.DataFrame, interaction: bool):
         formula = "prop ~ C(treatment) * temp"
         name = "glm_interaction"
 
-    model = smf.glm(
-        formula=formula,
-        data=df,
-        family=sm.families.Binomial(),
-        freq_weights=df["k_runs"].astype(float),
-    )
-    res = model.fit()
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
+    with stage("design"):  # patsy formula -> design matrices
+        model = smf.glm(
+            formula=formula,
+            data=df,
+            family=sm.families.Binomial(),
+            freq_weights=df["k_runs"].astype(float),
+        )
+    with stage("fit"):
+        res = model.fit()
     return name, res
 
 
@@ -113,6 +120,7 @@ def save_coef_table(res, out_csv: str, out_txt: str) -> None:
 
 def plot_tradeoff(summary_cfg: pd.DataFrame, out_png: str) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
@@ -140,6 +148,7 @@ def plot_tradeoff(summary_cfg: pd.DataFrame, out_png: str) -> None:
 
 def plot_lines_by_temp(summary_cfg: pd.DataFrame, y: str, title: str, out_png: str) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
@@ -156,19 +165,32 @@ def plot_lines_by_temp(summary_cfg: pd.DataFrame, y: str, title: str, out_png: s
     plt.close(fig)
 
 
-def plot_predicted_curves(res, df_perq: pd.DataFrame, out_png: str) -> None:
-    ensure_dir(out_png)
+def prediction_curve_frame(res, df_source: pd.DataFrame, n_points: int = 50) -> pd.DataFrame:
+    """
+    Fitted P(correct) on a dense temp grid per treatment, as a plain frame
+    (so the curve plots can be rendered without the fitted model).
+    """
+    treatments = sorted(df_source["treatment"].astype(str).unique().tolist())
+    temps = np.linspace(df_source["temp"].min(), df_source["temp"].max(), n_points)
+    grid = pd.DataFrame(
+        {
+            "treatment": np.repeat(treatments, len(temps)),
+            "temp": np.tile(temps, len(treatments)),
+        }
+    )
+    grid["predicted_p_correct"] = np.asarray(res.predict(grid))
+    return grid
+
 
-    treatments = sorted(df_perq["treatment"].unique().tolist())
-    temps = np.linspace(df_perq["temp"].min(), df_perq["temp"].max(), 50)
+def plot_predicted_curves(pred_df: pd.DataFrame, out_png: str) -> None:
+    ensure_dir(out_png)
+    plt = pyplot()
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    for t in treatments:
-        grid = pd.DataFrame({"treatment": [t] * len(temps), "temp": temps})
-        pred = res.predict(grid)
-        ax.plot(temps, pred, label=str(t))
+    for t, sub in pred_df.groupby("treatment", sort=True):
+        ax.plot(sub["temp"], sub["predicted_p_correct"], label=str(t))
 
     ax.set_xlabel("Temperature")
     ax.set_ylabel("Predicted P(correct)")
@@ -236,16 +258,21 @@ def fit_logistic_regression(df_runs: pd.DataFrame, interaction: bool):
         formula = "correct ~ C(treatment) * temp"
         name = "logit_interaction"
 
-    model = smf.glm(
-        formula=formula,
-        data=df_runs,
-        family=sm.families.Binomial(),
-    )
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
 
-    res = model.fit(
-        cov_type="cluster",
-        cov_kwds={"groups": df_runs["question_id"]},
-    )
+    with stage("design"):  # patsy formula -> design matrices
+        model = smf.glm(
+            formula=formula,
+            data=df_runs,
+            family=sm.families.Binomial(),
+        )
+
+    with stage("fit"):
+        res = model.fit(
+            cov_type="cluster",
+            cov_kwds={"groups": df_runs["question_id"]},
+        )
     return name, res
 
 
@@ -274,23 +301,18 @@ def save_predicted_probability_table(res, df_source: pd.DataFrame, out_csv: str)
 
 
 def plot_logit_predictions_with_observed(
-    res,
+    pred_df: pd.DataFrame,
     summary_cfg: pd.DataFrame,
-    df_source: pd.DataFrame,
     out_png: str,
 ) -> None:
     ensure_dir(out_png)
-
-    treatments = sorted(df_source["treatment"].astype(str).unique().tolist())
-    temps_dense = np.linspace(df_source["temp"].min(), df_source["temp"].max(), 100)
+    plt = pyplot()
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    for t in treatments:
-        grid = pd.DataFrame({"treatment": [t] * len(temps_dense), "temp": temps_dense})
-        pred = res.predict(grid)
-        ax.plot(temps_dense, pred, label=f"{t} fitted")
+    for t, sub in pred_df.groupby("treatment", sort=True):
+        ax.plot(sub["temp"], sub["predicted_p_correct"], label=f"{t} fitted")
 
         obs = summary_cfg[summary_cfg["treatment"].astype(str) == str(t)].sort_values("temp")
         ax.scatter(obs["temp"], obs["accuracy_mean"])
@@ -334,6 +356,7 @@ def plot_metric_by_treatment_grouped_by_temp(
     Y-axis: metric
     """
     ensure_dir(out_png)
+    plt = pyplot()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
@@ -367,6 +390,7 @@ def plot_metric_by_treatment_grouped_by_temp(
 
 def plot_tradeoff_accuracy_vs_stability(summary_cfg: pd.DataFrame, out_png: str) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
@@ -397,6 +421,7 @@ def plot_heatmap_treatment_temp(
     out_png: str,
 ) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
 
     dfp = summary_cfg.copy()
     dfp["treatment"] = dfp["treatment"].astype(str)
@@ -457,14 +482,30 @@ def save_treatment_only_summary(summary_cfg: pd.DataFrame, out_csv: str) -> None
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--per-question-csv", required=True, help="outputs/per_question.csv from your script")
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results")
     ap.add_argument("--out-dir", default="outputs/glm_analysis")
+    ap.add_argument(
+        "--engine",
+        choices=["numpy", "statsmodels"],
+        default="numpy",
+        help="numpy: IRLS on count cells (src.logit_fit). "
+        "statsmodels: smf.glm formula fits, logit on the expanded run-level frame (slow).",
+    )
+    ap.add_argument(
+        "--write-run-level-csv",
+        action="store_true",
+        help="Also write run_level_expanded.csv (implied by --engine statsmodels).",
+    )
+    add_plot_args(ap)
+    add_profile_args(ap)
     args = ap.parse_args()
 
     out_dir = args.out_dir
     os.makedirs(out_dir, exist_ok=True)
+    prof = start_profile(args, os.path.join(out_dir, "profile"))
 
-    df = pd.read_csv(args.per_question_csv)
+    with stage("read"):
+        df = read_per_question(args.per_question_csv)
 
     # Parse treatment/temp from config_id
     tt = df["config_id"].apply(lambda x: split_config_id(str(x)))
@@ -483,7 +524,8 @@ def main() -> None:
     )
 
     # Build binomial counts
-    df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
+    if "successes" not in df.columns:  # exact when read from the answer-count .npz
+        df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
     df["successes"] = df["successes"].clip(lower=0, upper=df["k_runs"].astype(int))
     df = df.dropna(subset=["temp", "k_runs", "successes"])
 
@@ -492,50 +534,49 @@ def main() -> None:
     summary_path = os.path.join(out_dir, "summary_by_config.csv")
     summary_cfg.to_csv(summary_path, index=False)
 
-    # Fit GLMs
-    name_a, res_a = fit_binomial_glm(df, interaction=False)
+    # Fit GLMs (one shared treatment x temp design for the numpy engine)
+    if args.engine == "statsmodels":
+        with stage("fit_glm"):
+            name_a, res_a = fit_binomial_glm(df, interaction=False)
+            name_b, res_b = fit_binomial_glm(df, interaction=True)
+    else:
+        cells = prepare_cells(df)
+        with stage("design"):
+            design = TreatmentTempDesign(cells["treatment"], cells["temp"])
+        with stage("fit_glm"):
+            (name_a, res_a), (name_b, res_b) = fit_models(
+                cells, prefix="glm", cov_type="nonrobust", design=design
+            ).items()
+
     save_coef_table(
         res_a,
         os.path.join(out_dir, f"{name_a}_coef.csv"),
         os.path.join(out_dir, f"{name_a}_summary.txt"),
     )
 
-    name_b, res_b = fit_binomial_glm(df, interaction=True)
     save_coef_table(
         res_b,
         os.path.join(out_dir, f"{name_b}_coef.csv"),
         os.path.join(out_dir, f"{name_b}_summary.txt"),
     )
 
-    # Original plots
-    plot_tradeoff(summary_cfg, os.path.join(out_dir, "tradeoff_accuracy_vs_entropy.png"))
-    plot_lines_by_temp(
-        summary_cfg,
-        "accuracy_mean",
-        "Accuracy vs Temperature",
-        os.path.join(out_dir, "accuracy_vs_temp.png"),
-    )
-    plot_lines_by_temp(
-        summary_cfg,
-        "strict_stability_rate",
-        "Strict Stability vs Temperature",
-        os.path.join(out_dir, "stability_vs_temp.png"),
-    )
-    plot_lines_by_temp(
-        summary_cfg,
-        "entropy_mean_bits",
-        "Entropy vs Temperature",
-        os.path.join(out_dir, "entropy_vs_temp.png"),
-    )
-
-    plot_predicted_curves(res_a, df, os.path.join(out_dir, "predicted_curves_additive.png"))
-    plot_predicted_curves(res_b, df, os.path.join(out_dir, "predicted_curves_interaction.png"))
-
-    # Added: logistic regression outputs
-    df_runs = expand_to_run_level(df)
-    df_runs.to_csv(os.path.join(out_dir, "run_level_expanded.csv"), index=False)
+    # Added: logistic regression outputs (fitted on binomial cells unless --engine statsmodels)
+    if args.engine == "statsmodels" or args.write_run_level_csv:
+        with stage("expand_runs"):
+            df_runs = expand_to_run_level(df)
+            df_runs.to_csv(os.path.join(out_dir, "run_level_expanded.csv"), index=False)
+    if args.engine == "statsmodels":
+        logit_source = df_runs
+        with stage("fit_logit"):
+            logit_name_a, logit_res_a = fit_logistic_regression(df_runs, interaction=False)
+            logit_name_b, logit_res_b = fit_logistic_regression(df_runs, interaction=True)
+    else:
+        logit_source = cells
+        with stage("fit_logit"):
+            (logit_name_a, logit_res_a), (logit_name_b, logit_res_b) = fit_models(
+                cells, prefix="logit", cov_type="cluster", design=design
+            ).items()
 
-    logit_name_a, logit_res_a = fit_logistic_regression(df_runs, interaction=False)
     save_coef_table(
         logit_res_a,
         os.path.join(out_dir, f"{logit_name_a}_coef.csv"),
@@ -547,17 +588,10 @@ def main() -> None:
     )
     save_predicted_probability_table(
         logit_res_a,
-        df_runs,
+        logit_source,
         os.path.join(out_dir, f"{logit_name_a}_predicted_probs.csv"),
     )
-    plot_logit_predictions_with_observed(
-        logit_res_a,
-        summary_cfg,
-        df_runs,
-        os.path.join(out_dir, f"{logit_name_a}_predicted_plot.png"),
-    )
 
-    logit_name_b, logit_res_b = fit_logistic_regression(df_runs, interaction=True)
     save_coef_table(
         logit_res_b,
         os.path.join(out_dir, f"{logit_name_b}_coef.csv"),
@@ -569,72 +603,89 @@ def main() -> None:
     )
     save_predicted_probability_table(
         logit_res_b,
-        df_runs,
+        logit_source,
         os.path.join(out_dir, f"{logit_name_b}_predicted_probs.csv"),
     )
-    plot_logit_predictions_with_observed(
-        logit_res_b,
-        summary_cfg,
-        df_runs,
-        os.path.join(out_dir, f"{logit_name_b}_predicted_plot.png"),
-    )
-
-    # Added: treatment-focused plots
-    plot_metric_by_treatment_grouped_by_temp(
-        summary_cfg,
-        metric_col="accuracy_mean",
-        ylabel="Mean Accuracy",
-        title="Accuracy by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "accuracy_by_treatment_grouped_by_temp.png"),
-    )
-
-    plot_metric_by_treatment_grouped_by_temp(
-        summary_cfg,
-        metric_col="strict_stability_rate",
-        ylabel="Strict Stability Rate",
-        title="Strict Stability by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "stability_by_treatment_grouped_by_temp.png"),
-    )
-
-    plot_metric_by_treatment_grouped_by_temp(
-        summary_cfg,
-        metric_col="entropy_mean_bits",
-        ylabel="Mean Answer Entropy (bits)",
-        title="Entropy by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "entropy_by_treatment_grouped_by_temp.png"),
-    )
-
-    plot_tradeoff_accuracy_vs_stability(
-        summary_cfg,
-        out_png=os.path.join(out_dir, "tradeoff_accuracy_vs_stability.png"),
-    )
-
-    plot_heatmap_treatment_temp(
-        summary_cfg,
-        value_col="accuracy_mean",
-        title="Heatmap: Accuracy (treatment x temperature)",
-        out_png=os.path.join(out_dir, "heatmap_accuracy.png"),
-    )
-    plot_heatmap_treatment_temp(
-        summary_cfg,
-        value_col="strict_stability_rate",
-        title="Heatmap: Strict Stability (treatment x temperature)",
-        out_png=os.path.join(out_dir, "heatmap_stability.png"),
-    )
-    plot_heatmap_treatment_temp(
-        summary_cfg,
-        value_col="entropy_mean_bits",
-        title="Heatmap: Entropy (treatment x temperature)",
-        out_png=os.path.join(out_dir, "heatmap_entropy.png"),
-    )
 
     save_treatment_only_summary(
         summary_cfg,
         out_csv=os.path.join(out_dir, "summary_by_treatment_only.csv"),
     )
 
+    # Figures: rendered in worker processes (matplotlib is only imported there).
+    # Fitted models are reduced to prediction frames so specs stay plain data.
+    M = "src.analyze_new"
+    specs = [
+        # Original plots
+        PlotSpec("tradeoff_entropy", "tradeoff", M, "plot_tradeoff", {
+            "summary_cfg": summary_cfg,
+            "out_png": os.path.join(out_dir, "tradeoff_accuracy_vs_entropy.png"),
+        }),
+    ]
+    for key, col, title in [
+        ("accuracy", "accuracy_mean", "Accuracy vs Temperature"),
+        ("stability", "strict_stability_rate", "Strict Stability vs Temperature"),
+        ("entropy", "entropy_mean_bits", "Entropy vs Temperature"),
+    ]:
+        specs.append(PlotSpec(f"lines_{key}", "lines", M, "plot_lines_by_temp", {
+            "summary_cfg": summary_cfg,
+            "y": col,
+            "title": title,
+            "out_png": os.path.join(out_dir, f"{key}_vs_temp.png"),
+        }))
+    for res, label in [(res_a, "additive"), (res_b, "interaction")]:
+        specs.append(PlotSpec(f"predicted_{label}", "predicted", M, "plot_predicted_curves", {
+            "pred_df": prediction_curve_frame(res, df, n_points=50),
+            "out_png": os.path.join(out_dir, f"predicted_curves_{label}.png"),
+        }))
+
+    # Added: logistic regression fitted vs observed
+    for res, name in [(logit_res_a, logit_name_a), (logit_res_b, logit_name_b)]:
+        specs.append(PlotSpec(f"{name}_predicted", "predicted", M, "plot_logit_predictions_with_observed", {
+            "pred_df": prediction_curve_frame(res, logit_source, n_points=100),
+            "summary_cfg": summary_cfg,
+            "out_png": os.path.join(out_dir, f"{name}_predicted_plot.png"),
+        }))
+
+    # Added: treatment-focused plots
+    for key, col, ylabel, title in [
+        ("accuracy", "accuracy_mean", "Mean Accuracy", "Accuracy by Treatment (grouped by temperature)"),
+        ("stability", "strict_stability_rate", "Strict Stability Rate",
+         "Strict Stability by Treatment (grouped by temperature)"),
+        ("entropy", "entropy_mean_bits", "Mean Answer Entropy (bits)",
+         "Entropy by Treatment (grouped by temperature)"),
+    ]:
+        specs.append(PlotSpec(f"by_treatment_{key}", "by_treatment", M, "plot_metric_by_treatment_grouped_by_temp", {
+            "summary_cfg": summary_cfg,
+            "metric_col": col,
+            "ylabel": ylabel,
+            "title": title,
+            "out_png": os.path.join(out_dir, f"{key}_by_treatment_grouped_by_temp.png"),
+        }))
+
+    specs.append(PlotSpec("tradeoff_stability", "tradeoff", M, "plot_tradeoff_accuracy_vs_stability", {
+        "summary_cfg": summary_cfg,
+        "out_png": os.path.join(out_dir, "tradeoff_accuracy_vs_stability.png"),
+    }))
+
+    for key, col, label in [
+        ("accuracy", "accuracy_mean", "Accuracy"),
+        ("stability", "strict_stability_rate", "Strict Stability"),
+        ("entropy", "entropy_mean_bits", "Entropy"),
+    ]:
+        specs.append(PlotSpec(f"heatmap_{key}", "heatmap", M, "plot_heatmap_treatment_temp", {
+            "summary_cfg": summary_cfg,
+            "value_col": col,
+            "title": f"Heatmap: {label} (treatment x temperature)",
+            "out_png": os.path.join(out_dir, f"heatmap_{key}.png"),
+        }))
+
+    with stage("render"):
+        run_render_stage(specs, args)
+
     print("Wrote outputs to:", out_dir)
     print("Summary:", summary_path)
+    finish_profile(prof)
 
 
 if __name__ == "__main__":
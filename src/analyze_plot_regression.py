@@ -2,22 +2,28 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import statsmodels.formula.api as smf
-import statsmodels.api as sm
+
+from src.answer_counts import read_per_question
+from src.count_logit import prepare_cells
+from src.pareto import pareto_mask, save_frontier_csv
+from src.profiling import add_profile_args, finish_profile, stage, start_profile
+from src.render import PlotSpec, add_plot_args, pyplot, run_render_stage
+from src.logit_fit import MODEL_TYPES, TreatmentTempDesign, fit_models
+from src.design import load_plan
 
 
 def split_config_id(config_id: str) -> Tuple[str, float]:
-    # expects: T0_temp0.2
+    # expects: T0_temp0.2 (design plans may append _topp0.9 / _max128 / _model-x)
     if isinstance(config_id, str) and "_temp" in config_id:
         t, temp = config_id.split("_temp", 1)
         try:
-            return t, float(temp)
+            return t, float(temp.split("_", 1)[0])
         except ValueError:
             return t, float("nan")
     return str(config_id), float("nan")
@@ -111,13 +117,18 @@ def fit_binomial_glm(df_perq: pd.DataFrame, model_type: str):
     else:
         raise ValueError(f"Unknown model_type: {model_type}")
 
-    model = smf.glm(
-        formula=formula,
-        data=df,
-        family=sm.families.Binomial(),
-        freq_weights=df["k_runs"].astype(float),
-    )
-    res = model.fit()
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
+    with stage("design"):  # patsy formula -> design matrices
+        model = smf.glm(
+            formula=formula,
+            data=df,
+            family=sm.families.Binomial(),
+            freq_weights=df["k_runs"].astype(float),
+        )
+    with stage("fit"):
+        res = model.fit()
     return name, res
 
 
@@ -197,15 +208,20 @@ def fit_logistic_regression(df_runs: pd.DataFrame, model_type: str):
     else:
         raise ValueError(f"Unknown model_type: {model_type}")
 
-    model = smf.glm(
-        formula=formula,
-        data=df_runs,
-        family=sm.families.Binomial(),
-    )
-    res = model.fit(
-        cov_type="cluster",
-        cov_kwds={"groups": df_runs["question_id"]},
-    )
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
+    with stage("design"):  # patsy formula -> design matrices
+        model = smf.glm(
+            formula=formula,
+            data=df_runs,
+            family=sm.families.Binomial(),
+        )
+    with stage("fit"):
+        res = model.fit(
+            cov_type="cluster",
+            cov_kwds={"groups": df_runs["question_id"]},
+        )
     return name, res
 
 
@@ -242,43 +258,15 @@ def save_predicted_probability_table(
 # ============================================================
 
 def _temp_color_map(temps):
+    plt = pyplot()
     temps = sorted([float(t) for t in temps])
     cmap = plt.get_cmap("viridis")
     return {t: cmap(i / max(len(temps) - 1, 1)) for i, t in enumerate(temps)}
 
 
-def _pareto_mask_max2(x: np.ndarray, y: np.ndarray) -> np.ndarray:
-    n = len(x)
-    keep = np.ones(n, dtype=bool)
-    for i in range(n):
-        if not keep[i]:
-            continue
-        dominated = (x >= x[i]) & (y >= y[i]) & ((x > x[i]) | (y > y[i]))
-        dominated[i] = False
-        if dominated.any():
-            keep[i] = False
-    return keep
-
-
-def _pareto_mask_entropy(x_entropy: np.ndarray, y_acc: np.ndarray) -> np.ndarray:
-    n = len(x_entropy)
-    keep = np.ones(n, dtype=bool)
-    for i in range(n):
-        if not keep[i]:
-            continue
-        dominated = (
-            (x_entropy <= x_entropy[i])
-            & (y_acc >= y_acc[i])
-            & ((x_entropy < x_entropy[i]) | (y_acc > y_acc[i]))
-        )
-        dominated[i] = False
-        if dominated.any():
-            keep[i] = False
-    return keep
-
-
 def plot_tradeoff_accuracy_vs_entropy(summary_cfg: pd.DataFrame, out_png: str) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
 
     dfp = summary_cfg.copy()
     dfp["temp"] = dfp["temp"].astype(float)
@@ -290,7 +278,7 @@ def plot_tradeoff_accuracy_vs_entropy(summary_cfg: pd.DataFrame, out_png: str) -
 
     x = dfp["entropy_mean_bits"].to_numpy()
     y = dfp["accuracy_mean"].to_numpy()
-    best_mask = _pareto_mask_entropy(x_entropy=x, y_acc=y)
+    best_mask = pareto_mask(np.column_stack([x, y]), maximize=[False, True])
 
     fig = plt.figure(figsize=(7.2, 5.4))
     ax = fig.add_subplot(111)
@@ -345,6 +333,7 @@ def plot_tradeoff_accuracy_vs_entropy(summary_cfg: pd.DataFrame, out_png: str) -
 
 def plot_tradeoff_accuracy_vs_stability(summary_cfg: pd.DataFrame, out_png: str) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
 
     dfp = summary_cfg.copy()
     dfp["temp"] = dfp["temp"].astype(float)
@@ -356,7 +345,7 @@ def plot_tradeoff_accuracy_vs_stability(summary_cfg: pd.DataFrame, out_png: str)
 
     x = dfp["strict_stability_rate"].to_numpy()
     y = dfp["accuracy_mean"].to_numpy()
-    best_mask = _pareto_mask_max2(x=x, y=y)
+    best_mask = pareto_mask(np.column_stack([x, y]), maximize=[True, True])
 
     fig = plt.figure(figsize=(7.2, 5.4))
     ax = fig.add_subplot(111)
@@ -442,6 +431,7 @@ def plot_metric_by_treatment_grouped_by_temp_bar(
     Uses a colorful viridis-like palette similar to the screenshot style.
     """
     ensure_dir(out_png)
+    plt = pyplot()
 
     dfp = bar_df.copy()
     dfp["treatment"] = dfp["treatment"].astype(str)
@@ -525,6 +515,7 @@ def plot_forest_treatment_or_from_coef_csv(
     title: str,
 ) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
 
     if not os.path.exists(coef_csv):
         return
@@ -581,6 +572,7 @@ def plot_forest_temp_slopes_from_interaction_coef_csv(
     title: str = "Temperature sensitivity by treatment (interaction logit; approx. CI)",
 ) -> None:
     ensure_dir(out_png)
+    plt = pyplot()
 
     if not os.path.exists(interaction_coef_csv):
         return
@@ -641,16 +633,71 @@ def plot_forest_temp_slopes_from_interaction_coef_csv(
 # Main
 # ============================================================
 
+def check_design(cells: pd.DataFrame, plan_path: str, out_json: str) -> List[str]:
+    """
+    Model types whose coefficients are all estimable from the observed
+    (treatment, temp) cells. Writes the plan's design_info next to the
+    observed rank so a fractional / D-optimal sweep that lost points
+    (failed calls, a partial run) is caught before fitting.
+    """
+    plan = load_plan(plan_path)
+    design = TreatmentTempDesign(cells["treatment"], cells["temp"])
+    observed = {}
+    ok: List[str] = []
+    for m in MODEL_TYPES:
+        X = design.exog(m)
+        rank = int(np.linalg.matrix_rank(X)) if len(X) else 0
+        observed[m] = {"n_params": X.shape[1], "rank": rank, "estimable": rank == X.shape[1]}
+        if rank == X.shape[1]:
+            ok.append(m)
+        else:
+            print(f"[design] {m} model not estimable from the observed cells (rank {rank} / {X.shape[1]}); skipped")
+
+    with open(out_json, "w", encoding="utf-8") as f:
+        json.dump({
+            "plan": plan_path,
+            "method": plan.get("method"),
+            "planned_points": len(plan["points"]),
+            "observed_configs": int(pd.unique(cells["config_id"]).size) if "config_id" in cells else None,
+            "plan_design_info": plan.get("design_info"),
+            "observed": observed,
+            "fitted_model_types": ok,
+        }, f, indent=2)
+    return ok
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--per-question-csv", required=True, help="per-question CSV (question x config)")
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results")
     ap.add_argument("--out-dir", default="outputs/glm_analysis_pruned")
+    ap.add_argument(
+        "--engine",
+        choices=["numpy", "statsmodels"],
+        default="numpy",
+        help="numpy: IRLS on count cells (src.logit_fit). "
+        "statsmodels: smf.glm formula fits, logit on the expanded run-level frame (slow).",
+    )
+    ap.add_argument(
+        "--write-run-level-csv",
+        action="store_true",
+        help="Also write run_level_expanded.csv (implied by --engine statsmodels).",
+    )
+    ap.add_argument(
+        "--design",
+        default=None,
+        help="Design plan JSON the sweep was run from (src.design): check which models the observed "
+        "cells can estimate, fit only those, and write design_check.json.",
+    )
+    add_plot_args(ap)
+    add_profile_args(ap)
     args = ap.parse_args()
 
     out_dir = args.out_dir
     os.makedirs(out_dir, exist_ok=True)
+    prof = start_profile(args, os.path.join(out_dir, "profile"))
 
-    df = pd.read_csv(args.per_question_csv)
+    with stage("read"):
+        df = read_per_question(args.per_question_csv)
 
     # Parse treatment/temp from config_id
     tt = df["config_id"].apply(lambda x: split_config_id(str(x)))
@@ -670,7 +717,8 @@ def main() -> None:
     )
 
     # Build binomial counts per question x config
-    df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
+    if "successes" not in df.columns:  # exact when read from the answer-count .npz
+        df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
     df["successes"] = df["successes"].clip(lower=0, upper=df["k_runs"].astype(int))
     df = df.dropna(subset=["temp", "k_runs", "successes"])
 
@@ -678,6 +726,7 @@ def main() -> None:
     summary_cfg = summarize_config(df)
     summary_path = os.path.join(out_dir, "summary_by_config.csv")
     summary_cfg.to_csv(summary_path, index=False)
+    save_frontier_csv(summary_cfg, os.path.join(out_dir, "pareto_frontier.csv"))
 
     # Group summaries for bar charts with error bars
     acc_bar = summarize_metric_for_barplot(
@@ -696,92 +745,122 @@ def main() -> None:
         out_mean_name="strict_stability_rate",
     )
 
-    # GLM models
-    for model_type in ["additive", "interaction"]:
-        name, res = fit_binomial_glm(df, model_type=model_type)
-        save_coef_table(
-            res,
-            os.path.join(out_dir, f"{name}_coef.csv"),
-            os.path.join(out_dir, f"{name}_summary.txt"),
-        )
-
-    # Run-level logistic models
-    df_runs = expand_to_run_level(df)
-    df_runs.to_csv(os.path.join(out_dir, "run_level_expanded.csv"), index=False)
-
-    for model_type in ["additive", "interaction"]:
-        name, res = fit_logistic_regression(df_runs, model_type=model_type)
-        save_coef_table(
-            res,
-            os.path.join(out_dir, f"{name}_coef.csv"),
-            os.path.join(out_dir, f"{name}_summary.txt"),
-        )
-        save_logit_test_table(
-            res,
-            os.path.join(out_dir, f"{name}_wald_tests.csv"),
-        )
-        save_predicted_probability_table(
-            res,
-            df_runs,
-            os.path.join(out_dir, f"{name}_predicted_probs.csv"),
-        )
-
-    # Tradeoff plots
-    plot_tradeoff_accuracy_vs_entropy(
-        summary_cfg,
-        os.path.join(out_dir, "tradeoff_accuracy_vs_entropy.png"),
-    )
-    plot_tradeoff_accuracy_vs_stability(
-        summary_cfg,
-        os.path.join(out_dir, "tradeoff_accuracy_vs_stability.png"),
-    )
+    # GLM models (model-based SE) and run-level logistic models (question-clustered SE)
+    if args.engine == "statsmodels" or args.write_run_level_csv:
+        with stage("expand_runs"):
+            df_runs = expand_to_run_level(df)
+            df_runs.to_csv(os.path.join(out_dir, "run_level_expanded.csv"), index=False)
+
+    model_types = list(MODEL_TYPES)
+    if args.design:
+        model_types = check_design(df, args.design, os.path.join(out_dir, "design_check.json"))
+
+    if args.engine == "statsmodels":
+        with stage("fit_glm"):
+            glm_fits = dict(fit_binomial_glm(df, model_type=m) for m in model_types)
+        with stage("fit_logit"):
+            logit_fits = dict(fit_logistic_regression(df_runs, model_type=m) for m in model_types)
+        logit_source = df_runs
+    else:
+        cells = prepare_cells(df)
+        with stage("design"):
+            design = TreatmentTempDesign(cells["treatment"], cells["temp"])
+        with stage("fit_glm"):
+            glm_fits = fit_models(
+                cells, model_types, prefix="glm", cov_type="nonrobust", design=design, response="prop"
+            )
+        with stage("fit_logit"):
+            logit_fits = fit_models(cells, model_types, prefix="logit", cov_type="cluster", design=design)
+        logit_source = cells
+
+    with stage("save_tables"):
+        for name, res in glm_fits.items():
+            save_coef_table(
+                res,
+                os.path.join(out_dir, f"{name}_coef.csv"),
+                os.path.join(out_dir, f"{name}_summary.txt"),
+            )
 
-    # Bar charts with colorful palette
-    # Change err_col from "se" to "ci95" if you want 95% CI instead.
-    plot_metric_by_treatment_grouped_by_temp_bar(
-        acc_bar,
-        mean_col="accuracy_mean",
-        err_col="se",
-        ylabel="Mean Accuracy",
-        title="Accuracy by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "accuracy_by_treatment_grouped_by_temp_BAR.png"),
-    )
-    plot_metric_by_treatment_grouped_by_temp_bar(
-        ent_bar,
-        mean_col="entropy_mean_bits",
-        err_col="se",
-        ylabel="Mean Answer Entropy (bits)",
-        title="Entropy by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "entropy_by_treatment_grouped_by_temp_BAR.png"),
-    )
-    plot_metric_by_treatment_grouped_by_temp_bar(
-        stab_bar,
-        mean_col="strict_stability_rate",
-        err_col="se",
-        ylabel="Strict Stability Rate",
-        title="Strict Stability by Treatment (grouped by temperature)",
-        out_png=os.path.join(out_dir, "stability_by_treatment_grouped_by_temp_BAR.png"),
-    )
+        for name, res in logit_fits.items():
+            save_coef_table(
+                res,
+                os.path.join(out_dir, f"{name}_coef.csv"),
+                os.path.join(out_dir, f"{name}_summary.txt"),
+            )
+            save_logit_test_table(
+                res,
+                os.path.join(out_dir, f"{name}_wald_tests.csv"),
+            )
+            save_predicted_probability_table(
+                res,
+                logit_source,
+                os.path.join(out_dir, f"{name}_predicted_probs.csv"),
+            )
 
-    # Forest plots
-    plot_forest_treatment_or_from_coef_csv(
-        coef_csv=os.path.join(out_dir, "logit_additive_coef.csv"),
-        out_png=os.path.join(out_dir, "forest_logit_additive_treatment_or.png"),
-        title="Treatment effects on correctness (logit additive; clustered SE)",
-    )
-    plot_forest_treatment_or_from_coef_csv(
-        coef_csv=os.path.join(out_dir, "logit_interaction_coef.csv"),
-        out_png=os.path.join(out_dir, "forest_logit_interaction_treatment_or.png"),
-        title="Treatment effects on correctness (logit interaction; clustered SE)",
-    )
-    plot_forest_temp_slopes_from_interaction_coef_csv(
-        interaction_coef_csv=os.path.join(out_dir, "logit_interaction_coef.csv"),
-        out_png=os.path.join(out_dir, "forest_logit_interaction_temp_slopes.png"),
-        title="Temperature sensitivity by treatment (interaction logit; approx. CI)",
-    )
+    # Figures: rendered in worker processes (matplotlib is only imported there)
+    M = "src.analyze_plot_regression"
+    specs = [
+        PlotSpec("tradeoff_entropy", "tradeoff", M, "plot_tradeoff_accuracy_vs_entropy", {
+            "summary_cfg": summary_cfg,
+            "out_png": os.path.join(out_dir, "tradeoff_accuracy_vs_entropy.png"),
+        }),
+        PlotSpec("tradeoff_stability", "tradeoff", M, "plot_tradeoff_accuracy_vs_stability", {
+            "summary_cfg": summary_cfg,
+            "out_png": os.path.join(out_dir, "tradeoff_accuracy_vs_stability.png"),
+        }),
+        # Bar charts with colorful palette
+        # Change err_col from "se" to "ci95" if you want 95% CI instead.
+        PlotSpec("bar_accuracy", "bars", M, "plot_metric_by_treatment_grouped_by_temp_bar", {
+            "bar_df": acc_bar,
+            "mean_col": "accuracy_mean",
+            "err_col": "se",
+            "ylabel": "Mean Accuracy",
+            "title": "Accuracy by Treatment (grouped by temperature)",
+            "out_png": os.path.join(out_dir, "accuracy_by_treatment_grouped_by_temp_BAR.png"),
+        }),
+        PlotSpec("bar_entropy", "bars", M, "plot_metric_by_treatment_grouped_by_temp_bar", {
+            "bar_df": ent_bar,
+            "mean_col": "entropy_mean_bits",
+            "err_col": "se",
+            "ylabel": "Mean Answer Entropy (bits)",
+            "title": "Entropy by Treatment (grouped by temperature)",
+            "out_png": os.path.join(out_dir, "entropy_by_treatment_grouped_by_temp_BAR.png"),
+        }),
+        PlotSpec("bar_stability", "bars", M, "plot_metric_by_treatment_grouped_by_temp_bar", {
+            "bar_df": stab_bar,
+            "mean_col": "strict_stability_rate",
+            "err_col": "se",
+            "ylabel": "Strict Stability Rate",
+            "title": "Strict Stability by Treatment (grouped by temperature)",
+            "out_png": os.path.join(out_dir, "stability_by_treatment_grouped_by_temp_BAR.png"),
+        }),
+        # Forest plots (read the coef CSVs written above)
+        PlotSpec("forest_additive", "forest", M, "plot_forest_treatment_or_from_coef_csv", {
+            "coef_csv": os.path.join(out_dir, "logit_additive_coef.csv"),
+            "out_png": os.path.join(out_dir, "forest_logit_additive_treatment_or.png"),
+            "title": "Treatment effects on correctness (logit additive; clustered SE)",
+        }),
+        PlotSpec("forest_interaction", "forest", M, "plot_forest_treatment_or_from_coef_csv", {
+            "coef_csv": os.path.join(out_dir, "logit_interaction_coef.csv"),
+            "out_png": os.path.join(out_dir, "forest_logit_interaction_treatment_or.png"),
+            "title": "Treatment effects on correctness (logit interaction; clustered SE)",
+        }),
+        PlotSpec("forest_temp_slopes", "forest", M, "plot_forest_temp_slopes_from_interaction_coef_csv", {
+            "interaction_coef_csv": os.path.join(out_dir, "logit_interaction_coef.csv"),
+            "out_png": os.path.join(out_dir, "forest_logit_interaction_temp_slopes.png"),
+            "title": "Temperature sensitivity by treatment (interaction logit; approx. CI)",
+        }),
+    ]
+    if "interaction" not in model_types:
+        specs = [s for s in specs if s.key not in ("forest_interaction", "forest_temp_slopes")]
+    if "additive" not in model_types:
+        specs = [s for s in specs if s.key != "forest_additive"]
+    with stage("render"):
+        run_render_stage(specs, args)
 
     print("Wrote outputs to:", out_dir)
     print("Summary:", summary_path)
+    finish_profile(prof)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,14 @@
 from __future__ import annotations
 import argparse
 import json
-import math
-from collections import defaultdict, Counter
-from typing import Dict, Any, List, Tuple
+import os
+import time
+from typing import Dict, Any, List
 import csv
 
+from src.answer_counts import AnswerCounts, RunningAnswerCounts, counts_path_for
+from src.profiling import add_profile_args, finish_profile, stage, start_profile
+
 def load_jsonl(path: str) -> List[Dict[str, Any]]:
     rows = []
     with open(path, "r", encoding="utf-8") as f:
@@ -15,113 +18,162 @@ def load_jsonl(path: str) -> List[Dict[str, Any]]:
                 rows.append(json.loads(line))
     return rows
 
-def entropy_from_counts(counts: Counter) -> float:
-    total = sum(counts.values())
-    if total <= 0:
-        return 0.0
-    h = 0.0
-    for c in counts.values():
-        if c <= 0:
-            continue
-        p = c / total
-        h -= p * math.log(p + 1e-12, 2)
-    return h
+def write_outputs(counts: AnswerCounts, args, quiet: bool = False) -> None:
+    perq = counts.per_question_records()
+    summary = counts.summary_records()
+
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(args.out_summary_csv) or ".", exist_ok=True)
+    os.makedirs(os.path.dirname(args.out_per_question_csv) or ".", exist_ok=True)
+
+    # Written to a temp file and renamed, so readers never see a half-written CSV in --follow mode
+    with stage("write_csv"):
+        for path, recs in [(args.out_per_question_csv, perq), (args.out_summary_csv, summary)]:
+            with open(path + ".tmp", "w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=list(recs[0].keys()))
+                w.writeheader()
+                w.writerows(recs)
+            os.replace(path + ".tmp", path)
+
+    if not quiet:
+        print(f"Wrote: {args.out_summary_csv}")
+        print(f"Wrote: {args.out_per_question_csv}")
+
+    counts_npz = args.out_counts_npz or counts_path_for(args.out_per_question_csv)
+    if counts_npz.lower() != "none":
+        with stage("write_npz"):
+            counts.save(counts_npz)
+        if not quiet:
+            print(f"Wrote: {counts_npz}")
+
+# ============================================================
+# --follow: tail a run file that is still being written
+# ============================================================
+#
+# Complete lines are folded into RunningAnswerCounts as they appear (a
+# trailing partial line waits for its newline), so each poll costs O(new
+# rows). Every --refresh-sec the CSVs / .npz are rewritten from the running
+# counts (identical to a batch run over the rows so far) and a one-line live
+# summary is printed. Following stops when the runner's status file
+# (<in-jsonl>.status.json, see src.progress) says done / aborted and the file
+# is drained, after --idle-exit-sec without growth, or on Ctrl-C; the outputs
+# are always rewritten once more on the way out. A file that shrinks (a new
+# sweep overwrote it) restarts the counts.
+
+def _runner_state(status_path: str) -> str:
+    try:
+        with open(status_path, "r", encoding="utf-8") as f:
+            return str(json.load(f).get("state", ""))
+    except (OSError, ValueError):
+        return ""
+
+def follow(args) -> None:
+    status_path = args.status_json or os.path.splitext(args.in_jsonl)[0] + ".status.json"
+    running = RunningAnswerCounts()
+    pos, partial = 0, b""
+    last_growth = time.time()
+    last_refresh = 0.0
+    rows_at_refresh = -1
+
+    def refresh(write: bool = True) -> None:
+        nonlocal last_refresh, rows_at_refresh
+        last_refresh = time.time()
+        if running.n_rows == rows_at_refresh or running.n_rows == 0:
+            return
+        if write:
+            write_outputs(running.to_counts(), args, quiet=True)
+        recs = running.config_records()
+        best = max(recs, key=lambda r: r["accuracy"])
+        print(
+            f"[follow {time.strftime('%H:%M:%S')}] {running.n_rows} rows (+{running.n_rows - max(rows_at_refresh, 0)}), "
+            f"{len(running.cells)} cells, {len(recs)} configs; accuracy "
+            f"{min(r['accuracy'] for r in recs):.3f}-{best['accuracy']:.3f} (best {best['config_id']}, "
+            f"stability {best['strict_stability']:.3f}, entropy {abs(best['avg_entropy_bits']):.3f})",
+            flush=True,
+        )
+        rows_at_refresh = running.n_rows
+
+    print(f"Following {args.in_jsonl} (refresh every {args.refresh_sec:g}s; Ctrl-C to stop)")
+    try:
+        while True:
+            size = os.path.getsize(args.in_jsonl) if os.path.exists(args.in_jsonl) else 0
+            if size < pos:
+                print(f"[follow] {args.in_jsonl} shrank; restarting counts")
+                running, pos, partial, rows_at_refresh = RunningAnswerCounts(), 0, b"", -1
+            if size > pos:
+                with open(args.in_jsonl, "rb") as f:
+                    f.seek(pos)
+                    data = f.read(size - pos)
+                pos += len(data)
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                with stage("ingest"):
+                    for line in lines:
+                        if line.strip():
+                            running.add(json.loads(line))
+                last_growth = time.time()
+            elif _runner_state(status_path) in ("done", "aborted", "stopped"):
+                break
+            elif args.idle_exit_sec > 0 and time.time() - last_growth >= args.idle_exit_sec:
+                break
+
+            if time.time() - last_refresh >= args.refresh_sec:
+                refresh()
+            time.sleep(args.poll_sec)
+    except KeyboardInterrupt:
+        pass
+
+    if partial.strip():
+        try:
+            running.add(json.loads(partial))
+        except ValueError:
+            pass  # an unterminated line the runner never finished
+    if running.n_rows == 0:
+        raise ValueError("No rows found in input JSONL.")
+    refresh(write=False)
+    write_outputs(running.to_counts(), args)
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in-jsonl", required=True)
     ap.add_argument("--out-summary-csv", default="outputs/summary.csv")
     ap.add_argument("--out-per-question-csv", default="outputs/per_question.csv")
+    ap.add_argument(
+        "--out-counts-npz",
+        default=None,
+        help="Answer-count tensor (default: <per-question csv>_counts.npz; 'none' to skip).",
+    )
+    ap.add_argument("--follow", action="store_true", help="Tail a run file that is still growing and keep the outputs current.")
+    ap.add_argument("--refresh-sec", type=float, default=30.0, help="--follow: seconds between output rewrites.")
+    ap.add_argument("--poll-sec", type=float, default=1.0, help="--follow: seconds between file checks.")
+    ap.add_argument("--idle-exit-sec", type=float, default=0.0, help="--follow: stop after this long without new rows (0 = never).")
+    ap.add_argument(
+        "--status-json",
+        default=None,
+        help="--follow: runner status file; stop once it is done (default: <in-jsonl>.status.json).",
+    )
+    add_profile_args(ap)
     args = ap.parse_args()
 
-    rows = load_jsonl(args.in_jsonl)
-    if not rows:
-        raise ValueError("No rows found in input JSONL.")
+    prof = start_profile(args, os.path.join(os.path.dirname(args.out_summary_csv) or ".", "analyze_results.profile"))
 
-    # group by (config_id, question_id)
-    by_cq: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
-    by_config: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-
-    for r in rows:
-        by_cq[(r["config_id"], r["question_id"])].append(r)
-        by_config[r["config_id"]].append(r)
-
-    # per-question metrics
-    perq = []
-    for (cfg, qid), rr in by_cq.items():
-        answers = [x.get("parsed_answer", "") for x in rr]
-        counts = Counter(answers)
-        mode, mode_ct = counts.most_common(1)[0] if answers else ("", 0)
-
-        strict_stable = (len(counts) == 1 and mode != "")
-        mode_freq = (mode_ct / len(rr)) if rr else 0.0
-        ent = entropy_from_counts(counts)
-
-        acc = sum(1 for x in rr if x.get("correct")) / max(1, len(rr))
-
-        perq.append({
-            "config_id": cfg,
-            "question_id": qid,
-            "k_runs": len(rr),
-            "mode_answer": mode,
-            "strict_stable": strict_stable,
-            "mode_freq": round(mode_freq, 4),
-            "answer_entropy_bits": round(ent, 4),
-            "accuracy_over_runs": round(acc, 4),
-        })
-
-    # summary per config
-    summary = []
-    for cfg, rr in by_config.items():
-        n = len(rr)
-        num_correct = sum(1 for x in rr if x.get("correct"))
-        acc = num_correct / max(1, n)
-
-        # stability over questions: average of per-question strict stable and mode_freq
-        qs = sorted(set(x["question_id"] for x in rr))
-        strict_flags = []
-        mode_freqs = []
-        entropies = []
-        for qid in qs:
-            answers = [x.get("parsed_answer", "") for x in by_cq[(cfg, qid)]]
-            counts = Counter(answers)
-            mode, mode_ct = counts.most_common(1)[0] if answers else ("", 0)
-            strict_flags.append(len(counts) == 1 and mode != "")
-            mode_freqs.append(mode_ct / max(1, len(answers)))
-            entropies.append(entropy_from_counts(counts))
-
-        strict_stability = sum(strict_flags) / max(1, len(strict_flags))
-        avg_mode_freq = sum(mode_freqs) / max(1, len(mode_freqs))
-        avg_entropy = sum(entropies) / max(1, len(entropies))
-
-    
-        summary.append({
-            "config_id": cfg,
-            "n_runs": n,
-            "n_correct": num_correct,
-            "accuracy": round(acc, 4),
-            "strict_stability": round(strict_stability, 4),
-            "avg_mode_freq": round(avg_mode_freq, 4),
-            "avg_entropy_bits": round(avg_entropy, 4),
-        })
+    if args.follow:
+        follow(args)
+        finish_profile(prof)
+        return
 
-    # Ensure output directory exists
-    import os
-    os.makedirs(os.path.dirname(args.out_summary_csv) or ".", exist_ok=True)
-    os.makedirs(os.path.dirname(args.out_per_question_csv) or ".", exist_ok=True)
-
-    with open(args.out_per_question_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=list(perq[0].keys()))
-        w.writeheader()
-        w.writerows(perq)
+    with stage("load_jsonl"):
+        rows = load_jsonl(args.in_jsonl)
+    if not rows:
+        raise ValueError("No rows found in input JSONL.")
 
-    with open(args.out_summary_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
-        w.writeheader()
-        w.writerows(summary)
+    # One pass over the runs -> [config, question, answer] counts; every
+    # metric below is an array reduction of it (see src.answer_counts).
+    with stage("aggregate"):
+        counts = AnswerCounts.from_runs(rows)
 
-    print(f"Wrote: {args.out_summary_csv}")
-    print(f"Wrote: {args.out_per_question_csv}")
+    write_outputs(counts, args)
+    finish_profile(prof)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+
+# ============================================================
+# Answer-count tensor: [config, question, answer_code]
+# ============================================================
+#
+# analyze_results reduces a run JSONL to this tensor once; every per-question
+# metric, config summary and regression cell is an array reduction of it:
+#
+#   k_runs       = counts.sum(answer)
+#   successes    = n_correct                    (exact, no round(acc * k))
+#   mode_freq    = counts.max(answer) / k_runs
+#   entropy      = -sum p log2 p over answers
+#
+# Stored as <per_question>_counts.npz (plain arrays, no pickles). Answer codes
+# are the sorted parsed answers with the unparsed answer "" last. The mode of
+# each cell is stored too, because ties go to the answer seen first in the
+# run order (as collections.Counter did), which the counts alone do not keep.
+
+
+def _split_config_id(config_id: str):
+    # expects: T0_temp0.2 (design plans may append _topp0.9 / _max128 / _model-x)
+    if "_temp" in config_id:
+        t, temp = config_id.split("_temp", 1)
+        try:
+            return t, float(temp.split("_", 1)[0])
+        except ValueError:
+            return t, float("nan")
+    return config_id, float("nan")
+
+
+def _first_seen(values: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys(values))
+
+
+@dataclass
+class AnswerCounts:
+    counts: np.ndarray  # int32 (C, Q, A)
+    n_correct: np.ndarray  # int32 (C, Q)
+    correct_mask: np.ndarray  # bool (Q, A): answer a was scored correct for question q
+    mode: np.ndarray  # int32 (C, Q): modal answer code, ties -> first seen
+    answers: np.ndarray  # str (A,)
+    configs: np.ndarray  # str (C,)
+    questions: np.ndarray  # str (Q,)
+    treatments: np.ndarray  # str (C,)
+    temps: np.ndarray  # float (C,)
+    output_tokens_sum: np.ndarray  # float (C,)
+    output_tokens_n: np.ndarray  # int (C,)
+    latency_sum: np.ndarray  # float (C,)
+    latency_n: np.ndarray  # int (C,)
+
+    @classmethod
+    def from_runs(cls, rows: Sequence[Dict[str, Any]]) -> "AnswerCounts":
+        cfg_ids = [str(r["config_id"]) for r in rows]
+        q_ids = [str(r["question_id"]) for r in rows]
+        ans = [str(r.get("parsed_answer") or "") for r in rows]
+
+        configs = _first_seen(cfg_ids)
+        questions = _first_seen(q_ids)
+        real = sorted(set(ans) - {""})
+        answers = real + ([""] if "" in set(ans) else [])
+
+        c_idx = {c: i for i, c in enumerate(configs)}
+        q_idx = {q: i for i, q in enumerate(questions)}
+        a_idx = {a: i for i, a in enumerate(answers)}
+        ci = np.fromiter((c_idx[c] for c in cfg_ids), dtype=np.intp, count=len(rows))
+        qi = np.fromiter((q_idx[q] for q in q_ids), dtype=np.intp, count=len(rows))
+        ai = np.fromiter((a_idx[a] for a in ans), dtype=np.intp, count=len(rows))
+        ok = np.fromiter((bool(r.get("correct")) for r in rows), dtype=bool, count=len(rows))
+
+        C, Q, A = len(configs), len(questions), len(answers)
+        counts = np.zeros((C, Q, A), dtype=np.int32)
+        np.add.at(counts, (ci, qi, ai), 1)
+        n_correct = np.zeros((C, Q), dtype=np.int32)
+        np.add.at(n_correct, (ci[ok], qi[ok]), 1)
+        correct_mask = np.zeros((Q, A), dtype=bool)
+        correct_mask[qi[ok], ai[ok]] = True
+
+        n = len(rows)
+        first = np.full((C, Q, A), n, dtype=np.int64)
+        np.minimum.at(first, (ci, qi, ai), np.arange(n))
+        mode = (counts.astype(np.int64) * (n + 1) + (n - first)).argmax(axis=2).astype(np.int32)
+
+        first_row = {}
+        for i, c in enumerate(cfg_ids):
+            first_row.setdefault(c, rows[i])
+        treatments, temps = [], []
+        for c in configs:
+            r = first_row[c]
+            t, temp = _split_config_id(c)
+            treatments.append(str(r.get("treatment") or t))
+            temps.append(float(r["temperature"]) if r.get("temperature") is not None else temp)
+
+        def cost(key: str):
+            have = np.fromiter((r.get(key) is not None for r in rows), dtype=bool, count=len(rows))
+            vals = np.fromiter((float(r[key]) if r.get(key) is not None else 0.0 for r in rows), dtype=float, count=len(rows))
+            return np.bincount(ci, weights=vals, minlength=C), np.bincount(ci[have], minlength=C)
+
+        tok_sum, tok_n = cost("output_tokens")
+        lat_sum, lat_n = cost("latency_sec")
+
+        return cls(
+            counts=counts,
+            n_correct=n_correct,
+            correct_mask=correct_mask,
+            mode=mode,
+            answers=np.asarray(answers, dtype=str),
+            configs=np.asarray(configs, dtype=str),
+            questions=np.asarray(questions, dtype=str),
+            treatments=np.asarray(treatments, dtype=str),
+            temps=np.asarray(temps, dtype=float),
+            output_tokens_sum=tok_sum,
+            output_tokens_n=tok_n,
+            latency_sum=lat_sum,
+            latency_n=lat_n,
+        )
+
+    # ---------------- storage ----------------
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, **{k: getattr(self, k) for k in self.__dataclass_fields__})
+
+    @classmethod
+    def load(cls, path: str) -> "AnswerCounts":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(**{k: z[k] for k in cls.__dataclass_fields__})
+
+    # ---------------- array metrics ----------------
+
+    @property
+    def k_runs(self) -> np.ndarray:
+        return self.counts.sum(axis=2)
+
+    def mode_freq(self) -> np.ndarray:
+        k = self.k_runs
+        return np.divide(self.counts.max(axis=2), k, out=np.zeros(k.shape), where=k > 0)
+
+    def entropy_bits(self) -> np.ndarray:
+        k = self.k_runs
+        p = np.divide(self.counts, k[..., None], out=np.zeros(self.counts.shape), where=k[..., None] > 0)
+        terms = np.where(p > 0, p * np.log2(p + 1e-12), 0.0)
+        return -terms.sum(axis=2)
+
+    def strict_stable(self) -> np.ndarray:
+        distinct = (self.counts > 0).sum(axis=2)
+        unparsed = self.answers[self.mode] == ""
+        return (distinct == 1) & ~unparsed
+
+    def accuracy(self) -> np.ndarray:
+        k = self.k_runs
+        return np.divide(self.n_correct, k, out=np.zeros(k.shape), where=k > 0)
+
+    # ---------------- tables ----------------
+
+    def per_question_records(self) -> List[Dict[str, Any]]:
+        """
+        Rows of per_question.csv (one per observed config x question cell).
+        """
+        k = self.k_runs
+        mode = self.answers[self.mode]
+        stable = self.strict_stable()
+        mf = self.mode_freq()
+        ent = self.entropy_bits()
+        acc = self.accuracy()
+
+        out = []
+        for c, q in zip(*np.nonzero(k > 0)):
+            out.append(
+                {
+                    "config_id": str(self.configs[c]),
+                    "question_id": str(self.questions[q]),
+                    "k_runs": int(k[c, q]),
+                    "mode_answer": str(mode[c, q]),
+                    "strict_stable": bool(stable[c, q]),
+                    "mode_freq": round(float(mf[c, q]), 4),
+                    "answer_entropy_bits": round(float(ent[c, q]), 4),
+                    "accuracy_over_runs": round(float(acc[c, q]), 4),
+                }
+            )
+        return out
+
+    def summary_records(self) -> List[Dict[str, Any]]:
+        """
+        Rows of summary.csv (one per config). Cost columns appear only when
+        some run recorded them.
+        """
+        k = self.k_runs
+        present = k > 0
+        nq = np.maximum(present.sum(axis=1), 1)
+        n = k.sum(axis=1)
+        correct = self.n_correct.sum(axis=1)
+        stable = (self.strict_stable() & present).sum(axis=1) / nq
+        mf = np.where(present, self.mode_freq(), 0.0).sum(axis=1) / nq
+        ent = np.where(present, self.entropy_bits(), 0.0).sum(axis=1) / nq
+
+        out = []
+        for c in range(len(self.configs)):
+            row = {
+                "config_id": str(self.configs[c]),
+                "n_runs": int(n[c]),
+                "n_correct": int(correct[c]),
+                "accuracy": round(float(correct[c] / max(1, n[c])), 4),
+                "strict_stability": round(float(stable[c]), 4),
+                "avg_mode_freq": round(float(mf[c]), 4),
+                "avg_entropy_bits": round(float(ent[c]), 4),
+            }
+            for col, s, m in [
+                ("avg_output_tokens", self.output_tokens_sum, self.output_tokens_n),
+                ("avg_latency_sec", self.latency_sum, self.latency_n),
+            ]:
+                if m.sum() > 0:
+                    row[col] = round(float(s[c] / m[c]), 4) if m[c] else ""
+            out.append(row)
+        return out
+
+    def per_question_frame(self):
+        """
+        per_question.csv as a DataFrame plus treatment, temp and exact successes.
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(self.per_question_records())
+        k = self.k_runs
+        c, q = np.nonzero(k > 0)
+        df["treatment"] = self.treatments[c]
+        df["temp"] = self.temps[c]
+        df["successes"] = self.n_correct[c, q].astype(int)
+        return df
+
+
+class RunningAnswerCounts:
+    """
+    Row-at-a-time AnswerCounts for a run file that is still growing.
+
+    add() costs O(distinct answers in the row's cell): it updates that cell's
+    counts and moves its accuracy / mode_freq / entropy / strict-stability
+    contributions in the per-config running sums (config_records()).
+    to_counts() builds the same AnswerCounts that from_runs() would build from
+    all rows seen so far (first-seen config / question / mode order included),
+    so the CSVs written from it match the batch path exactly.
+    """
+
+    def __init__(self) -> None:
+        self.n_rows = 0
+        self.configs: Dict[str, int] = {}
+        self.questions: Dict[str, int] = {}
+        self.cells: Dict[tuple, Dict[str, int]] = {}  # (c, q) -> answer counts in first-seen order
+        self.cell_correct: Dict[tuple, int] = {}
+        self.correct_pairs: set = set()  # (q, answer) scored correct
+        self.cfg_meta: List[tuple] = []  # (treatment, temp) from the config's first row
+        self.cost: List[List[float]] = []  # per config: tok_sum, tok_n, lat_sum, lat_n
+        # per config running sums: runs, correct, cells, stable, mode_freq, entropy
+        self.cfg_sums: List[List[float]] = []
+
+    @staticmethod
+    def _cell_metrics(ans: Dict[str, int]) -> tuple:
+        k = sum(ans.values())
+        if k == 0:
+            return 0.0, 0.0, 0.0
+        top_answer, top = max(ans.items(), key=lambda kv: kv[1])  # ties -> first seen
+        stable = 1.0 if len(ans) == 1 and top_answer != "" else 0.0
+        ent = 0.0
+        for c in ans.values():
+            p = c / k
+            ent -= p * np.log2(p + 1e-12)
+        return stable, top / k, ent
+
+    def add(self, r: Dict[str, Any]) -> None:
+        cfg = str(r["config_id"])
+        c = self.configs.get(cfg)
+        if c is None:
+            c = self.configs[cfg] = len(self.configs)
+            t, temp = _split_config_id(cfg)
+            self.cfg_meta.append(
+                (str(r.get("treatment") or t), float(r["temperature"]) if r.get("temperature") is not None else temp)
+            )
+            self.cost.append([0.0, 0, 0.0, 0])
+            self.cfg_sums.append([0, 0, 0, 0.0, 0.0, 0.0])
+        q = self.questions.setdefault(str(r["question_id"]), len(self.questions))
+        a = str(r.get("parsed_answer") or "")
+        ok = bool(r.get("correct"))
+
+        sums = self.cfg_sums[c]
+        ans = self.cells.get((c, q))
+        if ans is None:
+            ans = self.cells[(c, q)] = {}
+            self.cell_correct[(c, q)] = 0
+            sums[2] += 1
+        else:
+            old = self._cell_metrics(ans)
+            sums[3] -= old[0]
+            sums[4] -= old[1]
+            sums[5] -= old[2]
+        ans[a] = ans.get(a, 0) + 1
+        new = self._cell_metrics(ans)
+        sums[3] += new[0]
+        sums[4] += new[1]
+        sums[5] += new[2]
+        sums[0] += 1
+        if ok:
+            sums[1] += 1
+            self.cell_correct[(c, q)] += 1
+            self.correct_pairs.add((q, a))
+
+        cost = self.cost[c]
+        cost[0] += float(r["output_tokens"]) if r.get("output_tokens") is not None else 0.0
+        cost[1] += r.get("output_tokens") is not None
+        cost[2] += float(r["latency_sec"]) if r.get("latency_sec") is not None else 0.0
+        cost[3] += r.get("latency_sec") is not None
+        self.n_rows += 1
+
+    def config_records(self) -> List[Dict[str, Any]]:
+        """
+        Live per-config accuracy / stability / mode_freq / entropy from the running sums.
+        """
+        out = []
+        for cfg, c in self.configs.items():
+            runs, correct, cells, stable, mf, ent = self.cfg_sums[c]
+            nq = max(cells, 1)
+            out.append(
+                {
+                    "config_id": cfg,
+                    "n_runs": int(runs),
+                    "accuracy": round(correct / max(1, runs), 4),
+                    "strict_stability": round(stable / nq, 4),
+                    "avg_mode_freq": round(mf / nq, 4),
+                    "avg_entropy_bits": round(ent / nq, 4),
+                }
+            )
+        return out
+
+    def to_counts(self) -> AnswerCounts:
+        seen = {a for ans in self.cells.values() for a in ans}
+        answers = sorted(seen - {""}) + ([""] if "" in seen else [])
+        a_idx = {a: i for i, a in enumerate(answers)}
+        C, Q, A = len(self.configs), len(self.questions), len(answers)
+
+        counts = np.zeros((C, Q, A), dtype=np.int32)
+        n_correct = np.zeros((C, Q), dtype=np.int32)
+        mode = np.zeros((C, Q), dtype=np.int32)
+        for (c, q), ans in self.cells.items():
+            for a, n in ans.items():
+                counts[c, q, a_idx[a]] = n
+            n_correct[c, q] = self.cell_correct[(c, q)]
+            mode[c, q] = a_idx[max(ans.items(), key=lambda kv: kv[1])[0]]
+        correct_mask = np.zeros((Q, A), dtype=bool)
+        for q, a in self.correct_pairs:
+            correct_mask[q, a_idx[a]] = True
+
+        cost = np.asarray(self.cost, dtype=float).reshape(C, 4)
+        return AnswerCounts(
+            counts=counts,
+            n_correct=n_correct,
+            correct_mask=correct_mask,
+            mode=mode,
+            answers=np.asarray(answers, dtype=str),
+            configs=np.asarray(list(self.configs), dtype=str),
+            questions=np.asarray(list(self.questions), dtype=str),
+            treatments=np.asarray([m[0] for m in self.cfg_meta], dtype=str),
+            temps=np.asarray([m[1] for m in self.cfg_meta], dtype=float),
+            output_tokens_sum=cost[:, 0],
+            output_tokens_n=cost[:, 1].astype(np.int64),
+            latency_sum=cost[:, 2],
+            latency_n=cost[:, 3].astype(np.int64),
+        )
+
+
+def counts_path_for(per_question_csv: str) -> str:
+    return os.path.splitext(per_question_csv)[0] + "_counts.npz"
+
+
+def read_per_question(path: str):
+    """
+    Per-question frame from a per_question.csv or an answer-count .npz. The
+    .npz version already carries treatment, temp and exact successes.
+    """
+    import pandas as pd
+
+    if path.endswith(".npz"):
+        return AnswerCounts.load(path).per_question_frame()
+    return pd.read_csv(path)
@@ -166,6 +166,8 @@ from typing import Optional, Dict, Any
 from openai import OpenAI
 from openai import BadRequestError
 
+from src.profiling import stage
+
 from .types import GenerationResult
 
 
@@ -217,7 +219,11 @@ class ChatGPTBackend:
         repeat_penalty: float = 1.1,  # kept for compatibility; OpenAI ignores
         seed: Optional[int] = None,
     ) -> GenerationResult:
-        self._throttle()
+        timings: Dict[str, float] = {}
+        t_wait = time.perf_counter()
+        with stage("throttle"):
+            self._throttle()
+        timings["limiter_wait_sec"] = time.perf_counter() - t_wait
 
         # Responses API input (plain text)
         req: Dict[str, Any] = {
@@ -239,18 +245,34 @@ class ChatGPTBackend:
         if seed is not None:
             req_with_sampling["seed"] = int(seed)
 
-        t0 = time.time()
+        # with_raw_response exposes the headers (server processing time); parse() gives the usual object
+        create = self.client.responses.with_raw_response.create
+        t_req = time.perf_counter()
         try:
-            resp = self.client.responses.create(**req_with_sampling)
+            with stage("api_call"):
+                raw = create(**req_with_sampling)
         except BadRequestError as e:
             msg = str(e)
             if "Unsupported parameter" in msg and ("temperature" in msg or "top_p" in msg or "seed" in msg):
                 # Retry without sampling knobs
-                resp = self.client.responses.create(**req)
+                timings["retry_sec"] = time.perf_counter() - t_req
+                t_req = time.perf_counter()
+                with stage("api_retry"):
+                    raw = create(**req)
             else:
                 raise
         finally:
             self._last_call_ts = time.time()
+        timings["request_sec"] = time.perf_counter() - t_req
+        resp = raw.parse()
+
+        processing_ms = raw.headers.get("openai-processing-ms")
+        if processing_ms:
+            try:
+                timings["server_sec"] = float(processing_ms) / 1000.0
+                timings["network_sec"] = max(0.0, timings["request_sec"] - timings["server_sec"])
+            except ValueError:
+                pass
 
         # Extract output text
         text = (getattr(resp, "output_text", "") or "").strip()
@@ -268,4 +290,5 @@ class ChatGPTBackend:
             input_tokens=input_tokens,
             output_tokens=output_tokens,
             token_count_method="openai",
+            timings=timings,
         )
\ No newline at end of file
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import time
 from typing import Optional
 
 try:
@@ -41,8 +42,16 @@ class GPT4AllBackend:
         if seed is not None:
             kwargs["seed"] = seed
 
+        t0 = time.perf_counter()
         out = self.model.generate(**kwargs)
+        request_sec = time.perf_counter() - t0
 
         # Token counts may not be provided by GPT4All depending on model/tokenizer.
         # We keep them as None if unavailable.
-        return GenerationResult(text=str(out), input_tokens=None, output_tokens=None, token_count_method="gpt4all")
+        return GenerationResult(
+            text=str(out),
+            input_tokens=None,
+            output_tokens=None,
+            token_count_method="gpt4all",
+            timings={"limiter_wait_sec": 0.0, "request_sec": request_sec, "server_sec": request_sec, "network_sec": 0.0},
+        )
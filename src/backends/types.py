@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, Optional
 
 @dataclass
 class GenerationResult:
@@ -7,3 +7,5 @@ class GenerationResult:
     input_tokens: Optional[int] = None
     output_tokens: Optional[int] = None
     token_count_method: str = "unknown"
+    # Where the call's time went, e.g. limiter_wait_sec / request_sec / server_sec (see src.run_metrics)
+    timings: Dict[str, float] = field(default_factory=dict)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# ============================================================
+# Benchmark suite for the hot paths
+# ============================================================
+#
+#   python -m src.bench --scales 1e3,1e4,1e5 --out-json outputs/bench/HEAD.json
+#   python -m src.bench --compare outputs/bench/base.json --fail-ratio 1.25
+#
+# Every benchmark runs on synthetic run rows shaped like the real ones
+# (6 treatments x 3 temps, k = 5, the rest questions), generated from a fixed
+# seed, so the same scale means the same input on every commit. n is always
+# the number of run rows (runner: generations) the operation handles. Setup
+# (building the input, writing the fixture file) is not timed, nor is one
+# warm-up call at each benchmark's first scale (keeps lazy imports out); each
+# timing is the best and median of --repeat calls.
+#
+# Some paths are only practical up to a scale (statsmodels on run-level rows,
+# the row-by-row expand_to_run_level); those record "skipped" above their cap
+# unless --no-caps is given. The JSON carries the commit, machine and per
+# (bench, n) timings; --compare prints the ratio to an earlier file and
+# --fail-ratio turns a slowdown into exit 1.
+
+TREATMENTS = ["T0", "T1", "T2", "T3", "T4", "T5"]
+TEMPS = [0.2, 0.5, 0.7]
+K = 5
+
+_OUTPUT_TEMPLATES = [
+    "The options suggest {a}.\nFINAL: {a}",
+    "Step 1: consider each option.\nStep 2: {a} fits best.\n\nFINAL: {a}",
+    "I think the answer is ({a}).",
+    "Comparing A and B, then C and D...\n{a}",
+    "Final answer: {a}, because the other options contradict the passage.",
+    "Hard to say. Possibly {a} or maybe not.",
+    "FINAL: {a}\nExplanation: the stem rules out the rest.",
+    "No clear answer.",
+]
+
+
+def synthetic_items(n_questions: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_questions):
+        items.append(
+            {
+                "id": f"q{i:06d}",
+                "type": "mcq",
+                "stem": f"Synthetic question {i}: which option best matches item {rng.randint(0, 10**6)}?",
+                "options": {L: f"option {L} for question {i}" for L in "ABCD"},
+                "answer": [rng.choice("ABCD")],
+                "answer_format": "letters",
+            }
+        )
+    return items
+
+
+def synthetic_outputs(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(_OUTPUT_TEMPLATES).format(a=rng.choice("ABCD")) for _ in range(n)]
+
+
+def synthetic_runs(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    n run rows over 18 configs x k=5 repeats x ceil(n / 90) questions, in
+    runner order (treatment, temp, question, repeat).
+    """
+    from src.parsing import parse_mcq_letter
+
+    rng = random.Random(seed)
+    n_cfg = len(TREATMENTS) * len(TEMPS)
+    n_q = max(1, -(-n // (n_cfg * K)))
+    gts = [rng.choice("ABCD") for _ in range(n_q)]
+    rows: List[Dict[str, Any]] = []
+    for t in TREATMENTS:
+        for temp in TEMPS:
+            config_id = f"{t}_temp{temp}"
+            for q in range(n_q):
+                for r in range(K):
+                    if len(rows) >= n:
+                        return rows
+                    # Mostly right, more spread at higher temperature
+                    a = gts[q] if rng.random() < 0.8 - 0.3 * temp else rng.choice("ABCD")
+                    text = rng.choice(_OUTPUT_TEMPLATES).format(a=a)
+                    parsed = parse_mcq_letter(text)
+                    rows.append(
+                        {
+                            "run_id": f"{config_id}__q{q:06d}__r{r}",
+                            "config_id": config_id,
+                            "treatment": t,
+                            "temperature": temp,
+                            "k": K,
+                            "question_id": f"q{q:06d}",
+                            "question_type": "mcq",
+                            "answer_format": "letters",
+                            "raw_output": text,
+                            "parsed_answer": parsed,
+                            "ground_truth": [gts[q]],
+                            "correct": parsed == gts[q],
+                            "output_tokens": len(text) // 4,
+                            "latency_sec": round(0.2 + rng.random(), 4),
+                        }
+                    )
+    return rows
+
+
+def per_question_frame(n: int, seed: int = 0):
+    from src.answer_counts import AnswerCounts
+
+    return AnswerCounts.from_runs(synthetic_runs(n, seed)).per_question_frame()
+
+
+# ============================================================
+# Benchmarks: setup(n, workdir) -> zero-argument callable that is timed
+# ============================================================
+
+
+def _bench_parse(n: int, workdir: str) -> Callable[[], Any]:
+    from src.parsing import parse_batch
+
+    texts = synthetic_outputs(n)
+    return lambda: parse_batch(texts, "mcq")
+
+
+def _bench_parse_score(n: int, workdir: str) -> Callable[[], Any]:
+    from src.parsing import is_correct, parse_answer
+
+    rows = synthetic_runs(n)
+    item = {"type": "mcq", "answer_format": "letters"}
+
+    def run() -> int:
+        return sum(is_correct(parse_answer(item, r["raw_output"]), r["ground_truth"], "letters") for r in rows)
+
+    return run
+
+
+def _bench_prompt_build(n: int, workdir: str) -> Callable[[], Any]:
+    from src.prompts import build_prompt
+
+    items = synthetic_items(max(1, n // len(TREATMENTS)))
+
+    def run() -> int:
+        total = 0
+        for t in TREATMENTS:
+            for it in items:
+                total += len(build_prompt(t, it["stem"], it["options"], allow_explanation=True))
+        return total
+
+    return run
+
+
+def _bench_prompt_table(n: int, workdir: str) -> Callable[[], Any]:
+    from src.prompt_table import PromptTable
+
+    items = synthetic_items(max(1, n // len(TREATMENTS)))
+    return lambda: PromptTable.compile(items, TREATMENTS, allow_explanation=True, count_tokens=False)
+
+
+def _bench_jsonl_write(n: int, workdir: str) -> Callable[[], Any]:
+    rows = synthetic_runs(n)
+    path = os.path.join(workdir, f"write_{n}.jsonl")
+
+    def run() -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    return run
+
+
+def _bench_jsonl_read(n: int, workdir: str) -> Callable[[], Any]:
+    from src.analyze_results import load_jsonl
+
+    path = os.path.join(workdir, f"read_{n}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for r in synthetic_runs(n):
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    return lambda: load_jsonl(path)
+
+
+def _bench_aggregate(n: int, workdir: str) -> Callable[[], Any]:
+    from src.answer_counts import AnswerCounts
+
+    rows = synthetic_runs(n)
+
+    def run() -> None:
+        counts = AnswerCounts.from_runs(rows)
+        counts.per_question_records()
+        counts.summary_records()
+
+    return run
+
+
+def _bench_expand(n: int, workdir: str) -> Callable[[], Any]:
+    from src.analyze_plot_regression import expand_to_run_level
+
+    df = per_question_frame(n)
+    return lambda: expand_to_run_level(df)
+
+
+def _bench_glm(n: int, workdir: str) -> Callable[[], Any]:
+    from src.analyze_plot_regression import fit_binomial_glm
+
+    df = per_question_frame(n)
+    return lambda: fit_binomial_glm(df, "interaction")
+
+
+def _bench_cluster_logit_cells(n: int, workdir: str) -> Callable[[], Any]:
+    from src.count_logit import fit_logit_from_counts, prepare_cells
+
+    cells = prepare_cells(per_question_frame(n))
+    return lambda: fit_logit_from_counts(cells, "interaction")
+
+
+def _bench_cluster_logit_runs(n: int, workdir: str) -> Callable[[], Any]:
+    from src.analyze_plot_regression import expand_to_run_level, fit_logistic_regression
+
+    df_runs = expand_to_run_level(per_question_frame(n))
+    return lambda: fit_logistic_regression(df_runs, "interaction")
+
+
+class FakeBackend:
+    """
+    Stands in for GPT4AllBackend: canned MCQ-style outputs, no model, no sleep,
+    so the runner benchmark measures everything around generate().
+    """
+
+    def __init__(self, model_filename: str = "", device: Optional[str] = None) -> None:
+        self._texts = synthetic_outputs(64)
+        self._i = 0
+
+    def generate(self, prompt: str, **kwargs: Any):
+        from src.backends.types import GenerationResult
+
+        self._i += 1
+        text = self._texts[self._i % len(self._texts)]
+        return GenerationResult(text=text, output_tokens=len(text) // 4, token_count_method="fake")
+
+
+def _bench_runner(n: int, workdir: str) -> Callable[[], Any]:
+    import src.backends.gpt4all_backend as gpt4all_backend
+    from src import run_experiment_gpt4all
+
+    n_q = max(1, n // (len(TREATMENTS) * len(TEMPS) * K))
+    dataset = os.path.join(workdir, f"dataset_{n}.jsonl")
+    with open(dataset, "w", encoding="utf-8") as f:
+        for it in synthetic_items(n_q):
+            f.write(json.dumps(it, ensure_ascii=False) + "\n")
+    argv = [
+        "run_experiment_gpt4all",
+        "--model-filename", "fake.gguf",
+        "--dataset", dataset,
+        "--out-jsonl", os.path.join(workdir, f"runner_{n}.jsonl"),
+        "--treatments", *TREATMENTS,
+        "--temps", ",".join(str(t) for t in TEMPS),
+        "--k", str(K),
+        "--allow-explanation",
+    ]
+
+    def run() -> None:
+        real, saved_argv = gpt4all_backend.GPT4AllBackend, sys.argv
+        gpt4all_backend.GPT4AllBackend = FakeBackend
+        sys.argv = argv
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_experiment_gpt4all.main()
+        finally:
+            gpt4all_backend.GPT4AllBackend, sys.argv = real, saved_argv
+
+    return run
+
+
+# name -> (setup, default max n, what n counts)
+BENCHMARKS: Dict[str, Tuple[Callable[[int, str], Callable[[], Any]], int, str]] = {
+    "parse_batch": (_bench_parse, 10**7, "outputs"),
+    "parse_and_score": (_bench_parse_score, 10**6, "runs"),
+    "prompt_build": (_bench_prompt_build, 10**6, "prompts"),
+    "prompt_table_compile": (_bench_prompt_table, 10**6, "prompts"),
+    "jsonl_write": (_bench_jsonl_write, 10**6, "runs"),
+    "jsonl_read": (_bench_jsonl_read, 10**6, "runs"),
+    "aggregate_counts": (_bench_aggregate, 10**6, "runs"),
+    "expand_to_run_level": (_bench_expand, 10**5, "runs"),
+    "glm_binomial_cells": (_bench_glm, 10**7, "runs"),
+    "cluster_logit_cells": (_bench_cluster_logit_cells, 10**7, "runs"),
+    "cluster_logit_runs": (_bench_cluster_logit_runs, 10**5, "runs"),
+    "runner_fake_backend": (_bench_runner, 10**6, "generations"),
+}
+
+
+# ============================================================
+# Driver
+# ============================================================
+
+
+def parse_scales(spec: str) -> List[int]:
+    return [int(float(s)) for s in spec.split(",") if s.strip()]
+
+
+def git_info() -> Dict[str, Any]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def git(*a: str) -> str:
+        try:
+            return subprocess.run(["git", *a], cwd=root, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ""
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def time_call(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def run_suite(
+    names: Sequence[str], scales: Sequence[int], repeat: int, caps: bool = True, verbose: bool = True
+) -> List[Dict[str, Any]]:
+    results = []
+    workdir = tempfile.mkdtemp(prefix="stat496_bench_")
+    try:
+        for name in names:
+            setup, max_n, unit = BENCHMARKS[name]
+            warm = False
+            for n in scales:
+                rec: Dict[str, Any] = {"bench": name, "n": n, "unit": unit}
+                if caps and n > max_n:
+                    rec["skipped"] = f"n > cap {max_n:.0e} (--no-caps to run)"
+                    results.append(rec)
+                    continue
+                try:
+                    t0 = time.perf_counter()
+                    fn = setup(n, workdir)
+                    rec["setup_sec"] = round(time.perf_counter() - t0, 4)
+                    if not warm:
+                        # first scale only: keeps lazy imports (statsmodels, ...) out of the timings
+                        fn()
+                        warm = True
+                    samples = time_call(fn, repeat)
+                except ImportError as e:
+                    rec["skipped"] = f"missing dependency: {e}"
+                    results.append(rec)
+                    continue
+                best = min(samples)
+                rec.update(
+                    {
+                        "repeat": repeat,
+                        "best_sec": round(best, 6),
+                        "median_sec": round(statistics.median(samples), 6),
+                        "per_sec": round(n / best, 1) if best > 0 else None,
+                    }
+                )
+                results.append(rec)
+                if verbose:
+                    print(f"  {name:<22} n={n:<9} best {best * 1000:10.2f} ms  ({rec['per_sec']:,.0f} {unit}/s)", flush=True)
+                for p in os.listdir(workdir):
+                    os.remove(os.path.join(workdir, p))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results: Sequence[Dict[str, Any]], baseline: Dict[str, Any], fail_ratio: Optional[float]) -> List[str]:
+    """
+    Print new/old best-time ratios per (bench, n); return the keys over fail_ratio.
+    """
+    old = {(r["bench"], r["n"]): r for r in baseline.get("results", []) if "best_sec" in r}
+    base_commit = (baseline.get("git") or {}).get("commit", "")[:10] or "baseline"
+    print(f"\nvs {base_commit}:  ratio = new / old best time (>1 is slower)")
+    slower = []
+    for r in results:
+        o = old.get((r["bench"], r["n"]))
+        if "best_sec" not in r or o is None or o["best_sec"] <= 0:
+            continue
+        ratio = r["best_sec"] / o["best_sec"]
+        flag = ""
+        if fail_ratio is not None and ratio > fail_ratio:
+            slower.append(f"{r['bench']}@{r['n']}")
+            flag = "  SLOWER"
+        print(f"  {r['bench']:<22} n={r['n']:<9} {o['best_sec'] * 1000:10.2f} -> {r['best_sec'] * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+    return slower
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="1e3,1e4,1e5", help="Comma list of row counts, e.g. 1e3,1e5,1e7.")
+    ap.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run (default: all).")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-caps", action="store_true", help="Run every benchmark at every scale.")
+    ap.add_argument("--out-json", default="outputs/bench/bench.json")
+    ap.add_argument("--compare", default=None, help="Earlier --out-json file to compare against.")
+    ap.add_argument("--fail-ratio", type=float, default=None, help="With --compare: exit 1 if any best time grows by more than this factor.")
+    args = ap.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    scales = parse_scales(args.scales)
+    print(f"Benchmarks: {len(names)} x scales {scales} (best of {args.repeat})")
+    results = run_suite(names, scales, args.repeat, caps=not args.no_caps)
+
+    out = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "git": git_info(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.out_json) or ".", exist_ok=True)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    n_skip = sum("skipped" in r for r in results)
+    print(f"Wrote: {args.out_json} ({len(results) - n_skip} timings, {n_skip} skipped)")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.fail_ratio)
+        if slower:
+            print(f"Slower than x{args.fail_ratio}: {', '.join(slower)}", file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Callable, List, Sequence
+
+from src.parsing import parse_batch, parse_final_line, parse_mcq_letter, parse_number
+
+
+# ============================================================
+# Parser microbenchmark + equivalence check
+# ============================================================
+#
+# Compares src.parsing against the original uncompiled, multi-pass parsers
+# (kept verbatim below as the reference) on saved raw_output texts plus
+# randomized adversarial strings. Any mismatch is printed and exits 1.
+
+
+def legacy_parse_final_line(text: str) -> str:
+    if not text:
+        return ""
+    m = re.search(r"^\s*FINAL\s*:\s*(.+?)\s*$", text, flags=re.IGNORECASE | re.MULTILINE)
+    if m:
+        return m.group(1).strip()
+    return ""
+
+
+def legacy_parse_mcq_letter(text: str) -> str:
+    if not text:
+        return ""
+    matches = re.findall(r"FINAL\s*:\s*([A-D])\b", text, flags=re.IGNORECASE)
+    if matches:
+        return matches[-1].upper()
+    lines = [ln.strip() for ln in text.strip().splitlines() if ln.strip()]
+    for ln in reversed(lines):
+        m2 = re.fullmatch(r"[\(\[]?\s*([A-D])\s*[\)\]]?", ln, flags=re.IGNORECASE)
+        if m2:
+            return m2.group(1).upper()
+    m3 = re.findall(r"\b([A-D])\b", text, flags=re.IGNORECASE)
+    return m3[-1].upper() if m3 else ""
+
+
+def legacy_parse_number(text: str) -> str:
+    if not text:
+        return ""
+    final = legacy_parse_final_line(text)
+    candidate = final if final else text
+    nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", candidate)
+    if nums:
+        return nums[-1]
+    nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", text)
+    return nums[-1] if nums else ""
+
+
+_PIECES = [
+    "FINAL", "final", "Final", "FINAL:", "FINAL :", "Final: ", ":", " ", "\n", "\r\n", "\t", "\x0b", " ", "\x85",
+    "A", "B", "C", "D", "a", "d", "E", "(", ")", "[", "]", "(B)", "[c]", "AB", "D.", "-", "+", "3", "4.5", "-2e3",
+    ".", "1e", "answer", "The answer is", "option", "é", "İ", "ſ", "K", "Ⅳ", "**", "'", "_", "0",
+]
+
+
+def random_texts(n: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choice(_PIECES) for _ in range(rng.randint(0, 40))) for _ in range(n)]
+
+
+def load_outputs(patterns: Sequence[str], limit: int) -> List[str]:
+    out: List[str] = []
+    for pat in patterns:
+        for path in sorted(glob.glob(pat)):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        out.append(json.loads(line).get("raw_output") or "")
+                        if limit and len(out) >= limit:
+                            return out
+    return out
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", nargs="+", default=["outputs/*.jsonl", "outputs/*/*.jsonl"], help="Run JSONL globs.")
+    ap.add_argument("--limit", type=int, default=0, help="Max saved outputs to use (0 = all).")
+    ap.add_argument("--n-random", type=int, default=50000, help="Randomized adversarial strings for the equivalence check.")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    saved = load_outputs(args.runs, args.limit)
+    fuzz = random_texts(args.n_random, args.seed)
+    texts = saved + fuzz
+
+    # Equivalence
+    bad = 0
+    for name, new, old in [
+        ("mcq", parse_mcq_letter, legacy_parse_mcq_letter),
+        ("number", parse_number, legacy_parse_number),
+        ("final_line", parse_final_line, legacy_parse_final_line),
+    ]:
+        mism = [t for t in texts if new(t) != old(t)]
+        bad += len(mism)
+        for t in mism[:5]:
+            print(f"MISMATCH {name}: {t!r} -> new {new(t)!r}, old {old(t)!r}")
+    print(f"Equivalence: {len(texts)} texts ({len(saved)} saved outputs, {len(fuzz)} random), {bad} mismatches")
+
+    # Timing on saved outputs (random strings when there are none)
+    bench = saved or fuzz
+    t_old = best_of(lambda: [legacy_parse_mcq_letter(t) for t in bench], args.repeat)
+    t_new = best_of(lambda: [parse_mcq_letter(t) for t in bench], args.repeat)
+    t_batch = best_of(lambda: parse_batch(bench, "mcq"), args.repeat)
+    per = 1e6 / max(len(bench), 1)
+    print(f"MCQ parse over {len(bench)} outputs (best of {args.repeat}):")
+    print(f"  legacy        {t_old * 1000:8.1f} ms  ({t_old * per:.2f} us/output)")
+    print(f"  parse_mcq     {t_new * 1000:8.1f} ms  ({t_new * per:.2f} us/output)  x{t_old / t_new:.2f}")
+    print(f"  parse_batch   {t_batch * 1000:8.1f} ms  ({t_batch * per:.2f} us/output)  x{t_old / t_batch:.2f}")
+
+    _, tiers = parse_batch(bench, "mcq")
+    print("  tiers:", ", ".join(f"{k}={v}" for k, v in Counter(tiers).most_common()))
+
+    if bad:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
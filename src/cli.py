@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# ============================================================
+# stat496: one entry point for the experiment / analysis scripts
+# ============================================================
+#
+#   python -m src <command> [<target>] [script args...]
+#
+# This module imports nothing heavy. A subcommand resolves to a src.* script
+# whose main() is imported and called only after dispatch, with the remaining
+# arguments handed to the script's own argparse. So `stat496 --help` is instant,
+# and each subcommand pays only for what its script imports. The scripts
+# themselves keep statsmodels / matplotlib / LLM SDK imports inside the
+# functions that use them.
+#
+# `stat496 imports` benchmarks startup (fresh interpreter per sample) and can
+# fail on a time budget, for use before merging changes that add imports.
+
+PROG = "stat496"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# command -> target -> (module, injected args, help). Target "" = no target.
+COMMANDS: Dict[str, Dict[str, Tuple[str, List[str], str]]] = {
+    "run": {
+        "chatgpt": ("src.run_experiment_chatgpt", [], "Run treatments x temps x k against the OpenAI API."),
+        "gpt4all": ("src.run_experiment_gpt4all", [], "Run treatments x temps x k against a local GPT4All model."),
+    },
+    "status": {
+        "": ("src.progress", [], "Show (or --watch) a running sweep's progress / ETA status file."),
+    },
+    "design": {
+        "": ("src.design", [], "Plan a fractional / Latin-hypercube / D-optimal subset of the sweep grid."),
+    },
+    "monitor": {
+        "": ("src.sequential", [], "Refit the clustered logit as runs stream in and stop the sweep once the treatment ORs are pinned down."),
+    },
+    "queue": {
+        "": ("src.work_queue", [], "Shared SQLite work queue for multi-machine sweeps: init / status / export / requeue."),
+    },
+    "compact": {
+        "": ("src.compact", [], "Merge per-worker run shards into one sorted, deduplicated file (jsonl / gz / parquet)."),
+    },
+    "prompts": {
+        "": ("src.prompt_table", [], "Compile every (treatment, question) prompt once into a table file."),
+    },
+    "extract": {
+        "": ("src.extract_dataset_from_csv", [], "Sample a JSONL dataset from a question CSV."),
+    },
+    "analyze": {
+        "": ("src.analyze_results", [], "Run JSONL -> summary / per-question CSVs."),
+    },
+    "fit": {
+        "regression": ("src.analyze_plot_regression", ["--no-plots"], "GLM + clustered logit tables (no figures)."),
+        "robust": ("src.robust_cluster_se", [], "GLMs with question-clustered SEs."),
+        "bootstrap": ("src.cluster_bootstrap", [], "Cluster-bootstrap OR / temp-slope CIs."),
+        "permutation": ("src.permutation_tests", [], "Within-question permutation Wald tests."),
+        "glmm": ("src.glmm_logit", [], "Random-intercept logit (Laplace / AGHQ)."),
+    },
+    "plot": {
+        "regression": ("src.analyze_plot_regression", [], "Regression tables + tradeoff / bar / forest figures."),
+        "new": ("src.analyze_new", [], "Extended analysis with per-temperature and heatmap figures."),
+    },
+    "rescore": {
+        "": ("src.rescore", [], "Re-parse / re-score saved run JSONLs offline; per-config verdict diff."),
+    },
+    "bench": {
+        "": ("src.bench", [], "Hot-path benchmark suite on synthetic runs; JSON results, --compare to a baseline."),
+    },
+    "pareto": {
+        "": ("src.pareto", [], "Pareto frontier / ranks over a config-level summary CSV."),
+    },
+    "docs": {
+        "": ("src.make_docs", [], "Markdown write-up from the run JSONL and summaries."),
+    },
+    "pipeline": {
+        "": ("src.pipeline", [], "Incremental analyze -> fit -> docs pipeline over run files."),
+    },
+}
+
+# Imports a subcommand's --help should not need
+HEAVY_MODULES = ("statsmodels", "matplotlib", "patsy", "openai", "gpt4all", "scipy.stats", "scipy.optimize")
+
+
+def resolve(argv: Sequence[str]) -> Tuple[Optional[str], List[str], str]:
+    """
+    (module, script argv, display name) for a command line; module is None if
+    the command or target is unknown.
+    """
+    cmd, rest = argv[0], list(argv[1:])
+    targets = COMMANDS.get(cmd)
+    if targets is None:
+        return None, rest, cmd
+    if "" in targets:
+        module, inject, _ = targets[""]
+        return module, inject + rest, cmd
+    if not rest or rest[0] not in targets:
+        return None, rest, cmd
+    module, inject, _ = targets[rest[0]]
+    return module, inject + rest[1:], f"{cmd} {rest[0]}"
+
+
+def usage() -> str:
+    lines = [f"usage: {PROG} <command> [<target>] [args...]", "", "commands:"]
+    for cmd, targets in COMMANDS.items():
+        for target, (module, inject, help_) in targets.items():
+            name = f"{cmd} {target}".strip()
+            lines.append(f"  {name:<22} {help_}  [{module}{' ' + ' '.join(inject) if inject else ''}]")
+    lines.append(f"  {'imports':<22} Benchmark startup time of every command (see `{PROG} imports --help`).")
+    lines.append("")
+    lines.append(f"`{PROG} <command> [<target>] --help` shows the script's own options.")
+    return "\n".join(lines)
+
+
+def dispatch(argv: Sequence[str]) -> int:
+    module, script_argv, name = resolve(argv)
+    if module is None:
+        targets = COMMANDS.get(argv[0])
+        if targets:
+            print(f"{PROG} {argv[0]}: choose a target: {', '.join(targets)}", file=sys.stderr)
+        else:
+            print(f"{PROG}: unknown command {argv[0]!r}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    sys.argv = [f"{PROG} {name}"] + script_argv
+    importlib.import_module(module).main()
+    return 0
+
+
+# ============================================================
+# Import-time benchmark
+# ============================================================
+
+
+def _leaf_commands() -> List[Tuple[str, List[str], str]]:
+    out = []
+    for cmd, targets in COMMANDS.items():
+        for target, (module, _, _) in targets.items():
+            out.append((f"{cmd} {target}".strip(), [cmd] + ([target] if target else []), module))
+    return out
+
+
+def _time_help(python: str, argv: List[str]) -> Tuple[float, bool]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT] + [p for p in [env.get("PYTHONPATH")] if p])
+    t0 = time.perf_counter()
+    proc = subprocess.run([python, "-m", "src"] + argv + ["--help"], env=env, capture_output=True)
+    return time.perf_counter() - t0, proc.returncode == 0
+
+
+def _heavy_loaded(python: str, module: str) -> List[str]:
+    code = (
+        "import importlib, json, sys\n"
+        f"importlib.import_module({module!r})\n"
+        f"heavy = {list(HEAVY_MODULES)!r}\n"
+        "print(json.dumps(sorted(h for h in heavy if h in sys.modules)))\n"
+    )
+    proc = subprocess.run([python, "-c", code], capture_output=True, text=True, cwd=REPO_ROOT)
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1:] or ["import failed"]
+        return [f"<error: {last[0]}>"]
+    return json.loads(proc.stdout)
+
+
+def bench_imports(argv: Sequence[str]) -> int:
+    ap = argparse.ArgumentParser(prog=f"{PROG} imports", description="Startup time of `<command> --help` per command.")
+    ap.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per command (median reported).")
+    ap.add_argument("--budget-ms", type=float, default=None, help="Exit 1 if any command's median exceeds this.")
+    ap.add_argument("--only", nargs="+", help="Commands to time, e.g. analyze 'fit robust'.")
+    ap.add_argument("--json", dest="out_json", help="Also write results to this JSON file.")
+    args = ap.parse_args(list(argv))
+
+    python = sys.executable
+    base = [_time_help(python, ["--help"])[0] for _ in range(args.repeat)]
+    base_ms = 1000.0 * statistics.median(base)
+
+    rows = []
+    for name, cmd_argv, module in _leaf_commands():
+        if args.only and name not in args.only and cmd_argv[0] not in args.only:
+            continue
+        samples, ok = [], True
+        for _ in range(args.repeat):
+            sec, good = _time_help(python, cmd_argv)
+            samples.append(sec)
+            ok = ok and good
+        rows.append(
+            {
+                "command": name,
+                "module": module,
+                "median_ms": round(1000.0 * statistics.median(samples), 1),
+                "min_ms": round(1000.0 * min(samples), 1),
+                "help_ok": ok,
+                "heavy_on_import": _heavy_loaded(python, module),
+            }
+        )
+
+    print(f"{PROG} --help: {base_ms:.0f} ms (interpreter + dispatcher)")
+    print(f"{'command':<22} {'median':>8} {'min':>8}  heavy modules on import")
+    over = []
+    for r in rows:
+        flag = ""
+        if args.budget_ms is not None and r["median_ms"] > args.budget_ms:
+            over.append(r["command"])
+            flag = "  OVER BUDGET"
+        if not r["help_ok"]:
+            flag += "  (--help failed)"
+        heavy = ", ".join(r["heavy_on_import"]) or "-"
+        print(f"{r['command']:<22} {r['median_ms']:>6.0f}ms {r['min_ms']:>6.0f}ms  {heavy}{flag}")
+
+    if args.out_json:
+        with open(args.out_json, "w", encoding="utf-8") as f:
+            json.dump({"python": python, "repeat": args.repeat, "base_ms": round(base_ms, 1), "commands": rows}, f, indent=2)
+
+    if over:
+        print(f"Over {args.budget_ms:.0f} ms: {', '.join(over)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(usage())
+        sys.exit(0)
+    if argv[0] == "imports":
+        sys.exit(bench_imports(argv[1:]))
+    sys.exit(dispatch(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+from src.count_logit import read_per_question_cells
+from src.logit_fit import MODEL_TYPES, TreatmentTempDesign, fit_models
+
+
+# ============================================================
+# Cluster (question_id) bootstrap for the treatment x temp logit
+# ============================================================
+#
+# Each replicate resamples questions with replacement. Instead of building a
+# resampled frame, a replicate is a vector of multinomial question counts
+# w_q ~ Mult(G, 1/G); every cell of question q gets weight w_q, and the logit
+# is refitted by weighted Newton/IRLS starting from the full-sample estimate.
+# Replicates are fitted in batches (one Hessian per replicate via a single
+# matmul) and batches are spread across a process pool. Each batch draws from
+# its own SeedSequence child, so results do not depend on --workers.
+
+
+def contrast_matrix(design: TreatmentTempDesign, model_type: str) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    Rows = quantities reported by the bootstrap, as linear combinations of beta:
+      - C(treatment)[T.x]   treatment log-OR vs baseline (at temp=0 for interaction)
+      - temp_slope[x]       log-OR per +1.0 temp within treatment x
+    Returns (terms, kinds, L) with kinds in {"treatment_or", "temp_slope"}.
+    """
+    cols = design.columns(model_type)
+    k = len(cols)
+    idx = {c: i for i, c in enumerate(cols)}
+    terms: List[str] = []
+    kinds: List[str] = []
+    rows: List[np.ndarray] = []
+
+    for t in design.others:
+        r = np.zeros(k)
+        r[idx[f"C(treatment)[T.{t}]"]] = 1.0
+        terms.append(f"C(treatment)[T.{t}]")
+        kinds.append("treatment_or")
+        rows.append(r)
+
+    if model_type == "additive":
+        r = np.zeros(k)
+        r[idx["temp"]] = 1.0
+        terms.append("temp_slope")
+        kinds.append("temp_slope")
+        rows.append(r)
+    else:
+        for t in design.levels:
+            r = np.zeros(k)
+            r[idx["temp"]] = 1.0
+            if t != design.levels[0]:
+                r[idx[f"C(treatment)[T.{t}]:temp"]] = 1.0
+            terms.append(f"temp_slope[{t}]")
+            kinds.append("temp_slope")
+            rows.append(r)
+
+    return terms, kinds, np.vstack(rows)
+
+
+def batched_newton(
+    X: np.ndarray,
+    XX: np.ndarray,
+    y: np.ndarray,
+    n: np.ndarray,
+    W: np.ndarray,
+    beta0: np.ndarray,
+    maxiter: int = 50,
+    tol: float = 1e-8,
+) -> np.ndarray:
+    """
+    Weighted binomial logit for B weight vectors at once.
+
+    X: (C, k) cell design, XX: (C, k*k) row-wise outer products of X,
+    W: (B, C) cell weights. Returns (B, k); rows that fail to converge are NaN.
+    """
+    B, k = W.shape[0], X.shape[1]
+    beta = np.tile(beta0, (B, 1))
+    yw = W * y[None, :]
+    nw = W * n[None, :]
+    ridge = 1e-10 * np.eye(k)
+    active = np.ones(B, dtype=bool)
+
+    for _ in range(maxiter):
+        a = np.flatnonzero(active)
+        if len(a) == 0:
+            break
+        eta = beta[a] @ X.T
+        p = 1.0 / (1.0 + np.exp(-eta))
+        grad = (yw[a] - nw[a] * p) @ X
+        H = ((nw[a] * p * (1.0 - p)) @ XX).reshape(len(a), k, k) + ridge
+        try:
+            step = np.linalg.solve(H, grad[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(h, g, rcond=None)[0] for h, g in zip(H, grad)])
+        beta[a] += step
+        done = np.max(np.abs(step), axis=1) < tol
+        active[a[done]] = False
+
+    bad = active | ~np.isfinite(beta).all(axis=1)
+    beta[bad] = np.nan
+    return beta
+
+
+def _bootstrap_chunk(
+    X: np.ndarray,
+    y: np.ndarray,
+    n: np.ndarray,
+    qcodes: np.ndarray,
+    n_groups: int,
+    beta0: np.ndarray,
+    n_rep: int,
+    seed_seq: np.random.SeedSequence,
+    batch_size: int,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed_seq)
+    XX = (X[:, :, None] * X[:, None, :]).reshape(X.shape[0], -1)
+    probs = np.full(n_groups, 1.0 / n_groups)
+    out = []
+    for start in range(0, n_rep, batch_size):
+        b = min(batch_size, n_rep - start)
+        Wq = rng.multinomial(n_groups, probs, size=b).astype(float)
+        out.append(batched_newton(X, XX, y, n, Wq[:, qcodes], beta0))
+    return np.vstack(out)
+
+
+def cluster_bootstrap(
+    df_cells: pd.DataFrame,
+    model_type: str,
+    n_boot: int = 2000,
+    seed: int = 42,
+    workers: int = 1,
+    chunk_size: int = 500,
+    batch_size: int = 128,
+) -> Dict[str, object]:
+    """
+    Cluster-bootstrap replicates of the logit coefficients.
+
+    Returns dict with design, beta_hat, boot (n_boot x k), jackknife (G x k), groups.
+    """
+    design = TreatmentTempDesign(df_cells["treatment"], df_cells["temp"])
+    name = f"logit_{model_type}"
+    beta_hat = fit_models(df_cells, model_types=[model_type], design=design)[name].params.to_numpy()
+
+    X = np.ascontiguousarray(design.exog(model_type))
+    y = df_cells["successes"].to_numpy(dtype=float)
+    n = df_cells["k_runs"].to_numpy(dtype=float)
+    qcodes, groups = pd.factorize(df_cells["question_id"].astype(str))
+    G = len(groups)
+
+    sizes = [min(chunk_size, n_boot - s) for s in range(0, n_boot, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(X, y, n, qcodes, G, beta_hat, m, ss, batch_size) for m, ss in zip(sizes, seeds)]
+
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_bootstrap_chunk, *zip(*args)))
+    else:
+        parts = [_bootstrap_chunk(*a) for a in args]
+    boot = np.vstack(parts)
+
+    # Leave-one-question-out jackknife (for the BCa acceleration constant)
+    XX = (X[:, :, None] * X[:, None, :]).reshape(X.shape[0], -1)
+    jack = []
+    for start in range(0, G, batch_size):
+        drop = np.arange(start, min(start + batch_size, G))
+        Wq = np.ones((len(drop), G))
+        Wq[np.arange(len(drop)), drop] = 0.0
+        jack.append(batched_newton(X, XX, y, n, Wq[:, qcodes], beta_hat))
+
+    return {
+        "name": name,
+        "design": design,
+        "beta_hat": beta_hat,
+        "boot": boot,
+        "jackknife": np.vstack(jack),
+        "n_groups": G,
+    }
+
+
+def bca_interval(theta_hat: float, boot: np.ndarray, jack: np.ndarray, alpha: float) -> Tuple[float, float]:
+    boot = boot[np.isfinite(boot)]
+    jack = jack[np.isfinite(jack)]
+    if len(boot) == 0 or len(jack) < 2:
+        return float("nan"), float("nan")
+
+    prop = (np.sum(boot < theta_hat) + 0.5 * np.sum(boot == theta_hat)) / len(boot)
+    prop = min(max(prop, 1.0 / (len(boot) + 1)), 1.0 - 1.0 / (len(boot) + 1))
+    z0 = ndtri(prop)
+
+    d = jack.mean() - jack
+    denom = 6.0 * np.sum(d**2) ** 1.5
+    acc = np.sum(d**3) / denom if denom > 0 else 0.0
+
+    qs = []
+    for z_a in (ndtri(alpha / 2), ndtri(1 - alpha / 2)):
+        qs.append(ndtr(z0 + (z0 + z_a) / (1.0 - acc * (z0 + z_a))))
+    lo, hi = np.quantile(boot, qs)
+    return float(lo), float(hi)
+
+
+def bootstrap_ci_table(result: Dict[str, object], model_type: str, alpha: float = 0.05) -> pd.DataFrame:
+    design = result["design"]
+    terms, kinds, L = contrast_matrix(design, model_type)
+    theta_hat = L @ result["beta_hat"]
+    boot = result["boot"] @ L.T
+    jack = result["jackknife"] @ L.T
+    ok = np.isfinite(boot).all(axis=1)
+
+    rows = []
+    for j, (term, kind) in enumerate(zip(terms, kinds)):
+        b = boot[ok, j]
+        lo_p, hi_p = np.quantile(b, [alpha / 2, 1 - alpha / 2]) if len(b) else (np.nan, np.nan)
+        lo_b, hi_b = bca_interval(theta_hat[j], b, jack[:, j], alpha)
+        rows.append(
+            {
+                "term": term,
+                "kind": kind,
+                "coef_logit": theta_hat[j],
+                "boot_se": float(np.std(b, ddof=1)) if len(b) > 1 else np.nan,
+                "odds_ratio": np.exp(theta_hat[j]),
+                "or_ci_low_pct": np.exp(lo_p),
+                "or_ci_high_pct": np.exp(hi_p),
+                "or_ci_low_bca": np.exp(lo_b),
+                "or_ci_high_bca": np.exp(hi_b),
+                "n_boot_ok": int(ok.sum()),
+                "n_boot_failed": int((~ok).sum()),
+                "n_clusters": result["n_groups"],
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results.")
+    ap.add_argument("--out-dir", default="outputs/cluster_bootstrap")
+    ap.add_argument("--models", nargs="+", default=list(MODEL_TYPES), choices=list(MODEL_TYPES))
+    ap.add_argument("--n-boot", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-size", type=int, default=500, help="Replicates per pool task (fixes the seed stream).")
+    ap.add_argument("--batch-size", type=int, default=128, help="Replicates fitted together inside a task.")
+    ap.add_argument("--alpha", type=float, default=0.05)
+    ap.add_argument("--save-replicates", action="store_true", help="Also write the raw replicate coefficients (.npz).")
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    cells = read_per_question_cells(args.per_question_csv)
+
+    for model_type in args.models:
+        t0 = time.time()
+        res = cluster_bootstrap(
+            cells,
+            model_type,
+            n_boot=args.n_boot,
+            seed=args.seed,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            batch_size=args.batch_size,
+        )
+        tab = bootstrap_ci_table(res, model_type, alpha=args.alpha)
+        out_csv = os.path.join(args.out_dir, f"{res['name']}_bootstrap_ci.csv")
+        tab.to_csv(out_csv, index=False)
+
+        if args.save_replicates:
+            np.savez_compressed(
+                os.path.join(args.out_dir, f"{res['name']}_bootstrap_replicates.npz"),
+                columns=np.asarray(res["design"].columns(model_type)),
+                beta_hat=res["beta_hat"],
+                boot=res["boot"],
+                jackknife=res["jackknife"],
+            )
+        print(f"Wrote: {out_csv} ({args.n_boot} replicates, {time.time() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import heapq
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# ============================================================
+# Sharded run outputs + streaming merge / compaction
+# ============================================================
+#
+# Workers that run at the same time cannot share one --out-jsonl. With
+# --shard NAME (or --shard auto: the queue worker id, else <host>-<pid>) a
+# runner appends to its own shard next to the usual path:
+#
+#   outputs/runs.jsonl  ->  outputs/runs.shard-box1.jsonl
+#
+# Appending means a restarted worker keeps what it wrote before. Compaction
+# turns the shards back into the one file downstream tools read:
+#
+#   python -m src compact --in "outputs/runs.shard-*.jsonl" --out outputs/runs.jsonl
+#
+# Memory stays bounded by --chunk-rows whatever the shard sizes. Shards are
+# read in chunks; each chunk is sorted by (config_id, question_id, run_id)
+# and spilled to a temp file (all but the last, which stays in memory). The
+# sorted runs are then k-way merged with heapq.merge. Copies of a run_id (a
+# lease re-issued by src.work_queue, a rerun after a crash) arrive next to
+# each other, and the best one is kept:
+#
+#   parsed answer > none, then higher queue attempt, then later timestamp,
+#   then later shard / line
+#
+# Run lines are copied through byte for byte; only the sort key is decoded.
+# A truncated last line (a worker killed mid-write) is skipped and counted.
+#
+#   --format jsonl     one JSONL (default)
+#   --format jsonl.gz  gzip-compressed JSONL
+#   --format parquet   columnar, one row group per --chunk-rows (needs
+#                      pyarrow). The merged rows are staged as JSONL first
+#                      so the column types are known before the first row
+#                      group is written. Lists / dicts are stored as JSON
+#                      strings.
+
+
+def shard_path(out_jsonl: str, shard: str) -> str:
+    stem, ext = os.path.splitext(out_jsonl)
+    return f"{stem}.shard-{shard}{ext or '.jsonl'}"
+
+
+def add_shard_args(ap) -> None:
+    ap.add_argument(
+        "--shard",
+        default=None,
+        help="Append to this worker's own shard <out-jsonl stem>.shard-NAME.jsonl "
+        "('auto' = queue worker id, else <host>-<pid>); merge shards with `compact`.",
+    )
+
+
+def resolve_out(args, worker_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    (output path, open mode) for a runner: its shard in append mode, or
+    --out-jsonl as before. A shard left without a final newline by a killed
+    worker gets one, so the next row does not run into the torn line.
+    """
+    if not getattr(args, "shard", None):
+        return args.out_jsonl, "w"
+    name = args.shard
+    if name == "auto":
+        name = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    path = shard_path(args.out_jsonl, name)
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    return path, "a"
+
+
+# ============================================================
+# External sort + k-way merge
+# ============================================================
+
+Key = Tuple[str, str, str, int, int, str, int, int]
+
+
+def _key(row: Dict[str, Any], shard_idx: int, line_no: int) -> Key:
+    parsed = row.get("parsed_answer")
+    return (
+        str(row.get("config_id", "")),
+        str(row.get("question_id", "")),
+        str(row.get("run_id", "")),
+        1 if parsed not in (None, "", []) else 0,
+        int(row.get("attempt") or 0),
+        str(row.get("timestamp", "")),
+        shard_idx,
+        line_no,
+    )
+
+
+def _open_text(path: str, mode: str = "r"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Merger:
+    def __init__(self, shards: Sequence[str], chunk_rows: int = 200_000) -> None:
+        self.shards = list(shards)
+        self.chunk_rows = max(1, chunk_rows)
+        self.rows_in = 0
+        self.bad_lines = 0
+        self.duplicates = 0
+        self.rows_out = 0
+        self.spilled_runs = 0
+        self.per_shard: Dict[str, int] = {}
+
+    def _chunks(self, shard_idx: int, path: str) -> Iterator[List[Tuple[Key, str]]]:
+        chunk: List[Tuple[Key, str]] = []
+        n = 0
+        with _open_text(path) as f:
+            for line_no, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    self.bad_lines += 1
+                    print(f"[compact] {path}:{line_no + 1}: not valid JSON (truncated write?); skipped", file=sys.stderr)
+                    continue
+                chunk.append((_key(row, shard_idx, line_no), line))
+                n += 1
+                if len(chunk) >= self.chunk_rows:
+                    yield chunk
+                    chunk = []
+        self.per_shard[path] = n
+        self.rows_in += n
+        if chunk:
+            yield chunk
+
+    def _spill(self, chunk: List[Tuple[Key, str]], tmp: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=".run", dir=tmp)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for key, line in chunk:
+                f.write(json.dumps(key, ensure_ascii=False) + "\t" + line + "\n")
+        self.spilled_runs += 1
+        return path
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple[Key, str]]:
+        with open(path, "r", encoding="utf-8") as f:
+            for ln in f:
+                key, line = ln.rstrip("\n").split("\t", 1)
+                yield tuple(json.loads(key)), line
+
+    def merged(self, tmp: str) -> Iterator[str]:
+        """Deduplicated run lines in (config_id, question_id, run_id) order."""
+        runs: List[Iterator[Tuple[Key, str]]] = []
+        pending: Optional[List[Tuple[Key, str]]] = None
+        for i, path in enumerate(self.shards):
+            for chunk in self._chunks(i, path):
+                chunk.sort()
+                if pending is not None:
+                    runs.append(self._read_run(self._spill(pending, tmp)))
+                pending = chunk
+        if pending is not None:
+            runs.append(iter(pending))  # the last chunk is merged from memory
+
+        prev_id: Optional[Tuple[str, str, str]] = None
+        best: Optional[str] = None
+        for key, line in heapq.merge(*runs):
+            rid = key[:3]
+            if rid != prev_id:
+                if best is not None:
+                    self.rows_out += 1
+                    yield best
+                prev_id = rid
+            else:
+                self.duplicates += 1
+            best = line  # ascending rank within a run_id: the last copy is the best
+        if best is not None:
+            self.rows_out += 1
+            yield best
+
+
+# ============================================================
+# Writers
+# ============================================================
+
+
+def _write_lines(lines: Iterator[str], path: str) -> None:
+    with _open_text(path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def _arrow_type(pa, kinds: set):
+    kinds = kinds - {type(None)}
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds == {int}:
+        return pa.int64()
+    if kinds and kinds <= {int, float}:
+        return pa.float64()
+    return pa.string()
+
+
+def _write_parquet(staged: str, path: str, chunk_rows: int) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise SystemExit("--format parquet needs pyarrow (pip install pyarrow).") from e
+
+    # Pass 1: column order and value kinds over every row
+    kinds: Dict[str, set] = {}
+    with open(staged, "r", encoding="utf-8") as f:
+        for line in f:
+            for k, v in json.loads(line).items():
+                kinds.setdefault(k, set()).add(type(v))
+    schema = pa.schema([(k, _arrow_type(pa, ks)) for k, ks in kinds.items()])
+    as_json = {f.name for f in schema if pa.types.is_string(f.type) and kinds[f.name] - {str, type(None)}}
+
+    def cell(name: str, v: Any) -> Any:
+        if v is None:
+            return None
+        if name in as_json and not isinstance(v, str):
+            return json.dumps(v, ensure_ascii=False)
+        return v
+
+    # Pass 2: one row group per chunk
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer, open(staged, "r", encoding="utf-8") as f:
+        batch: List[Dict[str, Any]] = []
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) >= chunk_rows:
+                cols = {n: [cell(n, r.get(n)) for r in batch] for n in schema.names}
+                writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+                batch = []
+        if batch:
+            cols = {n: [cell(n, r.get(n)) for r in batch] for n in schema.names}
+            writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+
+
+def compact(
+    shards: Sequence[str], out: str, fmt: str = "jsonl", chunk_rows: int = 200_000, tmp_dir: Optional[str] = None
+) -> Merger:
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    merger = Merger(shards, chunk_rows=chunk_rows)
+    tmp = tempfile.mkdtemp(prefix="compact-", dir=tmp_dir or os.path.dirname(out) or ".")
+    try:
+        partial = out + ".tmp"
+        if fmt == "parquet":
+            staged = os.path.join(tmp, "merged.jsonl")
+            _write_lines(merger.merged(tmp), staged)
+            _write_parquet(staged, partial, chunk_rows)
+        else:
+            _write_lines(merger.merged(tmp), partial if fmt == "jsonl" else partial + ".gz")
+            if fmt == "jsonl.gz":
+                os.replace(partial + ".gz", partial)
+        os.replace(partial, out)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return merger
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Merge run shards into one deduplicated, sorted run file.")
+    ap.add_argument("--in", dest="inputs", nargs="+", required=True, help="Shard paths or globs (.jsonl / .jsonl.gz).")
+    ap.add_argument("--out", required=True, help="Output path.")
+    ap.add_argument("--format", choices=["jsonl", "jsonl.gz", "parquet"], default=None, help="Default: from --out's extension.")
+    ap.add_argument("--chunk-rows", type=int, default=200_000, help="Rows held in memory per sorted run.")
+    ap.add_argument("--tmp-dir", default=None, help="Where sorted runs are spilled (default: next to --out).")
+    ap.add_argument("--delete-shards", action="store_true", help="Remove the input shards after a successful merge.")
+    args = ap.parse_args()
+
+    shards: List[str] = []
+    for pat in args.inputs:
+        hits = sorted(glob.glob(pat)) or ([pat] if os.path.exists(pat) else [])
+        shards += [h for h in hits if os.path.abspath(h) != os.path.abspath(args.out) and h not in shards]
+    if not shards:
+        raise SystemExit(f"No shards match: {' '.join(args.inputs)}")
+
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "jsonl.gz" if args.out.endswith(".gz") else "jsonl")
+    t0 = time.perf_counter()
+    m = compact(shards, args.out, fmt=fmt, chunk_rows=args.chunk_rows, tmp_dir=args.tmp_dir)
+
+    for path in shards:
+        print(f"  {path}: {m.per_shard.get(path, 0)} rows")
+    print(
+        f"Merged {len(shards)} shards: {m.rows_in} rows in, {m.duplicates} duplicate run_ids dropped, "
+        f"{m.bad_lines} bad lines skipped, {m.rows_out} rows out ({m.spilled_runs} spilled runs, "
+        f"{time.perf_counter() - t0:.2f}s)"
+    )
+    print(f"Wrote: {args.out} ({fmt})")
+    if args.delete_shards:
+        for path in shards:
+            os.remove(path)
+        print(f"Removed {len(shards)} shards")
+
+
+if __name__ == "__main__":
+    main()
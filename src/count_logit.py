@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from typing import Tuple
+
+import pandas as pd
+
+from src.answer_counts import AnswerCounts
+from src.logit_fit import MODEL_TYPES, fit_models
+
+
+# ============================================================
+# Binomial logit on aggregated (successes, trials) cells
+# ============================================================
+#
+# Equivalent to fitting
+#     correct ~ C(treatment) [+|*] temp
+# on the run-level frame from expand_to_run_level(), with SEs clustered by
+# question_id, but without materializing k binary rows per cell.
+#
+# For a cell c with n_c trials, y_c successes and fitted p_c:
+#   - the log-likelihood gradient is x_c * (y_c - n_c p_c), which is exactly the
+#     sum of the n_c run-level score contributions of that cell;
+#   - the Hessian weight is n_c p_c (1 - p_c).
+# So summing cell scores within question_id gives the same cluster meat as the
+# expanded fit, and the small-sample correction uses N = sum(n_c) runs.
+# The fitting itself lives in src.logit_fit.
+
+
+def set_t0_baseline(df: pd.DataFrame) -> pd.DataFrame:
+    if "T0" in set(df["treatment"].astype(str)):
+        df["treatment"] = pd.Categorical(df["treatment"].astype(str))
+        cats = list(df["treatment"].cat.categories)
+        cats = ["T0"] + [c for c in cats if c != "T0"]
+        df["treatment"] = df["treatment"].cat.reorder_categories(cats, ordered=False)
+    return df
+
+
+def prepare_cells(df_perq: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep one row per (config, question) cell with integer successes/k_runs.
+    """
+    use_cols = ["config_id", "question_id", "treatment", "temp", "k_runs", "successes"]
+    cells = df_perq[use_cols].copy()
+    cells["k_runs"] = cells["k_runs"].astype(int)
+    cells["successes"] = cells["successes"].astype(int).clip(lower=0, upper=cells["k_runs"])
+    cells["temp"] = cells["temp"].astype(float)
+    cells = cells[cells["k_runs"] > 0].reset_index(drop=True)
+    return set_t0_baseline(cells)
+
+
+def split_config_id(config_id: str) -> Tuple[str, float]:
+    # expects: T0_temp0.2 (design plans may append _topp0.9 / _max128 / _model-x)
+    if isinstance(config_id, str) and "_temp" in config_id:
+        t, temp = config_id.split("_temp", 1)
+        try:
+            return t, float(temp.split("_", 1)[0])
+        except ValueError:
+            return t, float("nan")
+    return str(config_id), float("nan")
+
+
+def read_per_question_cells(per_question_csv: str) -> pd.DataFrame:
+    """
+    Read an analyze_results per-question CSV straight into prepare_cells() form
+    (same successes = round(accuracy * k) reconstruction as the analysis scripts).
+    An answer-count .npz gives the exact successes instead.
+    """
+    if per_question_csv.endswith(".npz"):
+        return prepare_cells(AnswerCounts.load(per_question_csv).per_question_frame())
+
+    df = pd.read_csv(per_question_csv)
+
+    tt = df["config_id"].apply(lambda x: split_config_id(str(x)))
+    df["treatment"] = tt.apply(lambda x: x[0])
+    df["temp"] = tt.apply(lambda x: x[1])
+
+    for c in ["k_runs", "accuracy_over_runs"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = df.dropna(subset=["question_id", "temp", "k_runs", "accuracy_over_runs"]).copy()
+    df["k_runs"] = df["k_runs"].astype(int)
+    df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
+    return prepare_cells(df)
+
+
+def fit_logit_from_counts(df_cells: pd.DataFrame, model_type: str):
+    """
+    Question-clustered logit on (successes, k_runs) cells.
+
+    Drop-in replacement for fit_logistic_regression(expand_to_run_level(df), ...):
+    same coefficients, same cluster-robust SE, no run-level rows.
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model_type: {model_type}")
+    fits = fit_models(df_cells, model_types=[model_type], prefix="logit", cov_type="cluster")
+    name = f"logit_{model_type}"
+    return name, fits[name]
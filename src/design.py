@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import time
+import warnings
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+
+# ============================================================
+# Sweep designs: fractions of the config grid
+# ============================================================
+#
+# A design point is one config: treatment x temp, optionally x top_p x
+# max_tokens x model. The runners used to take the full cartesian product.
+# This planner picks a subset of the points that still identifies the terms
+# of the GLMs we fit, and writes it as a plan the runners (and `queue init`)
+# execute. Each chosen point still gets every question x k repeats, so the
+# question-clustered SEs work as before.
+#
+#   full        every point of the grid
+#   fractional  numeric axes at their lowest / highest level (+ --center);
+#               with 3 numeric axes, a 2^(3-1) half fraction (I = ABC) per
+#               treatment [x model], alternating between the two halves
+#               across treatments so the pooled design is still a full 2^3
+#   lhs         Latin hypercube over the numeric ranges (maximin over
+#               --lhs-tries draws), treatments [x models] dealt out evenly;
+#               numeric values can fall between the given levels
+#   dopt        D-optimal subset of --points distinct grid points for the
+#               model matrix (Fedorov exchange from --starts random starts)
+#
+# The model matrix is the GLM's terms, C(treatment) + temp or
+# C(treatment) * temp, plus a main effect for each extra axis that varies.
+# Numeric axes are scaled to [-1, 1] over their levels. Efficiencies use
+# the linear-model information X'X (equal weight per point). That is the
+# usual planning approximation for a logit whose accuracies are not yet
+# known.
+#
+# The plan's design_info records, per term: whether it is estimable (its
+# columns are not in the span of the rest), and its SE inflation over the
+# full grid at the same k. It also records the rank, the D-efficiency per
+# point and the call count. analyze_plot_regression --design checks the
+# cells actually collected against it, and fits only the models that are
+# estimable.
+
+NUMERIC_AXES = ("temp", "top_p", "max_tokens")
+EXTRA_AXES = ("top_p", "max_tokens", "model")
+MODEL_TYPES = ("additive", "interaction")
+METHODS = ("full", "fractional", "lhs", "dopt")
+
+# config_id suffix per extra axis (only added when the axis varies)
+SUFFIX = {"top_p": "_topp", "max_tokens": "_max", "model": "_model-"}
+
+
+def ordered_levels(treatments: Sequence[str]) -> List[str]:
+    """T0 first (baseline), rest sorted, as in src.logit_fit."""
+    levels = sorted(set(str(t) for t in treatments))
+    if "T0" in levels:
+        levels = ["T0"] + [t for t in levels if t != "T0"]
+    return levels
+
+
+def varying(levels: Dict[str, list]) -> List[str]:
+    return [a for a in ("treatment", "temp") + EXTRA_AXES if len(levels.get(a) or []) > 1]
+
+
+def config_id_for(point: Dict[str, Any], levels: Dict[str, list]) -> str:
+    """T0_temp0.2 as before; varying extra axes append _topp0.9 / _max128 / _model-<name>."""
+    cid = f"{point['treatment']}_temp{point['temp']}"
+    for a in EXTRA_AXES:
+        if len(levels.get(a) or []) > 1:
+            cid += f"{SUFFIX[a]}{point[a]}"
+    return cid
+
+
+def _point(values: Dict[str, Any], levels: Dict[str, list]) -> Dict[str, Any]:
+    p = {"treatment": values["treatment"], "temp": float(values["temp"])}
+    if levels.get("top_p"):
+        p["top_p"] = float(values["top_p"])
+    if levels.get("max_tokens"):
+        p["max_tokens"] = int(values["max_tokens"])
+    if levels.get("model"):
+        p["model"] = str(values["model"])
+    p["config_id"] = config_id_for(p, levels)
+    return p
+
+
+def _axes(levels: Dict[str, list]) -> List[str]:
+    return ["treatment", "temp"] + [a for a in EXTRA_AXES if levels.get(a)]
+
+
+# ============================================================
+# Model matrix + design evaluation
+# ============================================================
+
+
+def model_matrix(points: Sequence[Dict[str, Any]], levels: Dict[str, list], model_type: str):
+    """(X, {term: [column indices]}) for the planning model; numeric axes scaled to [-1, 1]."""
+    import numpy as np
+
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model_type: {model_type}")
+
+    def scaled(axis: str) -> np.ndarray:
+        lv = [float(x) for x in levels[axis]]
+        lo, hi = min(lv), max(lv)
+        v = np.array([float(p[axis]) for p in points])
+        return (2.0 * (v - lo) / (hi - lo) - 1.0) if hi > lo else np.zeros(len(points))
+
+    cols: List[np.ndarray] = [np.ones(len(points))]
+    terms: Dict[str, List[int]] = {"Intercept": [0]}
+
+    def add(term: str, new: List[np.ndarray]) -> None:
+        terms[term] = list(range(len(cols), len(cols) + len(new)))
+        cols.extend(new)
+
+    tr = ordered_levels(levels["treatment"])
+    dummies = [np.array([1.0 if p["treatment"] == t else 0.0 for p in points]) for t in tr[1:]]
+    temp = scaled("temp")
+    if dummies:
+        add("C(treatment)", dummies)
+    add("temp", [temp])
+    if model_type == "interaction" and dummies:
+        add("C(treatment):temp", [d * temp for d in dummies])
+    for a in ("top_p", "max_tokens"):
+        if len(levels.get(a) or []) > 1:
+            add(a, [scaled(a)])
+    models = levels.get("model") or []
+    if len(models) > 1:
+        add("C(model)", [np.array([1.0 if p["model"] == m else 0.0 for p in points]) for m in models[1:]])
+    return np.column_stack(cols), terms
+
+
+def _rank(X) -> int:
+    import numpy as np
+
+    return int(np.linalg.matrix_rank(X)) if X.size else 0
+
+
+def design_info(
+    points: Sequence[Dict[str, Any]], levels: Dict[str, list], model_type: str, n_items: Optional[int] = None, k: int = 1
+) -> Dict[str, Any]:
+    import numpy as np
+
+    full = full_grid(levels)
+    X, terms = model_matrix(points, levels, model_type)
+    Xf, _ = model_matrix(full, levels, model_type)
+    p = X.shape[1]
+    rank = _rank(X)
+
+    se = se_full = None
+    if rank == p:
+        se = np.sqrt(np.diag(np.linalg.inv(X.T @ X)))
+        se_full = np.sqrt(np.diag(np.linalg.pinv(Xf.T @ Xf)))
+
+    per_term = {}
+    for term, idx in terms.items():
+        rest = [j for j in range(p) if j not in idx]
+        est = rank - _rank(X[:, rest]) == len(idx)
+        rec: Dict[str, Any] = {"columns": len(idx), "estimable": bool(est)}
+        if se is not None:
+            rec["se_inflation"] = round(float(np.max(se[idx] / se_full[idx])), 4)
+        per_term[term] = rec
+
+    d_eff = None
+    if rank == p:
+        _, ld = np.linalg.slogdet(X.T @ X / len(points))
+        _, ldf = np.linalg.slogdet(Xf.T @ Xf / len(full))
+        d_eff = round(float(np.exp((ld - ldf) / p)), 4)
+
+    info: Dict[str, Any] = {
+        "model_type": model_type,
+        "n_points": len(points),
+        "n_full_points": len(full),
+        "n_params": p,
+        "rank": rank,
+        "estimable": rank == p,
+        "d_efficiency_per_point": d_eff,
+        "terms": per_term,
+    }
+    if n_items:
+        info["calls"] = len(points) * n_items * k
+        info["full_calls"] = len(full) * n_items * k
+        info["call_fraction"] = round(len(points) / len(full), 4)
+    return info
+
+
+# ============================================================
+# Designs
+# ============================================================
+
+
+def full_grid(levels: Dict[str, list]) -> List[Dict[str, Any]]:
+    axes = _axes(levels)
+    return [_point(dict(zip(axes, combo)), levels) for combo in itertools.product(*(levels[a] for a in axes))]
+
+
+def fractional(levels: Dict[str, list], center: bool = False) -> List[Dict[str, Any]]:
+    numeric = [a for a in NUMERIC_AXES if len(levels.get(a) or []) > 1]
+    cats = [a for a in ("treatment", "model") if levels.get(a)]
+    ends = {a: (min(levels[a]), max(levels[a])) for a in numeric}
+    corners = list(itertools.product((-1, 1), repeat=len(numeric)))
+    halves = [corners]
+    if len(numeric) == 3:
+        halves = [[c for c in corners if c[0] * c[1] * c[2] == s] for s in (1, -1)]
+
+    points = []
+    for i, combo in enumerate(itertools.product(*(levels[a] for a in cats))):
+        base = dict(zip(cats, combo))
+        for a in NUMERIC_AXES:
+            if levels.get(a) and a not in numeric:
+                base[a] = levels[a][0]
+        for c in halves[i % len(halves)]:
+            v = dict(base, **{a: ends[a][0] if s < 0 else ends[a][1] for a, s in zip(numeric, c)})
+            points.append(_point(v, levels))
+        if center and numeric:
+            v = dict(base, **{a: _mid(levels[a]) for a in numeric})
+            points.append(_point(v, levels))
+    return points
+
+
+def _mid(lv: Sequence[Any]) -> Any:
+    s = sorted(lv)
+    return s[len(s) // 2]
+
+
+def _round_axis(axis: str, v: float) -> Any:
+    return int(round(v)) if axis == "max_tokens" else round(v, 2)
+
+
+def latin_hypercube(levels: Dict[str, list], n: int, seed: int = 0, tries: int = 20) -> List[Dict[str, Any]]:
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    numeric = [a for a in NUMERIC_AXES if len(levels.get(a) or []) > 1]
+    cats = [a for a in ("treatment", "model") if levels.get(a)]
+    combos = list(itertools.product(*(levels[a] for a in cats)))
+
+    best, best_score = None, -1.0
+    for _ in range(max(1, tries)):
+        u = np.column_stack([(rng.permutation(n) + rng.random(n)) / n for _ in numeric]) if numeric else np.zeros((n, 0))
+        # maximin: the smallest pairwise distance in the unit cube
+        score = float("inf")
+        if len(numeric) and n > 1:
+            d = np.sqrt(((u[:, None, :] - u[None, :, :]) ** 2).sum(-1))
+            score = float(d[np.triu_indices(n, 1)].min())
+        if score > best_score:
+            best, best_score = u, score
+
+    order: List[int] = []
+    while len(order) < n:
+        order += list(rng.permutation(len(combos)))
+    points, seen = [], set()
+    for i in range(n):
+        v = dict(zip(cats, combos[order[i]]))
+        for j, a in enumerate(numeric):
+            lo, hi = float(min(levels[a])), float(max(levels[a]))
+            v[a] = _round_axis(a, lo + best[i, j] * (hi - lo))
+        for a in NUMERIC_AXES:
+            if levels.get(a) and a not in numeric:
+                v[a] = levels[a][0]
+        p = _point(v, levels)
+        if p["config_id"] not in seen:  # rounding can collide
+            seen.add(p["config_id"])
+            points.append(p)
+    return points
+
+
+def d_optimal(
+    levels: Dict[str, list], n: int, model_type: str, seed: int = 0, starts: int = 5, max_iter: int = 2000
+) -> List[Dict[str, Any]]:
+    import numpy as np
+
+    cands = full_grid(levels)
+    Xc, _ = model_matrix(cands, levels, model_type)
+    C, p = Xc.shape
+    if n >= C:
+        return cands
+    if n < p:
+        raise ValueError(f"--points {n} is below the {p} parameters of the {model_type} model.")
+
+    rng = np.random.default_rng(seed)
+    best_idx, best_ld = None, -np.inf
+    for _ in range(max(1, starts)):
+        S = list(rng.choice(C, size=n, replace=False))
+        for _ in range(max_iter):
+            Xs = Xc[S]
+            Minv = np.linalg.inv(Xs.T @ Xs + 1e-9 * np.eye(p))
+            out = np.setdiff1d(np.arange(C), S)
+            d_in = np.einsum("ij,jk,ik->i", Xs, Minv, Xs)
+            d_out = np.einsum("ij,jk,ik->i", Xc[out], Minv, Xc[out])
+            d_cross = Xs @ Minv @ Xc[out].T
+            # det ratio of swapping design point i for candidate j
+            delta = (1.0 - d_in)[:, None] * (1.0 + d_out)[None, :] + d_cross**2
+            i, j = np.unravel_index(np.argmax(delta), delta.shape)
+            if delta[i, j] <= 1.0 + 1e-9:
+                break
+            S[i] = int(out[j])
+        sign, ld = np.linalg.slogdet(Xc[S].T @ Xc[S])
+        if sign > 0 and ld > best_ld:
+            best_idx, best_ld = sorted(S), ld
+    if best_idx is None:
+        raise ValueError("No nonsingular design found; increase --points.")
+    return [cands[i] for i in best_idx]
+
+
+# Default lhs / dopt size: model parameters + this many points
+DEFAULT_EXTRA_POINTS = 4
+
+
+def make_design(method: str, levels: Dict[str, list], model_type: str, n: Optional[int], seed: int, **kw: Any):
+    if method == "full":
+        return full_grid(levels)
+    if method == "fractional":
+        return fractional(levels, center=kw.get("center", False))
+    X, _ = model_matrix(full_grid(levels)[:1], levels, model_type)
+    n_grid, p = len(full_grid(levels)), X.shape[1]
+    # A few points past the parameter count leave some degrees of freedom
+    # without spending most of the grid; never the whole grid by default
+    n = n or max(p, min(p + DEFAULT_EXTRA_POINTS, n_grid - 1))
+    if n >= n_grid:
+        warnings.warn(
+            f"{method} with {n} points is no smaller than the full grid ({n_grid} points); "
+            "it saves no calls over --method full.",
+            stacklevel=2,
+        )
+    if method == "lhs":
+        return latin_hypercube(levels, n, seed=seed, tries=kw.get("lhs_tries", 20))
+    if method == "dopt":
+        return d_optimal(levels, n, model_type, seed=seed, starts=kw.get("starts", 5))
+    raise ValueError(f"Unknown design method: {method}")
+
+
+# ============================================================
+# Plans: what the runners execute
+# ============================================================
+
+
+def load_plan(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if not plan.get("points"):
+        raise ValueError(f"Plan {path} has no points.")
+    return plan
+
+
+def plan_treatments(plan: Dict[str, Any]) -> List[str]:
+    return ordered_levels([p["treatment"] for p in plan["points"]])
+
+
+def plan_units(
+    plan: Dict[str, Any], items: Sequence[Dict[str, Any]], model: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Work units of a plan in point x question x repeat order, shaped like
+    src.work_queue.grid_units plus the point's top_p / max_tokens / model.
+    With a model axis, only the points for `model` (name or file basename).
+    """
+    k = int(plan.get("k", 1))
+    for point in plan["points"]:
+        if model is not None and "model" in point and point["model"] not in (model, os.path.basename(model)):
+            continue
+        extra = {a: point[a] for a in EXTRA_AXES if a in point}
+        for item in items:
+            for r in range(k):
+                yield {
+                    "run_id": f"{point['config_id']}__{item['id']}__r{r}",
+                    "config_id": point["config_id"],
+                    "treatment": point["treatment"],
+                    "temperature": float(point["temp"]),
+                    "question_id": item["id"],
+                    "rep": r,
+                    **extra,
+                }
+
+
+def add_plan_args(ap) -> None:
+    ap.add_argument(
+        "--plan",
+        default=None,
+        help="Design plan from `stat496 design` (src.design): run its points instead of treatments x temps x k.",
+    )
+
+
+def _levels_arg(values: Optional[Sequence[str]], cast) -> list:
+    out = []
+    for v in values or []:
+        for x in str(v).split(","):
+            if x.strip():
+                out.append(cast(x.strip()))
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Plan a fractional / space-filling / D-optimal sweep.")
+    ap.add_argument("--treatments", nargs="+", default=["T0", "T1", "T2", "T3", "T4", "T5"])
+    ap.add_argument("--temps", nargs="+", default=["0.2", "0.5", "0.7", "1.0"], help="Temperature levels (space or comma separated).")
+    ap.add_argument("--top-p", nargs="+", default=None, help="top_p levels (adds an axis when more than one).")
+    ap.add_argument("--max-tokens", nargs="+", default=None, help="max_tokens levels.")
+    ap.add_argument("--models", nargs="+", default=None, help="Model names / GGUF basenames (one runner per model).")
+    ap.add_argument("--method", choices=METHODS, default="dopt")
+    ap.add_argument("--model-type", choices=MODEL_TYPES, default="interaction", help="GLM whose terms must stay estimable.")
+    ap.add_argument("--points", type=int, default=None, help="Design points for lhs / dopt (default: parameters + 4, below the grid size).")
+    ap.add_argument("--center", action="store_true", help="fractional: add a center point per treatment [x model].")
+    ap.add_argument("--lhs-tries", type=int, default=20)
+    ap.add_argument("--starts", type=int, default=5, help="dopt: random starts.")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dataset", default=None, help="JSONL dataset, to report call counts.")
+    ap.add_argument("--k", type=int, default=1, help="Repeats per (question, point).")
+    ap.add_argument("--out", default="outputs/plan.json")
+    args = ap.parse_args()
+
+    levels: Dict[str, list] = {
+        "treatment": ordered_levels(args.treatments),
+        "temp": sorted(set(_levels_arg(args.temps, float))),
+    }
+    if args.top_p:
+        levels["top_p"] = sorted(set(_levels_arg(args.top_p, float)))
+    if args.max_tokens:
+        levels["max_tokens"] = sorted(set(_levels_arg(args.max_tokens, int)))
+    if args.models:
+        levels["model"] = list(dict.fromkeys(_levels_arg(args.models, str)))
+
+    n_items = None
+    if args.dataset:
+        from src.data_io import iter_dataset_items
+
+        n_items = sum(1 for _ in iter_dataset_items(args.dataset))
+
+    points = make_design(
+        args.method, levels, args.model_type, args.points, args.seed,
+        center=args.center, lhs_tries=args.lhs_tries, starts=args.starts,
+    )
+    info = design_info(points, levels, args.model_type, n_items=n_items, k=args.k)
+    plan = {
+        "method": args.method,
+        "model_type": args.model_type,
+        "levels": levels,
+        "varying": varying(levels),
+        "k": args.k,
+        "seed": args.seed,
+        "dataset": args.dataset,
+        "n_items": n_items,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "design_info": info,
+        "points": points,
+    }
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+
+    print(
+        f"{args.method}: {info['n_points']} of {info['n_full_points']} points; {args.model_type} model "
+        f"rank {info['rank']}/{info['n_params']}; D-efficiency per point {info['d_efficiency_per_point']}"
+    )
+    if n_items:
+        print(f"calls: {info['calls']} of {info['full_calls']} ({100 * info['call_fraction']:.1f}%) at k={args.k}")
+    print(f"{'term':<20} {'cols':>4} {'estimable':>9} {'SE x full':>9}")
+    for term, rec in info["terms"].items():
+        print(f"{term:<20} {rec['columns']:>4} {str(rec['estimable']):>9} {rec.get('se_inflation', ''):>9}")
+    print(f"Wrote plan: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,11 @@ from __future__ import annotations
 import argparse
 import csv
 import json
+import itertools
 import os
 import random
 from collections import Counter
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 IDX_TO_LETTER = {0: "A", 1: "B", 2: "C", 3: "D"}
 
@@ -30,6 +31,60 @@ def get_label_index(row: Dict[str, str]) -> Optional[int]:
     return None
 
 
+def iter_csv_rows(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def count_csv_rows(path: str) -> int:
+    """
+    Number of records csv.DictReader yields (quoted fields may span lines;
+    blank lines are skipped).
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # header
+        return sum(1 for row in reader if row)
+
+
+def sample_rows_exact(path: str, n: int, rng: random.Random) -> List[Tuple[int, Dict[str, str]]]:
+    """
+    Same rows, in the same order, as random.sample(list(enumerate(rows)), n)
+    with the same RNG state: random.sample picks positions from len(population)
+    alone, so sampling range(n_rows) after a counting pass selects identical
+    indices. A second pass keeps only those rows.
+    """
+    n_rows = count_csv_rows(path)
+    picks = rng.sample(range(n_rows), min(n, n_rows))
+    slot = {idx: i for i, idx in enumerate(picks)}
+    out: List[Optional[Tuple[int, Dict[str, str]]]] = [None] * len(picks)
+    for idx, row in enumerate(iter_csv_rows(path)):
+        i = slot.get(idx)
+        if i is not None:
+            out[i] = (idx, row)
+    return [x for x in out if x is not None]
+
+
+def reservoir_sample(
+    rows: Iterable[Dict[str, str]], n: int, rng: random.Random
+) -> List[Tuple[int, Dict[str, str]]]:
+    """
+    Single-pass uniform sample of n rows (Algorithm R), for sources that can
+    only be read once. A different draw from --sample-random's default mode.
+    """
+    if not n or n <= 0:
+        raise ValueError("--reservoir needs --n > 0")
+    res: List[Tuple[int, Dict[str, str]]] = []
+    for idx, row in enumerate(rows):
+        if idx < n:
+            res.append((idx, row))
+        else:
+            j = rng.randrange(idx + 1)
+            if j < n:
+                res[j] = (idx, row)
+    return res
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in-csv", required=True, help="Input CSV path (must have answer0..answer3 and label_index/label).")
@@ -39,31 +94,32 @@ def main() -> None:
     ap.add_argument("--id-prefix", default="BLOG", help="Prefix used to build clean ids, e.g. COSMOS_Q -> COSMOS_Q01.")
     ap.add_argument("--sample-random", action="store_true", help="Randomly sample N rows instead of taking a slice.")
     ap.add_argument("--seed", type=int, default=42, help="Random seed for reproducible sampling.")
+    ap.add_argument(
+        "--reservoir",
+        action="store_true",
+        help="With --sample-random --n: one pass over the CSV (reservoir sampling). "
+        "Uniform, but not the same rows as the default two-pass mode for a given seed.",
+    )
     args = ap.parse_args()
 
     os.makedirs(os.path.dirname(args.out_jsonl) or ".", exist_ok=True)
 
     items: List[Dict[str, Any]] = []
-    with open(args.in_csv, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        all_rows = list(reader)
 
-    # choose rows
+    # choose rows (streamed: memory is O(selected rows), not O(csv))
     if args.sample_random:
-        if args.seed is not None:
-            random.seed(args.seed)
-
-        if args.n and args.n > 0:
-            n_take = min(args.n, len(all_rows))
-            selected = random.sample(list(enumerate(all_rows)), n_take)
+        rng = random.Random(args.seed)
+        if args.reservoir:
+            selected = reservoir_sample(iter_csv_rows(args.in_csv), args.n, rng)
+        elif args.n and args.n > 0:
+            selected = sample_rows_exact(args.in_csv, args.n, rng)
         else:
-            selected = list(enumerate(all_rows))
-            random.shuffle(selected)
+            # a full shuffle writes every row, so holding them all is the output size anyway
+            selected = list(enumerate(iter_csv_rows(args.in_csv)))
+            rng.shuffle(selected)
     else:
-        sliced = all_rows[args.start:]
-        if args.n and args.n > 0:
-            sliced = sliced[:args.n]
-        selected = [(args.start + i, row) for i, row in enumerate(sliced)]
+        stop = args.start + args.n if args.n and args.n > 0 else None
+        selected = list(itertools.islice(enumerate(iter_csv_rows(args.in_csv)), args.start, stop))
 
     # first pass: collect ids, but we will force uniqueness
     raw_ids = []
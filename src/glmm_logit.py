@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import time
+import warnings
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import optimize
+from scipy.special import expit, gammaln, logsumexp
+
+from src.analyze_plot_regression import save_coef_table
+from src.count_logit import read_per_question_cells
+from src.logit_fit import MODEL_TYPES, LogitFit, TextSummary, TreatmentTempDesign, fit_models
+
+
+# ============================================================
+# Random-intercept binomial logit (GLMM) on per-question counts
+# ============================================================
+#
+#     successes_qc ~ Binomial(k_qc, p_qc)
+#     logit(p_qc)  = x_c' beta + u_q,    u_q ~ N(0, sigma^2)
+#
+# Marginal likelihood by adaptive Gauss-Hermite quadrature (nagq=1 is the
+# Laplace approximation). The random effects are one scalar per question, so
+# the u-block of the joint Hessian is diagonal: all question modes are found
+# together by elementwise Newton steps, and every per-question sum is a
+# bincount over cells. Memory and time are O(cells), so thousands of
+# questions are fine.
+
+
+def _expit(eta: np.ndarray) -> np.ndarray:
+    return expit(eta)
+
+
+class RandomInterceptLogit:
+    def __init__(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        n: np.ndarray,
+        qcodes: np.ndarray,
+        n_groups: int,
+        nagq: int = 1,
+    ) -> None:
+        self.X = X
+        self.y = y
+        self.n = n
+        self.q = qcodes
+        self.G = n_groups
+        self.nagq = int(nagq)
+        self.nodes, self.weights = np.polynomial.hermite.hermgauss(self.nagq)
+        self.log_binom = float(np.sum(gammaln(n + 1) - gammaln(y + 1) - gammaln(n - y + 1)))
+        self.u_hat = np.zeros(n_groups)
+
+    def _qsum(self, v: np.ndarray) -> np.ndarray:
+        return np.bincount(self.q, weights=v, minlength=self.G)
+
+    def _penalized(self, eta0: np.ndarray, u: np.ndarray, sigma2: float) -> np.ndarray:
+        """Per-question log-likelihood + log-prior kernel h(u), concave in u."""
+        eta = eta0 + u[self.q]
+        return self._qsum(self.y * eta - self.n * np.logaddexp(0.0, eta)) - 0.5 * u**2 / sigma2
+
+    def _modes(self, eta0: np.ndarray, sigma2: float, maxiter: int = 100, tol: float = 1e-10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posterior modes u_hat and curvatures -h''(u_hat) for all questions (vectorized Newton).
+
+        Each question's step is halved until h(u) increases: for questions at 0% /
+        100% accuracy with a large sigma the full Newton step overshoots and
+        the plain iteration diverges.
+        """
+        u = self.u_hat.copy()
+        f = self._penalized(eta0, u, sigma2)
+        for _ in range(maxiter):
+            p = _expit(eta0 + u[self.q])
+            g = self._qsum(self.y - self.n * p) - u / sigma2
+            h = self._qsum(self.n * p * (1.0 - p)) + 1.0 / sigma2
+            step = g / h
+            if np.max(np.abs(step)) < tol:
+                u = u + step  # the Laplace scale depends on u_hat to first order: take the last (tiny) step too
+                break
+            t = np.ones_like(u)
+            for _ in range(50):
+                f_new = self._penalized(eta0, u + t * step, sigma2)
+                worse = f_new < f - 1e-12 * (1.0 + np.abs(f))
+                if not worse.any():
+                    break
+                t[worse] *= 0.5
+            u = u + t * step
+            f = self._penalized(eta0, u, sigma2)
+        else:
+            warnings.warn(
+                f"Random-effect mode search stopped after {maxiter} Newton steps "
+                f"(sigma={np.sqrt(sigma2):.3g}, max step {np.max(np.abs(step)):.3g})",
+                RuntimeWarning,
+            )
+        p = _expit(eta0 + u[self.q])
+        h = self._qsum(self.n * p * (1.0 - p)) + 1.0 / sigma2
+        self.u_hat = u
+        return u, h
+
+    def loglik(self, beta: np.ndarray, log_sigma: float) -> float:
+        sigma2 = float(np.exp(2.0 * log_sigma))
+        eta0 = self.X @ beta
+        u_hat, curv = self._modes(eta0, sigma2)
+        scale = np.sqrt(2.0 / curv)
+
+        # log of integrand at each node, per question: (nagq, G)
+        terms = []
+        for z, w in zip(self.nodes, self.weights):
+            u = u_hat + scale * z
+            eta = eta0 + u[self.q]
+            ll = self._qsum(self.y * eta - self.n * np.logaddexp(0.0, eta))
+            log_prior = -0.5 * u**2 / sigma2 - 0.5 * np.log(2.0 * np.pi * sigma2)
+            terms.append(np.log(w) + z**2 + ll + log_prior)
+        per_q = logsumexp(np.vstack(terms), axis=0) + np.log(scale)
+        return float(per_q.sum() + self.log_binom)
+
+    def negloglik(self, theta: np.ndarray) -> float:
+        return -self.loglik(theta[:-1], theta[-1])
+
+
+def _numeric_hessian(f, x: np.ndarray, rel_step: float = 1e-4) -> np.ndarray:
+    k = len(x)
+    h = rel_step * np.maximum(np.abs(x), 1.0)
+    H = np.zeros((k, k))
+    f0 = f(x)
+    for i in range(k):
+        ei = np.zeros(k)
+        ei[i] = h[i]
+        H[i, i] = (f(x + ei) - 2.0 * f0 + f(x - ei)) / h[i] ** 2
+        for j in range(i):
+            ej = np.zeros(k)
+            ej[j] = h[j]
+            H[i, j] = H[j, i] = (
+                f(x + ei + ej) - f(x + ei - ej) - f(x - ei + ej) + f(x - ei - ej)
+            ) / (4.0 * h[i] * h[j])
+    return H
+
+
+class GLMMFit(LogitFit):
+    """
+    LogitFit with the question SD and marginal log-likelihood attached.
+    params/bse are the fixed effects only, so save_coef_table keeps its schema.
+    """
+
+    def __init__(self, sigma: float, sigma_se: float, loglik: float, nagq: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.sigma = sigma
+        self.sigma_se = sigma_se
+        self.loglik = loglik
+        self.nagq = nagq
+
+    def summary(self) -> TextSummary:
+        base = super().summary().as_text().splitlines()
+        method = "Laplace" if self.nagq == 1 else f"adaptive Gauss-Hermite ({self.nagq} nodes)"
+        base[0] = "Random-intercept binomial logit (GLMM) on aggregated (successes, trials) cells"
+        base = [ln.replace("IRLS iterations:", "BFGS iterations:") for ln in base]
+        extra = [
+            f"Random effect:    question_id intercept, sd = {self.sigma:.4f} (se {self.sigma_se:.4f})",
+            f"Approximation:    {method}",
+            f"Log-likelihood:   {self.loglik:.4f}",
+        ]
+        return TextSummary("\n".join(base[:5] + extra + base[5:]))
+
+
+def fit_glmm(
+    df_cells: pd.DataFrame,
+    model_type: str,
+    nagq: int = 1,
+    design: Optional[TreatmentTempDesign] = None,
+) -> Tuple[str, GLMMFit]:
+    """
+    Random-intercept logit for one treatment x temp model. Starts from the
+    pooled count-cell logit and log(sigma) = 0.
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model_type: {model_type}")
+    if design is None:
+        design = TreatmentTempDesign(df_cells["treatment"], df_cells["temp"])
+    name = f"glmm_{model_type}"
+
+    X = design.exog(model_type)
+    y = df_cells["successes"].to_numpy(dtype=float)
+    n = df_cells["k_runs"].to_numpy(dtype=float)
+    qcodes, groups = pd.factorize(df_cells["question_id"].astype(str))
+    model = RandomInterceptLogit(X, y, n, qcodes, len(groups), nagq=nagq)
+
+    beta0 = fit_models(df_cells, model_types=[model_type], cov_type="nonrobust", design=design)
+    beta0 = beta0[f"logit_{model_type}"].params.to_numpy()
+    theta0 = np.append(beta0, 0.0)
+
+    opt = optimize.minimize(model.negloglik, theta0, method="BFGS", options={"gtol": 1e-6, "maxiter": 500})
+    # BFGS reports "precision loss" near an optimum it cannot polish further; only a large gradient means failure
+    gnorm = float(np.max(np.abs(opt.jac)))
+    if not np.isfinite(opt.fun) or (not opt.success and gnorm > 1e-3):
+        raise RuntimeError(f"{name}: optimizer did not converge ({opt.message}; max |gradient| {gnorm:.3g})")
+    theta = opt.x
+    H = _numeric_hessian(model.negloglik, theta)
+    cov_theta = np.linalg.inv(H)
+
+    k = X.shape[1]
+    cols = design.columns(model_type)
+    sigma = float(np.exp(theta[-1]))
+    # delta method for sd = exp(log_sigma)
+    sigma_se = float(sigma * np.sqrt(max(cov_theta[-1, -1], 0.0)))
+
+    res = GLMMFit(
+        sigma=sigma,
+        sigma_se=sigma_se,
+        loglik=-float(opt.fun),
+        nagq=nagq,
+        name=name,
+        model_type=model_type,
+        design=design,
+        params=pd.Series(theta[:k], index=cols),
+        cov=pd.DataFrame(cov_theta[:k, :k], index=cols, columns=cols),
+        cov_type="model-based (GLMM)",
+        nobs=int(n.sum()),
+        n_cells=len(y),
+        n_groups=len(groups),
+        n_iter=int(opt.nit),
+    )
+    return name, res
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results.")
+    ap.add_argument("--out-dir", default="outputs/glmm")
+    ap.add_argument("--models", nargs="+", default=list(MODEL_TYPES), choices=list(MODEL_TYPES))
+    ap.add_argument("--nagq", type=int, default=1, help="Quadrature nodes per question (1 = Laplace).")
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    cells = read_per_question_cells(args.per_question_csv)
+    design = TreatmentTempDesign(cells["treatment"], cells["temp"])
+
+    for model_type in args.models:
+        t0 = time.time()
+        name, res = fit_glmm(cells, model_type, nagq=args.nagq, design=design)
+        save_coef_table(
+            res,
+            os.path.join(args.out_dir, f"{name}_coef.csv"),
+            os.path.join(args.out_dir, f"{name}_summary.txt"),
+        )
+        print(f"Wrote: {name}_coef.csv / {name}_summary.txt (sd={res.sigma:.3f}, {time.time() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
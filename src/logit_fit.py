@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.special import chdtrc, ndtr
+
+
+# ============================================================
+# NumPy binomial logit for the treatment x temp models
+# ============================================================
+#
+# Replaces smf.glm(...) for the two formulas used across the analysis scripts:
+#     additive:    C(treatment) + temp
+#     interaction: C(treatment) * temp
+# The interaction design is built once; the additive design is its leading
+# columns, so both models share one matrix. Column/term names match patsy's,
+# so the coef / Wald / predicted-prob CSVs are unchanged.
+
+MODEL_TYPES = ("additive", "interaction")
+
+
+def ordered_levels(treatments: Iterable[str]) -> List[str]:
+    """
+    Treatment levels in the order the scripts use: T0 first (baseline), rest sorted.
+    """
+    levels = sorted(set(str(t) for t in treatments))
+    if "T0" in levels:
+        levels = ["T0"] + [t for t in levels if t != "T0"]
+    return levels
+
+
+class TreatmentTempDesign:
+    """
+    Interaction design matrix for (treatment, temp) built once per dataset.
+
+    Column order follows patsy:
+        Intercept, C(treatment)[T.x]..., temp, C(treatment)[T.x]:temp...
+    """
+
+    def __init__(self, treatment: Sequence, temp: Sequence, levels: Optional[List[str]] = None) -> None:
+        treatment = pd.Series(treatment).astype(str).to_numpy()
+        self.levels = levels if levels is not None else ordered_levels(treatment)
+        self.others = self.levels[1:]
+        self.X = self.build(treatment, temp)
+
+        L = len(self.others)
+        self._columns = (
+            ["Intercept"]
+            + [f"C(treatment)[T.{t}]" for t in self.others]
+            + ["temp"]
+            + [f"C(treatment)[T.{t}]:temp" for t in self.others]
+        )
+        self._term_slices = {
+            "Intercept": slice(0, 1),
+            "C(treatment)": slice(1, 1 + L),
+            "temp": slice(1 + L, 2 + L),
+            "C(treatment):temp": slice(2 + L, 2 + 2 * L),
+        }
+
+    def build(self, treatment: Sequence, temp: Sequence) -> np.ndarray:
+        treatment = pd.Series(treatment).astype(str).to_numpy()
+        temp = np.asarray(temp, dtype=float)
+        unknown = set(treatment) - set(self.levels)
+        if unknown:
+            raise ValueError(f"Unknown treatment levels: {sorted(unknown)}")
+
+        dummies = (treatment[:, None] == np.asarray(self.others, dtype=object)[None, :]).astype(float)
+        return np.column_stack(
+            [np.ones(len(temp)), dummies, temp, dummies * temp[:, None]]
+        )
+
+    def n_params(self, model_type: str) -> int:
+        L = len(self.others)
+        if model_type == "additive":
+            return 2 + L
+        if model_type == "interaction":
+            return 2 + 2 * L
+        raise ValueError(f"Unknown model_type: {model_type}")
+
+    def columns(self, model_type: str) -> List[str]:
+        return self._columns[: self.n_params(model_type)]
+
+    def term_slices(self, model_type: str) -> Dict[str, slice]:
+        k = self.n_params(model_type)
+        return {t: s for t, s in self._term_slices.items() if s.stop <= k and s.stop > s.start}
+
+    def exog(self, model_type: str) -> np.ndarray:
+        return self.X[:, : self.n_params(model_type)]
+
+
+# ============================================================
+# Fitting
+# ============================================================
+
+def _expit(eta: np.ndarray) -> np.ndarray:
+    return np.clip(1.0 / (1.0 + np.exp(-eta)), 1e-12, 1.0 - 1e-12)
+
+
+def irls_binomial(
+    X: np.ndarray,
+    y: np.ndarray,
+    n: np.ndarray,
+    beta0: np.ndarray | None = None,
+    maxiter: int = 100,
+    tol: float = 1e-10,
+) -> Tuple[np.ndarray, int]:
+    """
+    Binomial logit by iteratively reweighted least squares.
+
+    y = successes, n = trials (both per cell). Returns (beta, n_iter).
+    """
+    if beta0 is None:
+        # statsmodels-style start: mu = (y + 0.5) / (n + 1) on the link scale
+        mu0 = (y + 0.5) / (n + 1.0)
+        eta = np.log(mu0 / (1.0 - mu0))
+    else:
+        eta = X @ np.asarray(beta0, dtype=float)
+
+    beta = np.zeros(X.shape[1])
+    dev_old = np.inf
+    for it in range(1, maxiter + 1):
+        p = _expit(eta)
+        w = n * p * (1.0 - p)
+        z = eta + (y - n * p) / np.where(w > 0, w, 1.0)
+        Xw = X * w[:, None]
+        beta = np.linalg.solve(X.T @ Xw, Xw.T @ z)
+        eta = X @ beta
+
+        p = _expit(eta)
+        dev = -2.0 * np.sum(y * np.log(p) + (n - y) * np.log1p(-p))
+        if abs(dev - dev_old) <= tol * (abs(dev) + 0.1):
+            return beta, it
+        dev_old = dev
+
+    return beta, maxiter
+
+
+def information_inverse(X: np.ndarray, n: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    p = 1.0 / (1.0 + np.exp(-(X @ beta)))
+    w = n * p * (1.0 - p)
+    return np.linalg.inv(X.T @ (X * w[:, None]))
+
+
+def cluster_sandwich(
+    X: np.ndarray,
+    y: np.ndarray,
+    n: np.ndarray,
+    beta: np.ndarray,
+    groups: np.ndarray,
+    nobs: float,
+) -> np.ndarray:
+    """
+    Cluster-robust sandwich covariance from per-cell score contributions.
+
+    Uses the same small-sample correction as statsmodels' cov_type="cluster":
+        G / (G - 1) * (nobs - 1) / (nobs - k_params)
+    """
+    p = 1.0 / (1.0 + np.exp(-(X @ beta)))
+    bread = information_inverse(X, n, beta)
+
+    scores = X * (y - n * p)[:, None]
+    codes, uniq = pd.factorize(pd.Series(groups).astype(str))
+    n_groups = len(uniq)
+    S = np.zeros((n_groups, X.shape[1]))
+    np.add.at(S, codes, scores)
+
+    cov = bread @ (S.T @ S) @ bread
+    k_params = X.shape[1]
+    cov *= n_groups / (n_groups - 1.0) * ((nobs - 1.0) / float(nobs - k_params))
+    return cov
+
+
+class LogitFit:
+    """
+    Fitted logit with the attributes the save_* helpers read
+    (params, bse, pvalues, predict, wald_test_terms, summary).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model_type: str,
+        design: TreatmentTempDesign,
+        params: pd.Series,
+        cov: pd.DataFrame,
+        cov_type: str,
+        nobs: int,
+        n_cells: int,
+        n_groups: Optional[int],
+        n_iter: int,
+        response: str = "correct",
+    ) -> None:
+        self.name = name
+        self.model_type = model_type
+        self.design = design
+        self.params = params
+        self.cov = cov
+        self.cov_type = cov_type
+        self.bse = pd.Series(np.sqrt(np.diag(cov.values)), index=params.index)
+        z = params / self.bse
+        self.pvalues = pd.Series(2.0 * ndtr(-np.abs(z.values)), index=params.index)
+        self.nobs = nobs
+        self.n_cells = n_cells
+        self.n_groups = n_groups
+        self.n_iter = n_iter
+        self.response = response
+
+    @property
+    def formula(self) -> str:
+        return "C(treatment) + temp" if self.model_type == "additive" else "C(treatment) * temp"
+
+    def cov_params(self) -> pd.DataFrame:
+        return self.cov
+
+    def predict(self, exog: pd.DataFrame) -> np.ndarray:
+        X = self.design.build(exog["treatment"], exog["temp"])[:, : len(self.params)]
+        return 1.0 / (1.0 + np.exp(-(X @ self.params.values)))
+
+    def wald_test_terms(self, skip_single: bool = False) -> "WaldTermTable":
+        """
+        Joint chi2 test per formula term, like statsmodels' wald_test_terms.
+        """
+        beta = self.params.values
+        V = self.cov.values
+        rows: List[Dict[str, object]] = []
+        for term, sl in self.design.term_slices(self.model_type).items():
+            idx = np.arange(sl.start, sl.stop)
+            if skip_single and len(idx) == 1:
+                continue
+            b = beta[idx]
+            chi2 = float(b @ np.linalg.solve(V[np.ix_(idx, idx)], b))
+            rows.append(
+                {
+                    "term": term,
+                    "chi2": chi2,
+                    "P>chi2": float(chdtrc(len(idx), chi2)),
+                    "df constraint": len(idx),
+                }
+            )
+        return WaldTermTable(pd.DataFrame(rows).set_index("term"))
+
+    def summary(self) -> "TextSummary":
+        tab = pd.DataFrame(
+            {
+                "coef": self.params,
+                "std err": self.bse,
+                "z": self.params / self.bse,
+                "P>|z|": self.pvalues,
+                "[0.025": self.params - 1.96 * self.bse,
+                "0.975]": self.params + 1.96 * self.bse,
+            }
+        )
+        lines = [
+            "Binomial logit fitted on aggregated (successes, trials) cells",
+            f"Model:            {self.response} ~ {self.formula}",
+            f"No. runs:         {self.nobs}",
+            f"No. cells:        {self.n_cells}",
+        ]
+        if self.n_groups is not None:
+            lines.append(f"No. clusters:     {self.n_groups} (question_id)")
+        lines += [
+            f"IRLS iterations:  {self.n_iter}",
+            f"Covariance type:  {self.cov_type}",
+            "",
+            tab.to_string(float_format=lambda v: f"{v:.4f}"),
+            "",
+        ]
+        return TextSummary("\n".join(lines))
+
+
+class WaldTermTable:
+    def __init__(self, frame: pd.DataFrame) -> None:
+        self._frame = frame
+
+    def summary_frame(self) -> pd.DataFrame:
+        return self._frame.copy()
+
+
+class TextSummary:
+    def __init__(self, text: str) -> None:
+        self._text = text
+
+    def as_text(self) -> str:
+        return self._text
+
+
+def fit_models(
+    df_cells: pd.DataFrame,
+    model_types: Sequence[str] = MODEL_TYPES,
+    prefix: str = "logit",
+    cov_type: str = "cluster",
+    groups_col: str = "question_id",
+    cluster_nobs: str = "runs",
+    design: Optional[TreatmentTempDesign] = None,
+    response: str = "correct",
+) -> Dict[str, LogitFit]:
+    """
+    Fit several treatment x temp logits on (successes, k_runs) cells sharing one design.
+
+    cov_type:
+      - "cluster":   sandwich clustered by groups_col
+      - "nonrobust": inverse Fisher information (smf.glm(...).fit() default)
+
+    cluster_nobs picks N in the (N-1)/(N-K) correction: "runs" matches a run-level
+    fit (sum of k_runs), "cells" matches smf.glm with freq_weights (one per row).
+
+    response only labels the summary: "correct" for the run-level logit it
+    reproduces, "prop" (successes / k_runs) for the cell-level glm_* fits.
+
+    Returns {f"{prefix}_{model_type}": LogitFit}. Later models warm-start from the
+    previous fit (additive coefficients padded with zeros for the interaction).
+    """
+    if cov_type not in ("cluster", "nonrobust"):
+        raise ValueError(f"Unknown cov_type: {cov_type}")
+
+    if design is None:
+        design = TreatmentTempDesign(df_cells["treatment"], df_cells["temp"])
+    y = df_cells["successes"].to_numpy(dtype=float)
+    n = df_cells["k_runs"].to_numpy(dtype=float)
+    groups = df_cells[groups_col].to_numpy() if cov_type == "cluster" else None
+    n_groups = len(pd.unique(groups)) if groups is not None else None
+    nobs_runs = int(n.sum())
+
+    fits: Dict[str, LogitFit] = {}
+    beta_prev: Optional[np.ndarray] = None
+    for model_type in model_types:
+        X = design.exog(model_type)
+        beta0 = None
+        if beta_prev is not None:
+            beta0 = np.zeros(X.shape[1])
+            m = min(len(beta_prev), X.shape[1])
+            beta0[:m] = beta_prev[:m]
+
+        beta, n_iter = irls_binomial(X, y, n, beta0=beta0)
+        beta_prev = beta
+
+        if cov_type == "cluster":
+            nobs = nobs_runs if cluster_nobs == "runs" else len(y)
+            cov = cluster_sandwich(X, y, n, beta, groups, nobs=nobs)
+        else:
+            cov = information_inverse(X, n, beta)
+
+        cols = design.columns(model_type)
+        name = f"{prefix}_{model_type}"
+        fits[name] = LogitFit(
+            name=name,
+            model_type=model_type,
+            design=design,
+            params=pd.Series(beta, index=cols),
+            cov=pd.DataFrame(cov, index=cols, columns=cols),
+            cov_type=cov_type,
+            nobs=nobs_runs,
+            n_cells=len(y),
+            n_groups=n_groups,
+            n_iter=n_iter,
+            response=response,
+        )
+    return fits
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# ============================================================
+# Pareto frontier over configs
+# ============================================================
+#
+# A config is on the frontier if no other config is at least as good on every
+# objective and strictly better on one (ties are kept: identical configs are
+# both on the frontier). Rows with a missing objective are never on it.
+#
+#   k = 2:  skyline sweep, O(n log n). Sort by x desc; a point survives iff its
+#           y is the best among points with the same x and beats every point
+#           with a larger x.
+#   k >= 3: sort-filter skyline. Any dominator has a strictly larger objective
+#           sum (and is lexicographically larger on ties), so after sorting by
+#           (sum, objectives) descending a point only needs checking against
+#           the frontier found so far; each check is one vectorized compare.
+#           O(n log n + n * |front|).
+
+# Objectives known by column name (both summary_by_config.csv and analyze_results' summary.csv)
+OBJECTIVE_SENSE: Dict[str, str] = {
+    "accuracy_mean": "max",
+    "strict_stability_rate": "max",
+    "entropy_mean_bits": "min",
+    "accuracy": "max",
+    "strict_stability": "max",
+    "avg_entropy_bits": "min",
+    "avg_output_tokens": "min",
+    "avg_total_tokens": "min",
+    "avg_latency_sec": "min",
+}
+
+
+def _as_maximize(values: np.ndarray, maximize: Sequence[bool]) -> np.ndarray:
+    v = np.asarray(values, dtype=float)
+    if v.ndim != 2 or v.shape[1] != len(maximize):
+        raise ValueError(f"values must be (n, {len(maximize)}), got {v.shape}")
+    return v * np.where(np.asarray(maximize, dtype=bool), 1.0, -1.0)
+
+
+def _skyline_2d(v: np.ndarray) -> np.ndarray:
+    n = len(v)
+    order = np.lexsort((-v[:, 1], -v[:, 0]))  # x desc, then y desc
+    x, y = v[order, 0], v[order, 1]
+
+    starts = np.flatnonzero(np.r_[True, x[1:] != x[:-1]])
+    group_max = np.maximum.reduceat(y, starts)
+    prior_max = np.r_[-np.inf, np.maximum.accumulate(group_max)[:-1]]  # best y at strictly larger x
+    sizes = np.diff(np.r_[starts, n])
+
+    keep_sorted = (y == np.repeat(group_max, sizes)) & (y > np.repeat(prior_max, sizes))
+    keep = np.zeros(n, dtype=bool)
+    keep[order] = keep_sorted
+    return keep
+
+
+def _sort_filter_skyline(v: np.ndarray) -> np.ndarray:
+    n, k = v.shape
+    keys = [v[:, j] for j in reversed(range(k))] + [v.sum(axis=1)]
+    order = np.lexsort([-key for key in keys])  # sum desc, then objectives desc
+
+    front = np.empty((n, k))
+    m = 0
+    keep = np.zeros(n, dtype=bool)
+    for i in order:
+        p = v[i]
+        f = front[:m]
+        if m and np.any(np.all(f >= p, axis=1) & np.any(f > p, axis=1)):
+            continue
+        keep[i] = True
+        front[m] = p
+        m += 1
+    return keep
+
+
+def pareto_mask(values: np.ndarray, maximize: Sequence[bool]) -> np.ndarray:
+    """
+    Boolean mask of non-dominated rows of values (n, k); maximize[j] gives the
+    direction of column j.
+    """
+    v = _as_maximize(values, maximize)
+    ok = np.isfinite(v).all(axis=1)
+    keep = np.zeros(len(v), dtype=bool)
+    if not ok.any():
+        return keep
+
+    sub = v[ok]
+    if sub.shape[1] == 1:
+        keep_ok = sub[:, 0] == sub[:, 0].max()
+    elif sub.shape[1] == 2:
+        keep_ok = _skyline_2d(sub)
+    else:
+        keep_ok = _sort_filter_skyline(sub)
+    keep[ok] = keep_ok
+    return keep
+
+
+def pareto_ranks(values: np.ndarray, maximize: Sequence[bool]) -> np.ndarray:
+    """
+    Non-dominated sorting: 1 = frontier, 2 = frontier once rank 1 is removed, ...
+    0 for rows with missing objectives.
+    """
+    v = np.asarray(values, dtype=float)
+    ranks = np.zeros(len(v), dtype=int)
+    remaining = np.flatnonzero(np.isfinite(v).all(axis=1))
+    r = 1
+    while len(remaining):
+        m = pareto_mask(v[remaining], maximize)
+        ranks[remaining[m]] = r
+        remaining = remaining[~m]
+        r += 1
+    return ranks
+
+
+def parse_objectives(spec: str) -> List[Tuple[str, bool]]:
+    """
+    "accuracy_mean:max,entropy_mean_bits:min" -> [(col, maximize), ...].
+    A bare column name takes its direction from OBJECTIVE_SENSE.
+    """
+    out = []
+    for part in [p.strip() for p in spec.split(",") if p.strip()]:
+        col, _, sense = part.partition(":")
+        sense = sense or OBJECTIVE_SENSE.get(col, "")
+        if sense not in ("max", "min"):
+            raise ValueError(f"Objective {col!r}: give a direction (col:max or col:min).")
+        out.append((col, sense == "max"))
+    return out
+
+
+def default_objectives(df: pd.DataFrame) -> List[Tuple[str, bool]]:
+    """
+    Every known objective column present in df with at least one value.
+    """
+    return [
+        (c, s == "max") for c, s in OBJECTIVE_SENSE.items() if c in df.columns and df[c].notna().any()
+    ]
+
+
+def frontier_table(df: pd.DataFrame, objectives: Optional[List[Tuple[str, bool]]] = None) -> pd.DataFrame:
+    """
+    df plus pareto_front (bool) and pareto_rank, sorted by rank.
+    """
+    objectives = objectives or default_objectives(df)
+    missing = [c for c, _ in objectives if c not in df.columns]
+    if missing:
+        raise ValueError(f"Objective columns not in table: {missing}")
+
+    cols = [c for c, _ in objectives]
+    values = df[cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    maximize = [m for _, m in objectives]
+
+    out = df.copy()
+    out["pareto_rank"] = pareto_ranks(values, maximize)
+    out["pareto_front"] = out["pareto_rank"] == 1
+    out["_r"] = out["pareto_rank"].replace(0, np.iinfo(int).max)
+    return out.sort_values(["_r"] + cols, ascending=[True] + [not m for m in maximize], kind="mergesort").drop(
+        columns="_r"
+    ).reset_index(drop=True)
+
+
+def save_frontier_csv(df: pd.DataFrame, out_csv: str, objectives: Optional[List[Tuple[str, bool]]] = None) -> pd.DataFrame:
+    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+    tab = frontier_table(df, objectives)
+    tab.to_csv(out_csv, index=False)
+    return tab
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-csv", required=True, help="Config-level table (summary.csv or summary_by_config.csv).")
+    ap.add_argument("--out-csv", required=True)
+    ap.add_argument(
+        "--objectives",
+        default=None,
+        help="Comma list of col[:max|min]. Default: every known objective column in the table.",
+    )
+    ap.add_argument("--front-only", action="store_true", help="Write only rank-1 rows.")
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.in_csv)
+    objectives = parse_objectives(args.objectives) if args.objectives else default_objectives(df)
+    if not objectives:
+        raise ValueError(f"No objective columns found in {args.in_csv}; pass --objectives.")
+
+    tab = frontier_table(df, objectives)
+    if args.front_only:
+        tab = tab[tab["pareto_front"]]
+    os.makedirs(os.path.dirname(args.out_csv) or ".", exist_ok=True)
+    tab.to_csv(args.out_csv, index=False)
+
+    desc = ", ".join(f"{c} ({'max' if m else 'min'})" for c, m in objectives)
+    print(f"Wrote: {args.out_csv} ({int(tab['pareto_front'].sum())} of {len(df)} configs on the front; {desc})")
+
+
+if __name__ == "__main__":
+    main()
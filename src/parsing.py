@@ -1,61 +1,122 @@
 from __future__ import annotations
 import re
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Sequence, Tuple, Union
+
+# Precompiled once; the "last match" patterns use a greedy .* prefix so a
+# single regex call lands on the last occurrence (the same one findall()[-1]
+# returns, since these matches cannot overlap).
+_FINAL_LINE_RE = re.compile(r"^\s*FINAL\s*:\s*(.+?)\s*$", flags=re.IGNORECASE | re.MULTILINE)
+_LAST_FINAL_LETTER_RE = re.compile(r".*FINAL\s*:\s*([A-D])\b", flags=re.IGNORECASE | re.DOTALL)
+_LETTER_LINE_RE = re.compile(r"[\(\[]?\s*([A-D])\s*[\)\]]?", flags=re.IGNORECASE)
+_LAST_LETTER_RE = re.compile(r".*\b([A-D])\b", flags=re.IGNORECASE | re.DOTALL)
+_NUMBER_RE = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+
+# Which rule produced the answer, per answer kind (returned by parse_with_tier)
+PARSE_TIERS = {
+    "mcq": ("final", "line", "letter", "none"),
+    "number": ("final", "text", "none"),
+    "text": ("final", "last_line", "none"),
+}
+
 
 def parse_final_line(text: str) -> str:
     if not text:
         return ""
-    m = re.search(r"^\s*FINAL\s*:\s*(.+?)\s*$", text, flags=re.IGNORECASE | re.MULTILINE)
+    m = _FINAL_LINE_RE.search(text)
     if m:
         return m.group(1).strip()
     return ""
 
-def parse_mcq_letter(text: str) -> str:
+def _mcq_letter(text: str) -> Tuple[str, str]:
     if not text:
-        return ""
-    # 1) Strong signal: FINAL: X
-    matches = re.findall(r"FINAL\s*:\s*([A-D])\b", text, flags=re.IGNORECASE)
-    if matches:
-        return matches[-1].upper()
-
-    # 2) Look at last non-empty line (standalone letter or (A))
-    lines = [ln.strip() for ln in text.strip().splitlines() if ln.strip()]
-    for ln in reversed(lines):
-        m2 = re.fullmatch(r"[\(\[]?\s*([A-D])\s*[\)\]]?", ln, flags=re.IGNORECASE)
+        return "", "none"
+    # 1) Strong signal: last FINAL: X
+    m = _LAST_FINAL_LETTER_RE.match(text)
+    if m:
+        return m.group(1).upper(), "final"
+
+    # 2) Last non-empty line that is a standalone letter or (A); on the same
+    #    reverse walk remember the last letter token for 3)
+    fallback = ""
+    for ln in reversed(text.strip().splitlines()):
+        ln = ln.strip()
+        if not ln:
+            continue
+        m2 = _LETTER_LINE_RE.fullmatch(ln)
         if m2:
-            return m2.group(1).upper()
+            return m2.group(1).upper(), "line"
+        if not fallback:
+            m3 = _LAST_LETTER_RE.match(ln)
+            if m3:
+                fallback = m3.group(1).upper()
 
     # 3) Fallback: last occurrence of a letter token
-    m3 = re.findall(r"\b([A-D])\b", text, flags=re.IGNORECASE)
-    return m3[-1].upper() if m3 else ""
+    return (fallback, "letter") if fallback else ("", "none")
 
-def parse_number(text: str) -> str:
-    """Heuristic numeric parser: use FINAL line if present; else last number in text."""
+def parse_mcq_letter(text: str) -> str:
+    return _mcq_letter(text)[0]
+
+def _number(text: str) -> Tuple[str, str]:
     if not text:
-        return ""
+        return "", "none"
     final = parse_final_line(text)
-    candidate = final if final else text
     # allow integers/decimals/negatives
-    nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", candidate)
-    if nums:
-        return nums[-1]
+    if final:
+        nums = _NUMBER_RE.findall(final)
+        if nums:
+            return nums[-1], "final"
     # fallback: find anywhere
-    nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", text)
-    return nums[-1] if nums else ""
+    nums = _NUMBER_RE.findall(text)
+    return (nums[-1], "text") if nums else ("", "none")
 
-def parse_answer(item: Dict[str, Any], model_text: str) -> str:
+def parse_number(text: str) -> str:
+    """Heuristic numeric parser: use FINAL line if present; else last number in text."""
+    return _number(text)[0]
+
+def _text_answer(text: str) -> Tuple[str, str]:
+    # generic text: use FINAL line if available, else last non-empty line
+    final = parse_final_line(text)
+    if final:
+        return final, "final"
+    for ln in reversed((text or "").strip().splitlines()):
+        if ln.strip():
+            return ln.strip(), "last_line"
+    return "", "none"
+
+_PARSERS = {"mcq": _mcq_letter, "number": _number, "text": _text_answer}
+
+
+def answer_kind(item: Dict[str, Any]) -> str:
     t = item.get("type", "mcq")
     fmt = item.get("answer_format", "")
     if t == "mcq" or fmt == "letters":
-        return parse_mcq_letter(model_text)
+        return "mcq"
     if fmt == "number":
-        return parse_number(model_text)
-    # generic text: use FINAL line if available, else last non-empty line
-    final = parse_final_line(model_text)
-    if final:
-        return final
-    lines = [ln.strip() for ln in model_text.strip().splitlines() if ln.strip()]
-    return lines[-1] if lines else ""
+        return "number"
+    return "text"
+
+def parse_with_tier(kind: str, model_text: str) -> Tuple[str, str]:
+    """(parsed answer, tier) where tier is one of PARSE_TIERS[kind]."""
+    return _PARSERS[kind](model_text)
+
+def parse_answer(item: Dict[str, Any], model_text: str) -> str:
+    return parse_with_tier(answer_kind(item), model_text)[0]
+
+def parse_batch(texts: Sequence[str], kinds: Union[str, Sequence[str]] = "mcq") -> Tuple[List[str], List[str]]:
+    """
+    Parse a column of model outputs. kinds is one answer kind for all rows or
+    one per row (see answer_kind). Returns (answers, tiers), aligned with texts.
+    """
+    if isinstance(kinds, str):
+        pairs = list(map(_PARSERS[kinds], texts))
+    else:
+        if len(kinds) != len(texts):
+            raise ValueError(f"kinds has {len(kinds)} entries for {len(texts)} texts")
+        pairs = [_PARSERS[k](t) for k, t in zip(kinds, texts)]
+    if not pairs:
+        return [], []
+    answers, tiers = zip(*pairs)
+    return list(answers), list(tiers)
 
 def is_correct(parsed: str, gt_list: list[str], answer_format: str) -> bool:
     if not parsed or not gt_list:
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.count_logit import read_per_question_cells
+from src.logit_fit import MODEL_TYPES, TreatmentTempDesign, fit_models
+
+
+# ============================================================
+# Within-question permutation tests for the treatment terms
+# ============================================================
+#
+# Null: treatment labels are exchangeable within a question. One permutation
+# shuffles the treatment axis of every question independently (each treatment
+# keeps its temp profile) and recomputes the question-clustered Wald chi2 of
+# the treatment terms of the count-cell logit.
+#
+# Counts live in a dense tensor [question, treatment, temp]. Because the
+# design only depends on the (treatment, temp) position, the logit fit of a
+# permuted dataset only needs per-position totals, and the cluster meat only
+# needs per-question residuals times the position design. Both are batched
+# over many permutations at once.
+
+TREATMENT_TERMS = ("C(treatment)", "C(treatment):temp")
+
+
+def count_tensor(df_cells: pd.DataFrame, design: TreatmentTempDesign) -> Dict[str, object]:
+    """
+    successes / trials as [question, treatment, temp] arrays (missing cells -> 0 trials).
+    """
+    qcodes, questions = pd.factorize(df_cells["question_id"].astype(str))
+    temps = np.sort(df_cells["temp"].astype(float).unique())
+    t_idx = pd.Index(design.levels).get_indexer(df_cells["treatment"].astype(str))
+    m_idx = np.searchsorted(temps, df_cells["temp"].astype(float).to_numpy())
+
+    shape = (len(questions), len(design.levels), len(temps))
+    S = np.zeros(shape)
+    N = np.zeros(shape)
+    np.add.at(S, (qcodes, t_idx, m_idx), df_cells["successes"].to_numpy(dtype=float))
+    np.add.at(N, (qcodes, t_idx, m_idx), df_cells["k_runs"].to_numpy(dtype=float))
+
+    # Position design: one row per (treatment, temp), treatment-major like S.reshape
+    pos_t = np.repeat(design.levels, len(temps))
+    pos_m = np.tile(temps, len(design.levels))
+    return {
+        "S": S,
+        "N": N,
+        "questions": questions,
+        "temps": temps,
+        "X_pos": design.build(pos_t, pos_m),
+    }
+
+
+def batched_cluster_wald(
+    S: np.ndarray,
+    N: np.ndarray,
+    X_pos: np.ndarray,
+    beta0: np.ndarray,
+    term_slices: Dict[str, slice],
+    maxiter: int = 50,
+    tol: float = 1e-8,
+) -> Dict[str, np.ndarray]:
+    """
+    Question-clustered Wald chi2 per term for B datasets at once.
+
+    S, N: (B, G, P) successes / trials per question and design position.
+    Returns {term: (B,)} with NaN where the fit did not converge.
+    """
+    B, G, P = S.shape
+    k = X_pos.shape[1]
+    XX = (X_pos[:, :, None] * X_pos[:, None, :]).reshape(P, -1)
+    ridge = 1e-10 * np.eye(k)
+
+    s_tot = S.sum(axis=1)
+    n_tot = N.sum(axis=1)
+    beta = np.tile(beta0, (B, 1))
+    converged = np.zeros(B, dtype=bool)
+    for _ in range(maxiter):
+        p = 1.0 / (1.0 + np.exp(-(beta @ X_pos.T)))
+        grad = (s_tot - n_tot * p) @ X_pos
+        H = ((n_tot * p * (1.0 - p)) @ XX).reshape(B, k, k) + ridge
+        step = np.linalg.solve(H, grad[..., None])[..., 0]
+        beta += step
+        converged = np.max(np.abs(step), axis=1) < tol
+        if converged.all():
+            break
+
+    p = 1.0 / (1.0 + np.exp(-(beta @ X_pos.T)))
+    H = ((n_tot * p * (1.0 - p)) @ XX).reshape(B, k, k) + ridge
+    bread = np.linalg.inv(H)
+    resid = S - N * p[:, None, :]
+    scores = resid @ X_pos  # (B, G, k)
+    meat = np.einsum("bgi,bgj->bij", scores, scores)
+    cov = bread @ meat @ bread
+
+    nobs = n_tot.sum(axis=1)
+    G_eff = (N.sum(axis=2) > 0).sum(axis=1)
+    cov *= (G_eff / (G_eff - 1.0) * (nobs - 1.0) / (nobs - k))[:, None, None]
+
+    out: Dict[str, np.ndarray] = {}
+    for term, sl in term_slices.items():
+        b = beta[:, sl]
+        V = cov[:, sl, sl]
+        chi2 = np.einsum("bi,bi->b", b, np.linalg.solve(V, b[..., None])[..., 0])
+        chi2[~converged | ~np.isfinite(chi2)] = np.nan
+        out[term] = chi2
+    return out
+
+
+def permute_within_question(rng: np.random.Generator, S: np.ndarray, N: np.ndarray, b: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    b independent within-question shuffles of the treatment axis, flattened to (b, G, P).
+    """
+    G, T, M = S.shape
+    perm = np.argsort(rng.random((b, G, T)), axis=2)
+    idx = perm[..., None]
+    Sp = np.take_along_axis(np.broadcast_to(S, (b, G, T, M)), idx, axis=2)
+    Np = np.take_along_axis(np.broadcast_to(N, (b, G, T, M)), idx, axis=2)
+    return Sp.reshape(b, G, T * M), Np.reshape(b, G, T * M)
+
+
+def permutation_wald_table(
+    df_cells: pd.DataFrame,
+    model_type: str,
+    n_perm: int = 2000,
+    seed: int = 42,
+    batch_size: int = 256,
+) -> pd.DataFrame:
+    """
+    Wald table (same columns as *_wald_tests.csv) plus permutation p-values for the
+    treatment terms: perm_p_value = (1 + #{chi2_perm >= chi2_obs}) / (1 + n_valid).
+    """
+    design = TreatmentTempDesign(df_cells["treatment"], df_cells["temp"])
+    name = f"logit_{model_type}"
+    fit = fit_models(df_cells, model_types=[model_type], design=design)[name]
+    wald = fit.wald_test_terms(skip_single=False).summary_frame()
+
+    ten = count_tensor(df_cells, design)
+    k = len(fit.params)
+    X_pos = ten["X_pos"][:, :k]
+    slices = {t: s for t, s in design.term_slices(model_type).items() if t in TREATMENT_TERMS}
+    G, T, M = ten["S"].shape
+
+    obs = batched_cluster_wald(
+        ten["S"].reshape(1, G, T * M), ten["N"].reshape(1, G, T * M), X_pos, fit.params.values, slices
+    )
+
+    rng = np.random.default_rng(seed)
+    exceed = {t: 0 for t in slices}
+    valid = {t: 0 for t in slices}
+    for start in range(0, n_perm, batch_size):
+        b = min(batch_size, n_perm - start)
+        Sp, Np = permute_within_question(rng, ten["S"], ten["N"], b)
+        stat = batched_cluster_wald(Sp, Np, X_pos, fit.params.values, slices)
+        for t, v in stat.items():
+            ok = np.isfinite(v)
+            valid[t] += int(ok.sum())
+            exceed[t] += int((v[ok] >= obs[t][0] - 1e-9).sum())
+
+    table = wald.reset_index().rename(columns={"index": "term"})
+    table["perm_p_value"] = [
+        (1.0 + exceed[t]) / (1.0 + valid[t]) if t in slices else np.nan for t in table["term"]
+    ]
+    table["n_perm"] = pd.array([valid.get(t) for t in table["term"]], dtype="Int64")
+    return table
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results.")
+    ap.add_argument("--out-dir", required=True, help="Analysis dir holding logit_*_wald_tests.csv.")
+    ap.add_argument("--models", nargs="+", default=list(MODEL_TYPES), choices=list(MODEL_TYPES))
+    ap.add_argument("--n-perm", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch-size", type=int, default=256)
+    args = ap.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    cells = read_per_question_cells(args.per_question_csv)
+
+    for model_type in args.models:
+        t0 = time.time()
+        table = permutation_wald_table(
+            cells, model_type, n_perm=args.n_perm, seed=args.seed, batch_size=args.batch_size
+        )
+        out_csv = os.path.join(args.out_dir, f"logit_{model_type}_wald_tests_perm.csv")
+        table.to_csv(out_csv, index=False)
+        print(f"Wrote: {out_csv} ({args.n_perm} permutations, {time.time() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+# ============================================================
+# Content-hashed analysis pipeline
+# ============================================================
+#
+# One experiment = one run JSONL. Its stages form a small DAG:
+#
+#   analyze_results -> analyze_plot_regression
+#                   -> robust_cluster_se
+#                   -> make_docs
+#
+# Each stage runs `python -m src.<module> ...` in a subprocess. A stage's key is
+# the sha256 of (module source, CLI args, contents of every input file). The key
+# is stamped next to the outputs in <out-root>/.pipeline/<stage>.json; a stage
+# whose key matches and whose outputs all exist is skipped. Because inputs of a
+# downstream stage are upstream outputs, an upstream change that leaves its
+# outputs byte-identical does not trigger downstream reruns.
+#
+# Stages from all experiments share one worker pool, so independent stages and
+# experiments run in parallel.
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SRC_DIR)
+
+
+@dataclass
+class Stage:
+    name: str
+    module: str
+    args: List[str]
+    inputs: List[str]
+    outputs: List[str]
+    stamp: str
+    deps: List[str] = field(default_factory=list)
+
+
+_file_hash_cache: Dict[str, tuple] = {}
+
+
+def file_sha256(path: str) -> str:
+    """
+    Content hash, memoized on (size, mtime_ns) within one pipeline invocation.
+    """
+    st = os.stat(path)
+    sig = (st.st_size, st.st_mtime_ns)
+    hit = _file_hash_cache.get(path)
+    if hit and hit[0] == sig:
+        return hit[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    _file_hash_cache[path] = (sig, digest)
+    return digest
+
+
+def module_sources(module: str, seen: Optional[set] = None) -> List[str]:
+    """
+    Source files of a src.* module and the src.* modules it imports (transitively).
+    """
+    seen = set() if seen is None else seen
+    path = os.path.join(REPO_ROOT, *module.split(".")) + ".py"
+    if module in seen or not os.path.exists(path):
+        return []
+    seen.add(module)
+    out = [path]
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            m = re.match(r"\s*(?:from|import)\s+(src(?:\.\w+)+)", line)
+            if m:
+                out.extend(module_sources(m.group(1), seen))
+    return out
+
+
+def stage_key(stage: Stage) -> str:
+    h = hashlib.sha256()
+    h.update(stage.module.encode())
+    for path in sorted(module_sources(stage.module)):
+        h.update(file_sha256(path).encode())
+    h.update(json.dumps(stage.args).encode())
+    for p in stage.inputs:
+        h.update(p.encode())
+        h.update(file_sha256(p).encode() if os.path.exists(p) else b"<missing>")
+    return h.hexdigest()
+
+
+def is_current(stage: Stage, key: str) -> bool:
+    if not os.path.exists(stage.stamp):
+        return False
+    try:
+        with open(stage.stamp, "r", encoding="utf-8") as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return stamp.get("key") == key and all(os.path.exists(p) for p in stage.outputs)
+
+
+def write_stamp(stage: Stage, key: str, elapsed: float) -> None:
+    os.makedirs(os.path.dirname(stage.stamp), exist_ok=True)
+    with open(stage.stamp, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "stage": stage.name,
+                "key": key,
+                "module": stage.module,
+                "args": stage.args,
+                "inputs": stage.inputs,
+                "outputs": stage.outputs,
+                "elapsed_sec": round(elapsed, 3),
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            f,
+            indent=2,
+        )
+
+
+def experiment_stages(exp: Dict[str, object]) -> List[Stage]:
+    """
+    Expand one experiment spec into its stages.
+
+    Spec keys: name, runs_jsonl, out_root; optional: stages (subset),
+    regression_args / robust_args (extra CLI args), title.
+    """
+    name = str(exp["name"])
+    runs = str(exp["runs_jsonl"])
+    root = str(exp.get("out_root", os.path.join("outputs", name)))
+    stamp_dir = os.path.join(root, ".pipeline")
+    summary = os.path.join(root, "summary.csv")
+    perq = os.path.join(root, "per_question.csv")
+    counts = os.path.join(root, "per_question_counts.npz")
+    reg_dir = os.path.join(root, "glm")
+    rob_dir = os.path.join(root, "robust")
+    md = os.path.join(root, "writeup.md")
+
+    stages = [
+        Stage(
+            name=f"{name}:analyze_results",
+            module="src.analyze_results",
+            args=[
+                "--in-jsonl", runs,
+                "--out-summary-csv", summary,
+                "--out-per-question-csv", perq,
+                "--out-counts-npz", counts,
+            ],
+            inputs=[runs],
+            outputs=[summary, perq, counts],
+            stamp=os.path.join(stamp_dir, "analyze_results.json"),
+        ),
+        Stage(
+            name=f"{name}:analyze_plot_regression",
+            module="src.analyze_plot_regression",
+            args=["--per-question-csv", counts, "--out-dir", reg_dir] + list(exp.get("regression_args", [])),
+            inputs=[counts],
+            outputs=[os.path.join(reg_dir, "summary_by_config.csv"), os.path.join(reg_dir, "logit_additive_coef.csv")],
+            stamp=os.path.join(stamp_dir, "analyze_plot_regression.json"),
+            deps=[f"{name}:analyze_results"],
+        ),
+        Stage(
+            name=f"{name}:robust_cluster_se",
+            module="src.robust_cluster_se",
+            args=["--per-question-csv", counts, "--out-dir", rob_dir] + list(exp.get("robust_args", [])),
+            inputs=[counts],
+            outputs=[os.path.join(rob_dir, "glm_additive_cluster_coef.csv")],
+            stamp=os.path.join(stamp_dir, "robust_cluster_se.json"),
+            deps=[f"{name}:analyze_results"],
+        ),
+        Stage(
+            name=f"{name}:make_docs",
+            module="src.make_docs",
+            args=[
+                "--in-jsonl", runs,
+                "--in-summary-csv", summary,
+                "--in-per-question-csv", perq,
+                "--out-md", md,
+                "--title", str(exp.get("title", name)),
+            ],
+            inputs=[runs, summary, perq],
+            outputs=[md],
+            stamp=os.path.join(stamp_dir, "make_docs.json"),
+            deps=[f"{name}:analyze_results"],
+        ),
+    ]
+
+    wanted = exp.get("stages")
+    if wanted:
+        keep = {f"{name}:{s}" for s in wanted}
+        stages = [s for s in stages if s.name in keep]
+        for s in stages:
+            s.deps = [d for d in s.deps if d in keep]
+    return stages
+
+
+def run_stage(stage: Stage, python: str) -> float:
+    t0 = time.time()
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT] + [p for p in [env.get("PYTHONPATH")] if p])
+    proc = subprocess.run(
+        [python, "-m", stage.module] + stage.args,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{stage.name} failed (exit {proc.returncode}):\n{proc.stderr.strip()}")
+    return time.time() - t0
+
+
+def run_pipeline(
+    stages: List[Stage],
+    jobs: int = 4,
+    force: bool = False,
+    dry_run: bool = False,
+    python: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Run stages in dependency order with up to `jobs` in flight.
+    Returns {stage name: "ran" | "skipped" | "would run" | "failed" | "blocked"}.
+    """
+    python = python or sys.executable
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"{s.name} depends on unknown stages: {missing}")
+
+    status: Dict[str, str] = {}
+    pending = dict(by_name)
+    running = {}
+
+    def ready(s: Stage) -> bool:
+        return all(status.get(d) in ("ran", "skipped", "would run") for d in s.deps)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+        while pending or running:
+            # Block stages whose deps failed
+            for s in list(pending.values()):
+                if any(status.get(d) in ("failed", "blocked") for d in s.deps):
+                    status[s.name] = "blocked"
+                    del pending[s.name]
+
+            for s in [s for s in pending.values() if ready(s)]:
+                del pending[s.name]
+                key = stage_key(s)
+                if not force and is_current(s, key):
+                    status[s.name] = "skipped"
+                    print(f"[skip] {s.name}")
+                elif dry_run:
+                    status[s.name] = "would run"
+                    print(f"[todo] {s.name}")
+                else:
+                    print(f"[run ] {s.name}")
+                    running[ex.submit(run_stage, s, python)] = (s, key)
+
+            if not running:
+                if pending and not any(ready(s) for s in pending.values()):
+                    for name in pending:
+                        status[name] = "blocked"
+                    break
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                s, key = running.pop(fut)
+                try:
+                    elapsed = fut.result()
+                except Exception as e:  # report and keep going with independent stages
+                    status[s.name] = "failed"
+                    print(f"[fail] {e}", file=sys.stderr)
+                    continue
+                write_stamp(s, key, elapsed)
+                status[s.name] = "ran"
+                print(f"[done] {s.name} ({elapsed:.1f}s)")
+
+    return status
+
+
+def load_experiments(path: str) -> List[Dict[str, object]]:
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    exps = cfg["experiments"] if isinstance(cfg, dict) else cfg
+    names = [e["name"] for e in exps]
+    dup = sorted({n for n in names if names.count(n) > 1})
+    if dup:
+        raise ValueError(f"Duplicate experiment names: {dup}")
+    return exps
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--config",
+        help='JSON: {"experiments": [{"name", "runs_jsonl", "out_root", "stages"?, '
+        '"regression_args"?, "robust_args"?, "title"?}, ...]}',
+    )
+    ap.add_argument("--runs-jsonl", help="Single experiment: run JSONL (instead of --config).")
+    ap.add_argument("--name", help="Single experiment name (default: JSONL basename).")
+    ap.add_argument("--out-root", help="Single experiment output root (default: outputs/<name>).")
+    ap.add_argument("--only", nargs="+", help="Only run these experiments (by name).")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--force", action="store_true", help="Ignore stamps and rerun every stage.")
+    ap.add_argument("--dry-run", action="store_true", help="Print which stages would run.")
+    args = ap.parse_args()
+
+    if args.config:
+        exps = load_experiments(args.config)
+    elif args.runs_jsonl:
+        name = args.name or os.path.splitext(os.path.basename(args.runs_jsonl))[0]
+        exps = [{"name": name, "runs_jsonl": args.runs_jsonl, "out_root": args.out_root or os.path.join("outputs", name)}]
+    else:
+        ap.error("Pass --config or --runs-jsonl.")
+
+    if args.only:
+        exps = [e for e in exps if e["name"] in set(args.only)]
+
+    stages: List[Stage] = []
+    for e in exps:
+        stages.extend(experiment_stages(e))
+
+    status = run_pipeline(stages, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    counts = {k: sum(1 for v in status.values() if v == k) for k in sorted(set(status.values()))}
+    print("Pipeline:", ", ".join(f"{v} {k}" for k, v in counts.items()))
+    if any(v in ("failed", "blocked") for v in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+
+# ============================================================
+# Per-stage profiling for the runners and analysis scripts
+# ============================================================
+#
+# Scripts mark their stages with
+#
+#     with stage("parse"):
+#         ...
+#
+# which is a shared no-op context unless --profile activated a Profiler, so
+# the markers stay in the code at no measurable cost. Stages nest; a stage's
+# key is its path ("generate/throttle"), and its time includes its children.
+#
+#   --profile                  wall time + calls per stage (perf_counter)
+#   --profile-mode cprofile    also one cProfile per stage; a stage's profile
+#                              covers only its own code (it is paused while a
+#                              child stage runs), dumped as <prefix>.<stage>.pstats
+#   --profile-mode sample      also a sampling thread (--profile-interval) that
+#                              records the main thread's stack under the current
+#                              stage; written as <prefix>.folded (flamegraph /
+#                              speedscope input)
+#   --profile-alloc            tracemalloc: net allocated bytes and peak above the
+#                              stage's start (slows Python code noticeably)
+#
+# The breakdown goes to <prefix>.json and <prefix>.txt next to the outputs.
+
+_NULL = contextlib.nullcontext()
+_ACTIVE: Optional["Profiler"] = None
+_TRACER: Optional[Any] = None  # src.trace_export.Tracer when --trace-out is on
+
+
+class _Frame:
+    __slots__ = ("key", "t0", "mem0", "child_peak", "prof")
+
+    def __init__(self, key: str, t0: float, mem0: int, prof: Optional[cProfile.Profile]) -> None:
+        self.key = key
+        self.t0 = t0
+        self.mem0 = mem0
+        self.child_peak = 0
+        self.prof = prof
+
+
+class Profiler:
+    def __init__(self, mode: str = "timers", alloc: bool = False, interval: float = 0.005) -> None:
+        if mode not in ("timers", "cprofile", "sample"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.alloc = alloc
+        self.interval = interval
+        self.prefix = ""
+        self.total: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.max_sec: Dict[str, float] = defaultdict(float)
+        self.alloc_net: Dict[str, int] = defaultdict(int)
+        self.alloc_peak: Dict[str, int] = defaultdict(int)
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.samples: Counter = Counter()
+        self._stack: List[_Frame] = []
+        self._t_start = 0.0
+        self._t_end = 0.0
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._main_ident = threading.main_thread().ident
+
+    # ---------------- lifecycle ----------------
+
+    def start(self) -> "Profiler":
+        self._t_start = time.perf_counter()
+        if self.alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, name="stage-sampler", daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self) -> None:
+        while self._stack:
+            self._exit()
+        self._t_end = time.perf_counter()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        if self.alloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # ---------------- stages ----------------
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _enter(self, name: str) -> None:
+        parent = self._stack[-1] if self._stack else None
+        key = f"{parent.key}/{name}" if parent else name
+        mem0 = 0
+        if self.alloc:
+            cur, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent.child_peak = max(parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            mem0 = cur
+        prof = None
+        if self.mode == "cprofile":
+            if parent is not None and parent.prof is not None:
+                parent.prof.disable()
+            prof = self.profiles.setdefault(key, cProfile.Profile())
+            prof.enable()
+        self._stack.append(_Frame(key, time.perf_counter(), mem0, prof))
+
+    def _exit(self) -> None:
+        f = self._stack.pop()
+        dt = time.perf_counter() - f.t0
+        if f.prof is not None:
+            f.prof.disable()
+            if self._stack and self._stack[-1].prof is not None:
+                self._stack[-1].prof.enable()
+        self.total[f.key] += dt
+        self.calls[f.key] += 1
+        self.max_sec[f.key] = max(self.max_sec[f.key], dt)
+        if self.alloc:
+            cur, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, f.child_peak)
+            self.alloc_net[f.key] += cur - f.mem0
+            self.alloc_peak[f.key] = max(self.alloc_peak[f.key], peak - f.mem0)
+            if self._stack:
+                self._stack[-1].child_peak = max(self._stack[-1].child_peak, peak)
+
+    # ---------------- sampling ----------------
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stage_key = self._stack[-1].key if self._stack else "(no stage)"
+            self.samples[";".join(["[" + s + "]" for s in stage_key.split("/")] + stack[::-1])] += 1
+
+    # ---------------- report ----------------
+
+    def report(self) -> Dict[str, Any]:
+        wall = (self._t_end or time.perf_counter()) - self._t_start
+        stages = []
+        for key in sorted(self.total, key=lambda k: -self.total[k]):
+            rec = {
+                "stage": key,
+                "depth": key.count("/"),
+                "calls": self.calls[key],
+                "total_sec": round(self.total[key], 6),
+                "mean_ms": round(1000.0 * self.total[key] / self.calls[key], 4),
+                "max_ms": round(1000.0 * self.max_sec[key], 4),
+                "pct_wall": round(100.0 * self.total[key] / wall, 2) if wall > 0 else 0.0,
+            }
+            if self.alloc:
+                rec["alloc_net_bytes"] = self.alloc_net[key]
+                rec["alloc_peak_bytes"] = self.alloc_peak[key]
+            stages.append(rec)
+        top = sum(self.total[k] for k in self.total if "/" not in k)
+        return {
+            "mode": self.mode,
+            "alloc": self.alloc,
+            "wall_sec": round(wall, 6),
+            "unstaged_sec": round(max(wall - top, 0.0), 6),
+            "stages": stages,
+            "n_samples": sum(self.samples.values()),
+        }
+
+    def format_table(self, rep: Optional[Dict[str, Any]] = None) -> str:
+        rep = rep or self.report()
+        head = f"{'stage':<36} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'% wall':>7}"
+        if self.alloc:
+            head += f" {'net MB':>9} {'peak MB':>9}"
+        lines = [head]
+        for r in sorted(rep["stages"], key=lambda r: r["stage"]):
+            name = "  " * r["depth"] + r["stage"].rsplit("/", 1)[-1]
+            ln = f"{name:<36} {r['calls']:>8} {r['total_sec']:>10.3f} {r['mean_ms']:>10.3f} {r['max_ms']:>10.3f} {r['pct_wall']:>7.1f}"
+            if self.alloc:
+                ln += f" {r['alloc_net_bytes'] / 2**20:>9.2f} {r['alloc_peak_bytes'] / 2**20:>9.2f}"
+            lines.append(ln)
+        lines.append(f"{'(outside stages)':<36} {'':>8} {rep['unstaged_sec']:>10.3f}")
+        lines.append(f"{'wall':<36} {'':>8} {rep['wall_sec']:>10.3f}")
+        return "\n".join(lines)
+
+    def save(self, prefix: str) -> List[str]:
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        rep = self.report()
+        written = [prefix + ".json", prefix + ".txt"]
+        with open(prefix + ".json", "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2)
+        with open(prefix + ".txt", "w", encoding="utf-8") as f:
+            f.write(self.format_table(rep) + "\n")
+        for key, prof in self.profiles.items():
+            path = f"{prefix}.{key.replace('/', '.')}.pstats"
+            prof.dump_stats(path)
+            written.append(path)
+        if self.samples:
+            with open(prefix + ".folded", "w", encoding="utf-8") as f:
+                for stack, n in self.samples.most_common():
+                    f.write(f"{stack} {n}\n")
+            written.append(prefix + ".folded")
+        return written
+
+
+def stage(name: str):
+    """
+    Context manager timing a named stage under the active Profiler and/or
+    emitting it as a trace span (no-op when neither is on).
+    """
+    if _TRACER is None:
+        return _ACTIVE.stage(name) if _ACTIVE is not None else _NULL
+    if _ACTIVE is None:
+        return _TRACER.span(name)
+    return _both(name)
+
+
+@contextlib.contextmanager
+def _both(name: str):
+    with _TRACER.span(name), _ACTIVE.stage(name):
+        yield
+
+
+def set_tracer(tracer: Optional[Any]) -> None:
+    global _TRACER
+    _TRACER = tracer
+
+
+def active_tracer() -> Optional[Any]:
+    return _TRACER
+
+
+def add_profile_args(ap) -> None:
+    ap.add_argument("--profile", action="store_true", help="Write a per-stage time breakdown next to the outputs.")
+    ap.add_argument(
+        "--profile-mode",
+        choices=["timers", "cprofile", "sample"],
+        default="timers",
+        help="timers: stage wall times only; cprofile: + .pstats per stage; sample: + sampled stacks (.folded).",
+    )
+    ap.add_argument("--profile-alloc", action="store_true", help="Also track allocations per stage (tracemalloc; slower).")
+    ap.add_argument("--profile-interval", type=float, default=0.005, help="Sampling interval (sec) for --profile-mode sample.")
+    ap.add_argument("--profile-out", default=None, help="Output prefix for the profile files (default: next to the outputs).")
+
+
+def start_profile(args, default_prefix: str) -> Optional[Profiler]:
+    """
+    Activate a Profiler when --profile (or --profile-mode other than timers,
+    or --profile-alloc) was given; returns None otherwise.
+    """
+    global _ACTIVE
+    if not (args.profile or args.profile_mode != "timers" or args.profile_alloc):
+        return None
+    prof = Profiler(mode=args.profile_mode, alloc=args.profile_alloc, interval=args.profile_interval)
+    prof.prefix = args.profile_out or default_prefix
+    _ACTIVE = prof.start()
+    return prof
+
+
+def finish_profile(prof: Optional[Profiler]) -> None:
+    global _ACTIVE
+    if prof is None:
+        return
+    prof.stop()
+    _ACTIVE = None
+    paths = prof.save(prof.prefix)
+    print(prof.format_table())
+    print("Wrote profile:", ", ".join(paths))
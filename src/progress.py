@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+# ============================================================
+# Live progress / throughput / ETA for sweeps
+# ============================================================
+#
+# The runners plan treatments x temps x items x k generations up front and
+# report each completed one here. Every --progress-interval seconds a one-line
+# report goes to stderr and the same snapshot is written (atomically) to the
+# status JSON, which other tools can poll:
+#
+#   python -m src.progress outputs/runs.status.json --watch 10
+#
+# Rates (RPM, TPM), latency p50 / p95, parse-failure and retry rates are over
+# the last --progress-window seconds; ETA divides the remaining work by the
+# windowed rate (whole-run rate until the window has a few requests). "retry"
+# counts generations whose backend had to resend the request (retry_sec > 0,
+# e.g. the ChatGPT backend dropping a parameter the model rejects); an API
+# error that is not retried ends the run. If the process exits
+# before finish(), the status file is left with state "aborted".
+
+
+def _pct(sorted_vals, q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    i = min(len(sorted_vals) - 1, max(0, int(round(q / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+def _fmt_dur(sec: Optional[float]) -> str:
+    if sec is None:
+        return "?"
+    sec = int(sec)
+    h, rem = divmod(sec, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+class ProgressTracker:
+    def __init__(
+        self,
+        planned: int,
+        status_path: Optional[str] = None,
+        interval: float = 10.0,
+        window: float = 300.0,
+        label: str = "",
+        quiet: bool = False,
+    ) -> None:
+        self.planned = int(planned)
+        self.status_path = status_path
+        self.interval = interval
+        self.window = window
+        self.label = label
+        self.quiet = quiet
+        self.t_start = time.time()
+        self.completed = 0
+        self.tokens = 0
+        self.parse_failures = 0
+        self.retries = 0
+        self.by_config: Counter = Counter()
+        self.current_config = ""
+        # (finish time, latency sec, output tokens, parsed, retried)
+        self._recent: Deque[Tuple[float, float, int, bool, bool]] = deque()
+        self._last_report = self.t_start
+        self._done = False
+        atexit.register(self._abort)
+        self._write(self.snapshot(state="running"))
+
+    def update(
+        self,
+        config_id: str,
+        latency_sec: float,
+        output_tokens: Optional[int] = None,
+        parsed: bool = True,
+        retried: bool = False,
+    ) -> None:
+        now = time.time()
+        tok = int(output_tokens or 0)
+        self.completed += 1
+        self.tokens += tok
+        self.parse_failures += 0 if parsed else 1
+        self.retries += 1 if retried else 0
+        self.by_config[config_id] += 1
+        self.current_config = config_id
+        self._recent.append((now, float(latency_sec), tok, parsed, retried))
+        while self._recent and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+        if now - self._last_report >= self.interval:
+            self.report(now)
+
+    def snapshot(self, state: str = "running", now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        elapsed = now - self.t_start
+        recent = [r for r in self._recent if r[0] >= now - self.window]
+        span = min(self.window, elapsed)
+        if len(recent) >= 5 and span > 0:
+            rate = len(recent) / span  # req / sec over the window
+            tok_rate = sum(r[2] for r in recent) / span
+        else:
+            rate = self.completed / elapsed if elapsed > 0 else 0.0
+            tok_rate = self.tokens / elapsed if elapsed > 0 else 0.0
+        lat = sorted(r[1] for r in recent)
+        remaining = max(self.planned - self.completed, 0)
+        eta = remaining / rate if rate > 0 else None
+        n_recent = max(len(recent), 1)
+        return {
+            "label": self.label,
+            "state": state,
+            "pid": os.getpid(),
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.t_start)),
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+            "elapsed_sec": round(elapsed, 1),
+            "planned": self.planned,
+            "completed": self.completed,
+            "pct": round(100.0 * self.completed / self.planned, 2) if self.planned else 100.0,
+            "current_config": self.current_config,
+            "completed_by_config": dict(self.by_config),
+            "window_sec": self.window,
+            "rpm": round(60.0 * rate, 2),
+            "tpm": round(60.0 * tok_rate, 1),
+            "latency_p50_sec": _pct(lat, 50),
+            "latency_p95_sec": _pct(lat, 95),
+            "parse_failure_rate": round(sum(not r[3] for r in recent) / n_recent, 4),
+            "retry_rate": round(sum(r[4] for r in recent) / n_recent, 4),
+            "total_output_tokens": self.tokens,
+            "total_parse_failures": self.parse_failures,
+            "total_retries": self.retries,
+            "eta_sec": round(eta, 1) if eta is not None else None,
+            "eta_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now + eta)) if eta is not None else None,
+        }
+
+    def _write(self, snap: Dict[str, Any]) -> None:
+        if not self.status_path:
+            return
+        os.makedirs(os.path.dirname(self.status_path) or ".", exist_ok=True)
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f, indent=2)
+        os.replace(tmp, self.status_path)
+
+    def report(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        snap = self.snapshot(now=now)
+        self._write(snap)
+        if not self.quiet:
+            print(format_line(snap), file=sys.stderr, flush=True)
+        self._last_report = now
+        return snap
+
+    def finish(self, state: str = "done") -> None:
+        self._done = True
+        atexit.unregister(self._abort)
+        self._write(self.snapshot(state=state))
+
+    def _abort(self) -> None:
+        if not self._done:
+            self._write(self.snapshot(state="aborted"))
+
+
+def format_line(s: Dict[str, Any]) -> str:
+    p50 = f"{s['latency_p50_sec']:.2f}s" if s["latency_p50_sec"] is not None else "-"
+    p95 = f"{s['latency_p95_sec']:.2f}s" if s["latency_p95_sec"] is not None else "-"
+    return (
+        f"[{s['label'] or 'run'}] {s['completed']}/{s['planned']} ({s['pct']:.1f}%) {s['current_config']} | "
+        f"{s['rpm']:.1f} rpm {s['tpm']:.0f} tpm | p50 {p50} p95 {p95} | "
+        f"parse fail {100 * s['parse_failure_rate']:.1f}% retry {100 * s['retry_rate']:.1f}% | "
+        f"elapsed {_fmt_dur(s['elapsed_sec'])} eta {_fmt_dur(s['eta_sec'])} ({s['eta_at'] or '?'}) [{s['state']}]"
+    )
+
+
+def add_progress_args(ap) -> None:
+    ap.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between progress lines on stderr and status-file refreshes (0 = status file only).",
+    )
+    ap.add_argument("--progress-window", type=float, default=300.0, help="Seconds of history for rates / percentiles.")
+    ap.add_argument(
+        "--status-json",
+        default=None,
+        help="Status snapshot file for other tools to poll (default: <out-jsonl>.status.json; 'none' to skip).",
+    )
+
+
+def start_progress(args, planned: int, out_jsonl: str) -> ProgressTracker:
+    status = args.status_json or os.path.splitext(out_jsonl)[0] + ".status.json"
+    if status.lower() == "none":
+        status = None
+    return ProgressTracker(
+        planned,
+        status_path=status,
+        interval=args.progress_interval if args.progress_interval > 0 else 10.0,
+        window=args.progress_window,
+        label=os.path.basename(out_jsonl),
+        quiet=args.progress_interval <= 0,
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("status_json", help="Status file written by a runner (<out-jsonl>.status.json).")
+    ap.add_argument("--watch", type=float, default=0.0, help="Re-read every N seconds until the run is done.")
+    ap.add_argument("--json", action="store_true", help="Print the raw snapshot.")
+    args = ap.parse_args()
+
+    while True:
+        with open(args.status_json, "r", encoding="utf-8") as f:
+            snap = json.load(f)
+        print(json.dumps(snap, indent=2) if args.json else format_line(snap), flush=True)
+        if args.watch <= 0 or snap.get("state") != "running":
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
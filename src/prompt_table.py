@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.data_io import iter_dataset_items
+from src.prompts import build_prompt
+
+
+# ============================================================
+# Precompiled prompt table
+# ============================================================
+#
+# A prompt depends only on (treatment, question, allow_explanation), so a run
+# of treatments x temps x items x k needs len(treatments) * len(items) distinct
+# strings. compile() builds each once (identical texts are stored once, keyed by
+# sha256) and pre-counts tokens; the runners look prompts up by
+# (treatment, question_id) inside their loops.
+#
+# save() writes one file that load() memory-maps:
+#
+#   b"STAT496PT1\n" | uint64 header length | header JSON | UTF-8 prompt blob
+#
+# The header holds the table key (hash of the prompt template source, dataset
+# items, treatments and flags), the token-count method, and per-prompt
+# (offset, length, sha256, n_tokens) plus the (treatment, question_id) index.
+# Workers that open the same file share its pages instead of rebuilding prompts.
+
+MAGIC = b"STAT496PT1\n"
+PROMPTS_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.py")
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def _token_counter():
+    """
+    (method, fn): tiktoken's cl100k_base if installed, else a word/punctuation
+    count, which runs ~10-20% under BPE counts on English prompts.
+    """
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken:cl100k_base", lambda s: len(enc.encode(s))
+    except Exception:
+        return "approx_words", lambda s: len(_WORD_RE.findall(s))
+
+
+def allow_for(treatment: str, allow_explanation: bool) -> bool:
+    # T1 is always final-only (build_prompt enforces it too)
+    return allow_explanation and treatment != "T1"
+
+
+def table_key(items: Sequence[Dict[str, Any]], treatments: Sequence[str], allow_explanation: bool) -> str:
+    h = hashlib.sha256()
+    with open(PROMPTS_SRC, "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps([list(treatments), bool(allow_explanation)]).encode())
+    for it in items:
+        h.update(json.dumps([it["id"], it["stem"], it.get("options")], sort_keys=True, ensure_ascii=False).encode())
+    return h.hexdigest()
+
+
+class PromptTable:
+    def __init__(
+        self,
+        key: str,
+        token_method: str,
+        index: Dict[Tuple[str, str], int],
+        meta: List[Dict[str, Any]],
+        texts: Optional[List[str]] = None,
+        blob: Optional[Any] = None,
+    ) -> None:
+        self.key = key
+        self.token_method = token_method
+        self.index = index
+        self.meta = meta  # per unique prompt: sha256, n_tokens (+ offset, length when file-backed)
+        self._texts = texts
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    @classmethod
+    def compile(
+        cls,
+        items: Sequence[Dict[str, Any]],
+        treatments: Sequence[str],
+        allow_explanation: bool,
+        count_tokens: bool = True,
+    ) -> "PromptTable":
+        method, count = _token_counter() if count_tokens else ("none", lambda s: -1)
+        index: Dict[Tuple[str, str], int] = {}
+        by_hash: Dict[str, int] = {}
+        texts: List[str] = []
+        meta: List[Dict[str, Any]] = []
+
+        for t in treatments:
+            for it in items:
+                text = build_prompt(
+                    treatment=t,
+                    stem=it["stem"],
+                    options=it.get("options", None),
+                    allow_explanation=allow_for(t, allow_explanation),
+                )
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                pid = by_hash.get(digest)
+                if pid is None:
+                    pid = by_hash[digest] = len(texts)
+                    texts.append(text)
+                    meta.append({"sha256": digest, "n_tokens": count(text)})
+                if index.setdefault((t, it["id"]), pid) != pid:
+                    raise ValueError(f"Duplicate question id with different content: {it['id']!r}")
+
+        return cls(table_key(items, treatments, allow_explanation), method, index, meta, texts=texts)
+
+    # ---------------- lookup ----------------
+
+    def _text(self, pid: int) -> str:
+        if self._texts is not None:
+            return self._texts[pid]
+        m = self.meta[pid]
+        return bytes(self._blob[m["offset"] : m["offset"] + m["length"]]).decode("utf-8")
+
+    def prompt(self, treatment: str, question_id: str) -> str:
+        return self._text(self.index[(treatment, question_id)])
+
+    def info(self, treatment: str, question_id: str) -> Dict[str, Any]:
+        return self.meta[self.index[(treatment, question_id)]]
+
+    def total_tokens(self) -> int:
+        return sum(max(m["n_tokens"], 0) for m in self.meta)
+
+    # ---------------- storage ----------------
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        chunks, meta, offset = [], [], 0
+        for pid, m in enumerate(self.meta):
+            data = self._text(pid).encode("utf-8")
+            chunks.append(data)
+            meta.append({"sha256": m["sha256"], "n_tokens": m["n_tokens"], "offset": offset, "length": len(data)})
+            offset += len(data)
+        header = json.dumps(
+            {
+                "key": self.key,
+                "token_method": self.token_method,
+                "prompts": meta,
+                "index": [[t, q, pid] for (t, q), pid in self.index.items()],
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for c in chunks:
+                f.write(c)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PromptTable":
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a prompt table: {path}")
+        pos = len(MAGIC)
+        (n,) = struct.unpack("<Q", mm[pos : pos + 8])
+        header = json.loads(mm[pos + 8 : pos + 8 + n].decode("utf-8"))
+        blob = memoryview(mm)[pos + 8 + n :]
+        index = {(t, q): pid for t, q, pid in header["index"]}
+        return cls(header["key"], header["token_method"], index, header["prompts"], blob=blob)
+
+
+def load_or_compile(
+    path: Optional[str],
+    items: Sequence[Dict[str, Any]],
+    treatments: Sequence[str],
+    allow_explanation: bool,
+) -> PromptTable:
+    """
+    Reuse the table at path if it was compiled from the same template, items,
+    treatments and flags; otherwise compile (and save when path is given).
+    """
+    if path and os.path.exists(path):
+        try:
+            table = PromptTable.load(path)
+            if table.key == table_key(items, treatments, allow_explanation):
+                return table
+        except (ValueError, OSError, KeyError):
+            pass
+    table = PromptTable.compile(items, treatments, allow_explanation)
+    if path:
+        table.save(path)
+    return table
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dataset", required=True, help="JSONL dataset path.")
+    ap.add_argument("--treatments", nargs="+", default=["T0", "T1", "T2", "T3", "T4", "T5"])
+    ap.add_argument("--allow-explanation", action="store_true")
+    ap.add_argument("--out", required=True, help="Prompt table file (pass the same path to the runners' --prompt-table).")
+    args = ap.parse_args()
+
+    items = list(iter_dataset_items(args.dataset))
+    table = load_or_compile(args.out, items, args.treatments, args.allow_explanation)
+    print(
+        f"Prompt table: {args.out} ({len(table)} unique prompts for {len(table.index)} (treatment, question) pairs; "
+        f"~{table.total_tokens()} prompt tokens, {table.token_method})"
+    )
+
+
+if __name__ == "__main__":
+    main()
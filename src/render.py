@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+
+# ============================================================
+# Figure rendering stage
+# ============================================================
+#
+# Analysis scripts describe each figure as a PlotSpec: the module and name of
+# a plot function plus plain kwargs (DataFrames, strings, numbers; never fitted
+# model objects). render_specs() ships the specs to a process pool and each
+# worker imports matplotlib with the Agg backend on first use. The parent
+# never imports matplotlib, so --no-plots runs skip that cost entirely.
+
+
+def pyplot():
+    """
+    matplotlib.pyplot on the Agg backend, imported on first call.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+@dataclass
+class PlotSpec:
+    key: str
+    group: str
+    module: str
+    func: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def add_plot_args(ap) -> None:
+    ap.add_argument(
+        "--plots",
+        default="all",
+        help="Figures to render: all, none, or a comma list of groups/keys "
+        "(e.g. tradeoff,forest or bar_accuracy).",
+    )
+    ap.add_argument("--no-plots", action="store_true", help="Skip all figures (same as --plots none).")
+    ap.add_argument(
+        "--plot-workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Processes used to render figures (1 = render in this process).",
+    )
+
+
+def select_specs(specs: Sequence[PlotSpec], plots: str, no_plots: bool = False) -> List[PlotSpec]:
+    if no_plots or plots.strip().lower() == "none":
+        return []
+    if plots.strip().lower() == "all":
+        return list(specs)
+    wanted = {x.strip() for x in plots.split(",") if x.strip()}
+    known = {s.key for s in specs} | {s.group for s in specs}
+    unknown = sorted(wanted - known)
+    if unknown:
+        raise ValueError(f"Unknown --plots entries: {unknown}. Known: {sorted(known)}")
+    return [s for s in specs if s.key in wanted or s.group in wanted]
+
+
+def _render_one(module: str, func: str, kwargs: Dict[str, Any]) -> float:
+    t0 = time.time()
+    pyplot()
+    fn = getattr(importlib.import_module(module), func)
+    fn(**kwargs)
+    return time.time() - t0
+
+
+def render_specs(specs: Sequence[PlotSpec], workers: int = 1) -> Dict[str, float]:
+    """
+    Render every spec; returns {key: seconds}. Errors propagate after all
+    submitted figures finish.
+    """
+    timings: Dict[str, float] = {}
+    if not specs:
+        return timings
+
+    if workers <= 1 or len(specs) == 1:
+        for s in specs:
+            timings[s.key] = _render_one(s.module, s.func, s.kwargs)
+        return timings
+
+    errors: List[str] = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(specs))) as ex:
+        futs = {s.key: ex.submit(_render_one, s.module, s.func, s.kwargs) for s in specs}
+        for key, fut in futs.items():
+            try:
+                timings[key] = fut.result()
+            except Exception as e:
+                errors.append(f"{key}: {e}")
+    if errors:
+        raise RuntimeError("Plot rendering failed:\n" + "\n".join(errors))
+    return timings
+
+
+def run_render_stage(specs: Sequence[PlotSpec], args, label: Optional[str] = None) -> None:
+    chosen = select_specs(specs, args.plots, args.no_plots)
+    if not chosen:
+        return
+    t0 = time.time()
+    render_specs(chosen, workers=args.plot_workers)
+    print(f"Rendered {len(chosen)} figure(s) in {time.time() - t0:.1f}s" + (f" ({label})" if label else ""))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.parsing import answer_kind, is_correct, parse_with_tier
+
+
+# ============================================================
+# Offline re-parse / re-score of saved run JSONL files
+# ============================================================
+#
+# Every run row keeps raw_output, ground_truth, question_type and
+# answer_format, so a parser or scorer change can be applied to old runs
+# without calling any model. Files are streamed in chunks of lines; chunks go
+# to a process pool (bounded number in flight) and results are written back in
+# input order, so memory stays at a few chunks per worker.
+#
+# Output modes:
+#   full   <out-dir>/<name>.jsonl       every row, parsed_answer / correct replaced,
+#                                        parse_tier added (other keys untouched)
+#   patch  <out-dir>/<name>.patch.jsonl run_id + parsed_answer, correct, parse_tier
+#                                        and the previous values
+#   none   summary only
+#
+# <name> is the input's path relative to the inputs' common directory, so
+# outputs/a/runs.jsonl and outputs/b/runs.jsonl land in <out-dir>/a/ and
+# <out-dir>/b/ instead of overwriting each other.
+
+
+SUMMARY_COLS = [
+    "file",
+    "config_id",
+    "n_rows",
+    "n_skipped",
+    "answer_changed",
+    "became_correct",
+    "became_incorrect",
+    "accuracy_before",
+    "accuracy_after",
+]
+
+
+def rescore_row(row: Dict[str, Any]) -> Optional[Tuple[str, bool, str]]:
+    """
+    (parsed_answer, correct, parse_tier) for a run row, or None if it has no raw_output.
+    """
+    if "raw_output" not in row:
+        return None
+    item = {"type": row.get("question_type", ""), "answer_format": row.get("answer_format", "")}
+    parsed, tier = parse_with_tier(answer_kind(item), row.get("raw_output") or "")
+    fmt = row.get("answer_format", "letters")
+    return parsed, bool(is_correct(parsed, row.get("ground_truth") or [], fmt)), tier
+
+
+def _rescore_chunk(lines: List[str], mode: str) -> Tuple[List[str], Dict[str, List[int]]]:
+    """
+    Worker: rescore raw JSONL lines. Returns (output lines, per-config counters
+    [n, skipped, answer_changed, became_correct, became_incorrect, correct_before, correct_after]).
+    """
+    out: List[str] = []
+    stats: Dict[str, List[int]] = defaultdict(lambda: [0] * 7)
+    for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        s = stats[str(row.get("config_id", ""))]
+        s[0] += 1
+        res = rescore_row(row)
+        old_ans, old_ok = row.get("parsed_answer", ""), bool(row.get("correct"))
+        if res is None:
+            s[1] += 1
+            if mode == "full":
+                out.append(line.rstrip("\n"))
+            continue
+
+        parsed, ok, tier = res
+        s[2] += parsed != old_ans
+        s[3] += ok and not old_ok
+        s[4] += old_ok and not ok
+        s[5] += old_ok
+        s[6] += ok
+
+        if mode == "full":
+            row["parsed_answer"] = parsed
+            row["correct"] = ok
+            row["parse_tier"] = tier
+            out.append(json.dumps(row, ensure_ascii=False))
+        elif mode == "patch":
+            out.append(
+                json.dumps(
+                    {
+                        "run_id": row.get("run_id"),
+                        "parsed_answer": parsed,
+                        "correct": ok,
+                        "parse_tier": tier,
+                        "parsed_answer_before": old_ans,
+                        "correct_before": old_ok,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+    return out, dict(stats)
+
+
+def iter_chunks(path: str, chunk_lines: int) -> Iterator[List[str]]:
+    buf: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            buf.append(line)
+            if len(buf) >= chunk_lines:
+                yield buf
+                buf = []
+    if buf:
+        yield buf
+
+
+def rescore_file(
+    path: str,
+    out_path: Optional[str],
+    mode: str,
+    ex: Optional[ProcessPoolExecutor],
+    chunk_lines: int = 2000,
+    max_in_flight: int = 8,
+) -> Dict[str, List[int]]:
+    totals: Dict[str, List[int]] = defaultdict(lambda: [0] * 7)
+    fout = None
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        fout = open(out_path + ".tmp", "w", encoding="utf-8")
+
+    def consume(result: Tuple[List[str], Dict[str, List[int]]]) -> None:
+        lines, stats = result
+        if fout is not None:
+            for ln in lines:
+                fout.write(ln + "\n")
+        for cfg, s in stats.items():
+            t = totals[cfg]
+            for i, v in enumerate(s):
+                t[i] += v
+
+    try:
+        if ex is None:
+            for chunk in iter_chunks(path, chunk_lines):
+                consume(_rescore_chunk(chunk, mode))
+        else:
+            pending = []
+            for chunk in iter_chunks(path, chunk_lines):
+                pending.append(ex.submit(_rescore_chunk, chunk, mode))
+                if len(pending) >= max_in_flight:
+                    consume(pending.pop(0).result())
+            for fut in pending:
+                consume(fut.result())
+    finally:
+        if fout is not None:
+            fout.close()
+    if out_path:
+        os.replace(out_path + ".tmp", out_path)
+    return dict(totals)
+
+
+def is_run_file(path: str) -> bool:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    return False
+                return isinstance(row, dict) and "raw_output" in row and "config_id" in row
+    return False
+
+
+def summary_rows(file_label: str, totals: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+    rows = []
+    for cfg in sorted(totals):
+        n, skipped, changed, up, down, before, after = totals[cfg]
+        scored = max(n - skipped, 1)
+        rows.append(
+            {
+                "file": file_label,
+                "config_id": cfg,
+                "n_rows": n,
+                "n_skipped": skipped,
+                "answer_changed": changed,
+                "became_correct": up,
+                "became_incorrect": down,
+                "accuracy_before": round(before / scored, 4),
+                "accuracy_after": round(after / scored, 4),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--runs",
+        nargs="+",
+        default=["outputs/**/*.jsonl"],
+        help="Run JSONL files or globs (non-run JSONL files are skipped).",
+    )
+    ap.add_argument("--out-dir", default="outputs/rescored")
+    ap.add_argument("--mode", choices=["full", "patch", "none"], default="patch")
+    ap.add_argument("--summary-csv", default=None, help="Per file x config diff summary (default: <out-dir>/rescore_summary.csv).")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-lines", type=int, default=2000)
+    ap.add_argument("--only-changed", action="store_true", help="Print only configs with changed verdicts.")
+    args = ap.parse_args()
+
+    paths: List[str] = []
+    for pat in args.runs:
+        paths.extend(sorted(glob.glob(pat, recursive=True)) if any(c in pat for c in "*?[") else [pat])
+    out_root = os.path.abspath(args.out_dir)
+    paths = [p for p in dict.fromkeys(paths) if not os.path.abspath(p).startswith(out_root + os.sep) and is_run_file(p)]
+    if not paths:
+        raise ValueError(f"No run JSONL files matched: {args.runs}")
+
+    # Mirror each input under --out-dir relative to the inputs' common directory
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    rel = {p: os.path.relpath(os.path.abspath(p), root) for p in paths}
+
+    t0 = time.time()
+    all_rows: List[Dict[str, Any]] = []
+    ex = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        for p in paths:
+            name = os.path.splitext(rel[p])[0]
+            out_path = None
+            if args.mode == "full":
+                out_path = os.path.join(args.out_dir, name + ".jsonl")
+            elif args.mode == "patch":
+                out_path = os.path.join(args.out_dir, name + ".patch.jsonl")
+            totals = rescore_file(p, out_path, args.mode, ex, chunk_lines=args.chunk_lines, max_in_flight=2 * args.workers)
+            all_rows.extend(summary_rows(p, totals))
+    finally:
+        if ex is not None:
+            ex.shutdown()
+
+    summary_csv = args.summary_csv or os.path.join(args.out_dir, "rescore_summary.csv")
+    os.makedirs(os.path.dirname(summary_csv) or ".", exist_ok=True)
+    with open(summary_csv, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_COLS)
+        w.writeheader()
+        w.writerows(all_rows)
+
+    n_rows = sum(r["n_rows"] for r in all_rows)
+    n_flip = sum(r["became_correct"] + r["became_incorrect"] for r in all_rows)
+    n_changed = sum(r["answer_changed"] for r in all_rows)
+    print(f"{'file / config':<60} {'rows':>6} {'ans chg':>8} {'+ok':>5} {'-ok':>5} {'acc before':>10} {'after':>7}")
+    for r in all_rows:
+        if args.only_changed and not (r["became_correct"] or r["became_incorrect"]):
+            continue
+        label = f"{rel[r['file']]}:{r['config_id']}"
+        print(
+            f"{label[-60:]:<60} {r['n_rows']:>6} {r['answer_changed']:>8} {r['became_correct']:>5} "
+            f"{r['became_incorrect']:>5} {r['accuracy_before']:>10.4f} {r['accuracy_after']:>7.4f}"
+        )
+    print(
+        f"Rescored {n_rows} rows in {len(paths)} files ({time.time() - t0:.1f}s): "
+        f"{n_changed} answers changed, {n_flip} verdicts flipped. Summary: {summary_csv}"
+    )
+
+
+if __name__ == "__main__":
+    main()
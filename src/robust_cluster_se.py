@@ -7,16 +7,18 @@ from typing import Tuple
 
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
+
+from src.answer_counts import read_per_question
+from src.count_logit import prepare_cells
+from src.logit_fit import fit_models
 
 
 def split_config_id(config_id: str) -> Tuple[str, float]:
-    # expects: T0_temp0.2
+    # expects: T0_temp0.2 (design plans may append _topp0.9 / _max128 / _model-x)
     if isinstance(config_id, str) and "_temp" in config_id:
         t, temp = config_id.split("_temp", 1)
         try:
-            return t, float(temp)
+            return t, float(temp.split("_", 1)[0])
         except ValueError:
             return t, float("nan")
     return str(config_id), float("nan")
@@ -66,6 +68,9 @@ def fit_glm_cluster(df: pd.DataFrame, formula: str, groups: pd.Series):
     We fit directly with cov_type='cluster' because some statsmodels versions
     return None from _get_robustcov_results().
     """
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+
     model = smf.glm(
         formula=formula,
         data=df,
@@ -89,13 +94,19 @@ def fit_glm_cluster(df: pd.DataFrame, formula: str, groups: pd.Series):
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--per-question-csv", required=True)
+    ap.add_argument("--per-question-csv", required=True, help="per-question CSV, or the exact answer-count *_counts.npz from analyze_results.")
     ap.add_argument("--out-dir", default="outputs/robust_cluster")
+    ap.add_argument(
+        "--engine",
+        choices=["numpy", "statsmodels"],
+        default="numpy",
+        help="numpy: IRLS + cluster sandwich on count cells (src.logit_fit). statsmodels: smf.glm formula fits.",
+    )
     args = ap.parse_args()
 
     os.makedirs(args.out_dir, exist_ok=True)
 
-    df = pd.read_csv(args.per_question_csv)
+    df = read_per_question(args.per_question_csv)
 
     # Parse treatment/temp from config_id
     tt = df["config_id"].apply(lambda x: split_config_id(str(x)))
@@ -114,8 +125,9 @@ def main() -> None:
     df = df.dropna(subset=["question_id", "temp", "k_runs", "accuracy_over_runs"]).copy()
     df["k_runs"] = df["k_runs"].astype(int)
 
-    # successes = round(accuracy * k)
-    df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
+    # successes = round(accuracy * k) unless the input is the exact count tensor
+    if "successes" not in df.columns:
+        df["successes"] = (df["accuracy_over_runs"] * df["k_runs"]).round().astype(int)
     df["successes"] = df["successes"].clip(lower=0, upper=df["k_runs"])
 
     # Binomial proportion response
@@ -131,12 +143,22 @@ def main() -> None:
 
     groups = df["question_id"].astype(str)
 
+    if args.engine == "statsmodels":
+        res_add = fit_glm_cluster(df, "prop ~ C(treatment) + temp", groups)
+        res_int = fit_glm_cluster(df, "prop ~ C(treatment) * temp", groups)
+    else:
+        # cluster_nobs="cells": smf.glm with freq_weights counts one obs per row
+        # in the cluster correction, so this reproduces the statsmodels SEs.
+        fits = fit_models(
+            prepare_cells(df), prefix="glm", cov_type="cluster", cluster_nobs="cells", response="prop"
+        )
+        res_add = fits["glm_additive"]
+        res_int = fits["glm_interaction"]
+
     # -------- Additive (cluster-robust) --------
-    res_add = fit_glm_cluster(df, "prop ~ C(treatment) + temp", groups)
     save_outputs(res_add, os.path.join(args.out_dir, "glm_additive_cluster"))
 
     # -------- Interaction (cluster-robust) --------
-    res_int = fit_glm_cluster(df, "prop ~ C(treatment) * temp", groups)
     save_outputs(res_int, os.path.join(args.out_dir, "glm_interaction_cluster"))
 
     print("Wrote cluster-robust outputs to:", args.out_dir)
@@ -1,13 +1,22 @@
 from __future__ import annotations
 import argparse
 import json
+import os
 import time
 from typing import List
 
 from src.data_io import iter_dataset_items
-from src.prompts import build_prompt
+from src.prompt_table import load_or_compile
 from src.parsing import parse_answer, is_correct
-from src.backends.gpt4all_backend import GPT4AllBackend
+from src.profiling import add_profile_args, finish_profile, stage, start_profile
+from src.progress import add_progress_args, start_progress
+from src.run_metrics import RunMetrics, add_metrics_args, timed_units, timing_fields
+from src.trace_export import add_trace_args, finish_trace, request_span, start_trace
+from src.work_queue import add_queue_args, grid_units, interleave_units, start_worker
+from src.compact import add_shard_args, resolve_out
+from src.design import add_plan_args, load_plan, plan_treatments, plan_units
+from src.adaptive import add_adaptive_args, arms_from_units, start_scheduler
+from src.sequential import add_stop_args, start_stop_signal
 
 def parse_csv_list(s: str) -> List[str]:
     return [x.strip() for x in s.split(",") if x.strip()]
@@ -29,79 +38,194 @@ def main() -> None:
 
     ap.add_argument("--allow-explanation", action="store_true", help="Allow explanation after FINAL line (recommended).")
 
+    ap.add_argument(
+        "--prompt-table",
+        default=None,
+        help="Prompt table file (src.prompt_table): reused when it matches this dataset/treatments, else written.",
+    )
+
+    add_profile_args(ap)
+    add_metrics_args(ap)
+    add_trace_args(ap)
+    add_progress_args(ap)
+    add_queue_args(ap)
+    add_shard_args(ap)
+    add_plan_args(ap)
+    add_adaptive_args(ap)
+    add_stop_args(ap)
+
     args = ap.parse_args()
+    if args.plan and args.queue:
+        ap.error("with --queue, give the plan to `queue init --plan` instead")
+    if args.adaptive and args.queue:
+        ap.error("--adaptive allocates from this runner's own results and cannot share a --queue")
+    if args.interleave and args.queue:
+        ap.error("with --queue, give --interleave to `queue init` instead")
+    model_label = os.path.basename(args.model_filename)
+    worker = start_worker(args, model=model_label)
+    stop = start_stop_signal(args)  # shared by all shards of --out-jsonl
+    # With --shard, this worker's shard replaces --out-jsonl (status / profile files follow it)
+    args.out_jsonl, out_mode = resolve_out(args, worker.worker_id if worker is not None else None)
+    prof = start_profile(args, os.path.splitext(args.out_jsonl)[0] + ".profile")
+    tracer = start_trace(args, process_name=f"run {os.path.basename(args.out_jsonl)}")
 
     treatments = args.treatments
     temps = [float(x) for x in parse_csv_list(args.temps)]
     k = args.k
+    if worker is not None:
+        # The queue's grid replaces --treatments / --temps / --k
+        treatments, temps, k = worker.treatments, worker.temps, worker.k
+    plan = load_plan(args.plan) if args.plan else None
+    if plan is not None:
+        # So do a design plan's points (src.design)
+        treatments, k = plan_treatments(plan), int(plan.get("k", 1))
     seed = None if args.seed < 0 else args.seed
 
-    backend = GPT4AllBackend(model_filename=args.model_filename)
+    with stage("backend_init"):
+        from src.backends.gpt4all_backend import GPT4AllBackend  # after parse_args so --help works without the SDK
+
+        backend = GPT4AllBackend(model_filename=args.model_filename)
 
-    items = list(iter_dataset_items(args.dataset))
+    with stage("load_dataset"):
+        items = list(iter_dataset_items(args.dataset))
     if not items:
         raise ValueError(f"No items found in dataset: {args.dataset}")
+    if worker is not None:
+        worker.check_dataset(items)
+
+    # Every distinct prompt is built once, not per temp x repeat
+    with stage("prompt_table"):
+        prompts = load_or_compile(args.prompt_table, items, treatments, args.allow_explanation)
 
     # Ensure output directory exists
-    import os
     os.makedirs(os.path.dirname(args.out_jsonl) or ".", exist_ok=True)
 
-    with open(args.out_jsonl, "w", encoding="utf-8") as fout:
-        for t in treatments:
-            for temp in temps:
-                config_id = f"{t}_temp{temp}"
-                for item in items:
-                    qid = item["id"]
-                    stem = item["stem"]
-                    options = item.get("options", None)
-                    gt = item.get("answer", [])
-                    fmt = item.get("answer_format", "letters")
-
-                    for r in range(k):
-                        run_id = f"{config_id}__{qid}__r{r}"
-                        prompt = build_prompt(
-                            treatment=t,
-                            stem=stem,
-                            options=options,
-                            allow_explanation=args.allow_explanation and (t != "T1"),
-                        )
-
-                        t0 = time.time()
-                        res = backend.generate(
-                            prompt=prompt,
-                            temperature=temp,
-                            max_tokens=args.max_tokens,
-                            top_p=args.top_p,
-                            repeat_penalty=args.repeat_penalty,
-                            seed=seed,
-                        )
-                        latency = time.time() - t0
-
-                        parsed = parse_answer(item, res.text)
-                        correct = is_correct(parsed, gt, fmt)
-
-                        row = {
-                            "run_id": run_id,
-                            "config_id": config_id,
-                            "treatment": t,
-                            "temperature": temp,
-                            "k": k,
-                            "question_id": qid,
-                            "question_type": item.get("type", ""),
-                            "answer_format": fmt,
-                            "prompt": prompt,
-                            "raw_output": res.text,
-                            "parsed_answer": parsed,
-                            "ground_truth": gt,
-                            "correct": correct,
-                            "token_count_method": res.token_count_method,
-                            "latency_sec": latency,
-                            "model_filename": args.model_filename,
-                            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                        }
-                        fout.write(json.dumps(row, ensure_ascii=False) + "\n")
-
+    metrics = RunMetrics(textfile=args.metrics_textfile, interval=args.metrics_interval)
+    if worker is not None:
+        units, planned = worker.units(), worker.queue.open_units(model_label)
+    elif plan is not None:
+        units = list(plan_units(plan, items, model=model_label))
+        if not units:
+            raise ValueError(f"Plan {args.plan} has no points for model {model_label}")
+        planned = len(units)
+    else:
+        units, planned = grid_units(treatments, temps, items, k), len(treatments) * len(temps) * len(items) * k
+    if args.interleave and not args.adaptive:
+        # Question by question across configs, so a sequential stop leaves a balanced sample
+        units = interleave_units(units)
+    scheduler = None
+    if args.adaptive:
+        # The grid / plan only names the configs; the scheduler decides how often each one runs
+        scheduler = start_scheduler(args, arms_from_units(units), items, k)
+        units, planned = scheduler.units(), scheduler.budget
+    progress = start_progress(args, planned, args.out_jsonl)
+
+    items_by_id = {item["id"]: item for item in items}
+    try:
+        # Shards are line-buffered so a killed worker loses at most the row in flight
+        with open(args.out_jsonl, out_mode, encoding="utf-8", buffering=1 if out_mode == "a" else -1) as fout:
+            for unit, queue_wait in timed_units(units):
+                if stop.requested():
+                    print(f"Stopping early: {stop.reason}")
+                    break
+                # The request span starts when the loop began waiting for this unit
+                t_ready = time.perf_counter() - queue_wait
+                t, temp, config_id, run_id = unit["treatment"], unit["temperature"], unit["config_id"], unit["run_id"]
+                item = items_by_id[unit["question_id"]]
+                qid = item["id"]
+                gt = item.get("answer", [])
+                fmt = item.get("answer_format", "letters")
+                prompt = prompts.prompt(t, qid)
+
+                t0 = time.time()
+                with stage("generate"):
+                    res = backend.generate(
+                        prompt=prompt,
+                        temperature=temp,
+                        max_tokens=unit.get("max_tokens", args.max_tokens),
+                        top_p=unit.get("top_p", args.top_p),
+                        repeat_penalty=args.repeat_penalty,
+                        seed=seed,
+                    )
+                latency = time.time() - t0
+                timings = {**getattr(res, "timings", {}), "queue_wait_sec": queue_wait, "latency_sec": latency}
+
+                with stage("parse"):
+                    parsed = parse_answer(item, res.text)
+                with stage("score"):
+                    correct = is_correct(parsed, gt, fmt)
+
+                row = {
+                    "run_id": run_id,
+                    "config_id": config_id,
+                    "treatment": t,
+                    "temperature": temp,
+                    "k": k,
+                    **{a: unit[a] for a in ("top_p", "max_tokens", "alloc_batch", "alloc_prob") if a in unit},
+                    "question_id": qid,
+                    "question_type": item.get("type", ""),
+                    "answer_format": fmt,
+                    "prompt": prompt,
+                    "prompt_sha256": prompts.info(t, qid)["sha256"],
+                    "raw_output": res.text,
+                    "parsed_answer": parsed,
+                    "ground_truth": gt,
+                    "correct": correct,
+                    "token_count_method": res.token_count_method,
+                    "latency_sec": latency,
+                    **timing_fields(timings),
+                    "model_filename": args.model_filename,
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                if worker is not None:
+                    row.update(worker_id=worker.worker_id, attempt=unit["attempts"])
+                    # Exactly-once: a row whose lease was lost belongs to whoever holds it now
+                    with stage("queue_complete"):
+                        if not worker.complete(unit, row):
+                            continue
+                with stage("json_encode"):
+                    line = json.dumps(row, ensure_ascii=False) + "\n"
+                with stage("write"):
+                    fout.write(line)
+                if scheduler is not None:
+                    scheduler.observe(row)
+
+                metrics.observe(
+                    config_id,
+                    model_label,
+                    timings,
+                    output_tokens=getattr(res, "output_tokens", None),
+                    input_tokens=getattr(res, "input_tokens", None),
+                    parsed=bool(parsed),
+                )
+                metrics.maybe_export()
+                progress.update(
+                    config_id,
+                    latency,
+                    output_tokens=getattr(res, "output_tokens", None),
+                    parsed=bool(parsed),
+                    retried=bool(timings.get("retry_sec")),
+                )
+                request_span(
+                    t_ready,
+                    run_id=run_id,
+                    config_id=config_id,
+                    question_id=qid,
+                    parsed_answer=parsed,
+                    correct=bool(correct),
+                    **timing_fields(timings),
+                )
+    finally:
+        if worker is not None:
+            worker.close()
+        if scheduler is not None:
+            scheduler.close()
+
+    progress.finish(state="stopped" if stop.reason else "done")
     print(f"Wrote runs to: {args.out_jsonl}")
+    metrics.finish()
+    finish_trace(tracer)
+    finish_profile(prof)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# ============================================================
+# Per-request latency decomposition + run metrics
+# ============================================================
+#
+# Each generation records where its time went (all seconds):
+#
+#   queue_wait_sec    waiting for the next unit: lease + polling on a --queue
+#                     worker, the scheduler's refit with --adaptive (~0 for a
+#                     plain grid / plan)
+#   limiter_wait_sec  sleeping in the backend's RPM throttle
+#   retry_sec         failed attempts before the request that succeeded
+#   request_sec       the successful API / model call
+#   server_sec        server processing time reported by the API (OpenAI's
+#                     openai-processing-ms header), when available
+#   network_sec       request_sec - server_sec: connect, TTFB and transfer
+#                     overhead outside the server's own processing
+#   latency_sec       the runner's existing end-to-end generate() time
+#
+# Responses are not streamed, so TTFB and generation time cannot be split
+# further; server_sec / network_sec is the split the API exposes.
+#
+# RunMetrics keeps one LatencyHistogram per (config, model, component) plus
+# request / token / retry counters, writes them as a Prometheus textfile
+# (node_exporter textfile-collector format, atomically replaced) every
+# --metrics-interval seconds, and prints a per-config summary at the end.
+
+COMPONENTS = ("latency_sec", "queue_wait_sec", "limiter_wait_sec", "retry_sec", "request_sec", "server_sec", "network_sec")
+
+# Bucket bounds (seconds) used when exporting histograms to Prometheus
+PROM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0)
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram over microseconds: values keep their top
+    `precision_bits` bits, so any recorded value is off by < 2^-(bits-1)
+    (0.8% at the default 8 bits) whatever its magnitude. Sparse dict storage.
+
+    The Prometheus `le` buckets are counted separately from the raw value:
+    an HDR bucket can straddle a bound, so it cannot say which side of the
+    bound its values fell on.
+    """
+
+    def __init__(self, precision_bits: int = 8, le_bounds: Sequence[float] = PROM_BUCKETS) -> None:
+        self.bits = precision_bits
+        self.counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.le_bounds = tuple(le_bounds)
+        # le_counts[i]: values in (le_bounds[i-1], le_bounds[i]]; the last slot is above every bound
+        self.le_counts = [0] * (len(self.le_bounds) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        v = max(0, int(round(seconds * 1e6)))
+        shift = max(0, v.bit_length() - self.bits)
+        self.counts[(shift, v >> shift)] += 1
+        self.le_counts[bisect.bisect_left(self.le_bounds, seconds)] += 1
+        self.n += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        if other.le_bounds != self.le_bounds:
+            raise ValueError("Cannot merge histograms with different le bounds.")
+        for k, c in other.counts.items():
+            self.counts[k] += c
+        self.le_counts = [a + b for a, b in zip(self.le_counts, other.le_counts)]
+        self.n += other.n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _bounds(self) -> List[Tuple[float, int]]:
+        # (bucket upper edge in seconds, count), ascending
+        return sorted((((m + 1) << s) / 1e6, c) for (s, m), c in self.counts.items())
+
+    def percentile(self, q: float) -> float:
+        if not self.n:
+            return float("nan")
+        rank = max(1, math.ceil(q / 100.0 * self.n - 1e-9))  # nearest rank
+        seen = 0
+        for upper, c in self._bounds():
+            seen += c
+            if seen >= rank:
+                return min(upper, self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.n if self.n else float("nan")
+
+    def cumulative(self) -> List[int]:
+        """Counts of recorded values <= each of le_bounds (Prometheus le buckets)."""
+        out, seen = [], 0
+        for c in self.le_counts[:-1]:
+            seen += c
+            out.append(seen)
+        return out
+
+
+def _labels(d: Dict[str, Any]) -> str:
+    parts = []
+    for k, v in d.items():
+        s = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{s}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class RunMetrics:
+    def __init__(self, textfile: Optional[str] = None, interval: float = 15.0, prefix: str = "stat496") -> None:
+        self.textfile = textfile
+        self.interval = interval
+        self.prefix = prefix
+        self.hists: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, str, str], float] = defaultdict(float)
+        self.t_start = time.time()
+        self._last_export = 0.0
+
+    def observe(
+        self,
+        config_id: str,
+        model: str,
+        timings: Dict[str, float],
+        output_tokens: Optional[int] = None,
+        input_tokens: Optional[int] = None,
+        parsed: bool = True,
+    ) -> None:
+        for comp in COMPONENTS:
+            v = timings.get(comp)
+            if v is None:
+                continue
+            key = (config_id, model, comp)
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = LatencyHistogram()
+            h.record(float(v))
+        c = self.counters
+        c[(config_id, model, "requests")] += 1
+        c[(config_id, model, "retries")] += 1 if timings.get("retry_sec") else 0
+        c[(config_id, model, "parse_failures")] += 0 if parsed else 1
+        if output_tokens is not None:
+            c[(config_id, model, "output_tokens")] += output_tokens
+        if input_tokens is not None:
+            c[(config_id, model, "input_tokens")] += input_tokens
+        c[(config_id, model, "busy_sec")] += float(timings.get("latency_sec") or 0.0)
+
+    # ---------------- Prometheus textfile ----------------
+
+    def prometheus_text(self) -> str:
+        p = self.prefix
+        lines: List[str] = []
+        by_comp: Dict[str, List[Tuple[Tuple[str, str], LatencyHistogram]]] = defaultdict(list)
+        for (cfg, model, comp), h in sorted(self.hists.items()):
+            by_comp[comp].append(((cfg, model), h))
+        for comp in COMPONENTS:
+            if comp not in by_comp:
+                continue
+            name = f"{p}_request_{comp.replace('_sec', '')}_seconds"
+            lines.append(f"# HELP {name} Per-request {comp.replace('_sec', '').replace('_', ' ')} (seconds).")
+            lines.append(f"# TYPE {name} histogram")
+            for (cfg, model), h in by_comp[comp]:
+                base = {"config_id": cfg, "model": model}
+                for le, cum in zip(h.le_bounds, h.cumulative()):
+                    lines.append(f"{name}_bucket{_labels({**base, 'le': le})} {cum}")
+                lines.append(f"{name}_bucket{_labels({**base, 'le': '+Inf'})} {h.n}")
+                lines.append(f"{name}_sum{_labels(base)} {h.total:.6f}")
+                lines.append(f"{name}_count{_labels(base)} {h.n}")
+
+        for counter, help_ in [
+            ("requests", "Completed generations."),
+            ("retries", "Generations that needed a retry."),
+            ("parse_failures", "Generations with no parseable answer."),
+            ("output_tokens", "Output tokens reported by the backend."),
+            ("input_tokens", "Input tokens reported by the backend."),
+        ]:
+            rows = sorted((k[:2], v) for k, v in self.counters.items() if k[2] == counter)
+            if not rows:
+                continue
+            name = f"{p}_{counter}_total"
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} counter")
+            for (cfg, model), v in rows:
+                lines.append(f"{name}{_labels({'config_id': cfg, 'model': model})} {v:g}")
+
+        lines.append(f"# HELP {p}_run_elapsed_seconds Seconds since the run started.")
+        lines.append(f"# TYPE {p}_run_elapsed_seconds gauge")
+        lines.append(f"{p}_run_elapsed_seconds {time.time() - self.t_start:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        if not self.textfile:
+            return
+        os.makedirs(os.path.dirname(self.textfile) or ".", exist_ok=True)
+        tmp = self.textfile + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self.textfile)
+        self._last_export = time.time()
+
+    def maybe_export(self) -> None:
+        if self.textfile and time.time() - self._last_export >= self.interval:
+            self.export()
+
+    # ---------------- end-of-run summary ----------------
+
+    def summary_records(self) -> List[Dict[str, Any]]:
+        keys = sorted({k[:2] for k in self.counters})
+        out = []
+        for cfg, model in keys:
+            c = lambda name: self.counters.get((cfg, model, name), 0.0)  # noqa: E731
+            lat = self.hists.get((cfg, model, "latency_sec"), LatencyHistogram())
+            rec: Dict[str, Any] = {
+                "config_id": cfg,
+                "model": model,
+                "requests": int(c("requests")),
+                "p50_sec": round(lat.percentile(50), 4),
+                "p95_sec": round(lat.percentile(95), 4),
+                "p99_sec": round(lat.percentile(99), 4),
+                "max_sec": round(lat.max, 4) if lat.n else float("nan"),
+            }
+            for comp in ("queue_wait_sec", "limiter_wait_sec", "retry_sec", "server_sec", "network_sec"):
+                h = self.hists.get((cfg, model, comp))
+                if h is not None:
+                    rec[f"mean_{comp}"] = round(h.mean(), 4)
+            busy = c("busy_sec")
+            rec["output_tokens_per_sec"] = round(c("output_tokens") / busy, 2) if busy and c("output_tokens") else ""
+            rec["retries"] = int(c("retries"))
+            rec["parse_failures"] = int(c("parse_failures"))
+            out.append(rec)
+        return out
+
+    def format_summary(self) -> str:
+        recs = self.summary_records()
+        if not recs:
+            return "No requests recorded."
+        cols = list(dict.fromkeys(k for r in recs for k in r))
+        widths = {k: max(len(k), *(len(str(r.get(k, ""))) for r in recs)) for k in cols}
+        lines = [" ".join(f"{k:>{widths[k]}}" for k in cols)]
+        for r in recs:
+            lines.append(" ".join(f"{str(r.get(k, '')):>{widths[k]}}" for k in cols))
+        return "\n".join(lines)
+
+    def finish(self) -> None:
+        self.export()
+        print("Latency by config (seconds):")
+        print(self.format_summary())
+        if self.textfile:
+            print(f"Wrote metrics: {self.textfile}")
+
+
+def add_metrics_args(ap) -> None:
+    ap.add_argument(
+        "--metrics-textfile",
+        default=None,
+        help="Prometheus textfile (e.g. for node_exporter's textfile collector) refreshed during the run.",
+    )
+    ap.add_argument("--metrics-interval", type=float, default=15.0, help="Seconds between textfile refreshes.")
+
+
+def timed_units(units: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], float]]:
+    """
+    (unit, seconds spent waiting for it): the time inside the source's
+    next(), i.e. queue leases / polls or adaptive scheduling.
+    """
+    it = iter(units)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            unit = next(it)
+        except StopIteration:
+            return
+        yield unit, time.perf_counter() - t0
+
+
+def timing_fields(timings: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """
+    Run-row columns for a request's latency components (None when not measured).
+    """
+    return {c: (round(float(timings[c]), 6) if timings.get(c) is not None else None) for c in COMPONENTS if c != "latency_sec"}
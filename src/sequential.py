@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import time
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# ============================================================
+# Sequential stopping of a whole sweep
+# ============================================================
+#
+# The monitor tails a run file (or shards) while a runner writes it. Every
+# --every-rows new rows it refits analyze_plot_regression's question-clustered
+# logit (src.logit_fit.fit_models, --model-type additive by default) and looks
+# at the treatment log odds ratios vs the baseline (T0). Each contrast is
+#
+#   precise   the 95% clustered CI half-width is <= --target-halfwidth
+#   decided   it crossed the sequential boundary (sign settled), at
+#             --alpha across all contrasts (Bonferroni):
+#               msprt  always-valid mixture SPRT with a N(0, --mixture-sd^2)
+#                      prior on the log OR. Valid at any number of looks;
+#                      also gives an always-valid CI (cs_low / cs_high).
+#               obf    Lan-DeMets O'Brien-Fleming alpha spending over the
+#                      information fraction rows / planned (status file or
+#                      --max-rows); each look tests at the alpha spent since
+#                      the contrast's previous testable look.
+#
+# A contrast can only be decided once it and the baseline both have
+# --min-questions questions: before that the clustered SE rests on a handful
+# of clusters. Those looks do not test, and obf spends no alpha on them.
+#
+# Once every contrast meets --rule (precision / decision / either), every
+# treatment has --min-questions questions and all --treatments have appeared,
+# the monitor writes the stop file. Run the sweep with --interleave (or
+# `queue init --interleave`) so every look sees all configs on the same
+# questions; a config-by-config grid only reaches later treatments late.
+# Runners poll it (StopSignal) between calls, finish the row in flight and
+# exit with status state "stopped"; queue workers release their leases.
+#
+#   python -m src monitor --in-jsonl outputs/runs.jsonl --target-halfwidth 0.25
+#
+# Shards (--in-jsonl "outputs/runs.shard-*.jsonl") share the sweep's stop
+# file, outputs/runs.stop; planned rows and the done state come from each
+# shard's own status file. Every checkpoint is appended to
+# <sweep stem>.sequential.jsonl. A torn line (a worker killed mid-write) is
+# skipped and counted, as in compact. The fit treats each question as a cluster
+# and uses only the rows seen so far; the normal approximation behind both
+# boundaries needs a reasonable number of questions.
+
+BOUNDARIES = ("msprt", "obf")
+RULES = ("precision", "decision", "either")
+
+
+def default_stop_file(out_jsonl: str) -> str:
+    return os.path.splitext(out_jsonl)[0] + ".stop"
+
+
+def add_stop_args(ap) -> None:
+    ap.add_argument(
+        "--stop-file",
+        default=None,
+        help="Stop cleanly once this file exists, e.g. written by `stat496 monitor` "
+        "(default: <out-jsonl stem>.stop; 'none' to disable).",
+    )
+    ap.add_argument(
+        "--interleave",
+        action="store_true",
+        help="Run question by question across all configs instead of config by config, "
+        "so a sweep stopped early is balanced (use with `stat496 monitor`).",
+    )
+
+
+class StopSignal:
+    """Checks for the stop file at most every `interval` seconds; once seen, stays set."""
+
+    def __init__(self, path: Optional[str], interval: float = 2.0) -> None:
+        self.path = path
+        self.interval = interval
+        self.reason: Optional[str] = None
+        self._checked = 0.0
+
+    def requested(self) -> bool:
+        if self.reason is not None:
+            return True
+        if not self.path:
+            return False
+        now = time.time()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.reason = str(json.load(f).get("reason") or "stop file")
+        except (OSError, ValueError):
+            self.reason = "stop file"
+        return True
+
+
+def start_stop_signal(args) -> StopSignal:
+    """StopSignal for a runner; call before --shard replaces out_jsonl so all shards share one stop file."""
+    path = args.stop_file or default_stop_file(args.out_jsonl)
+    if path.lower() == "none":
+        path = None
+    elif os.path.exists(path):
+        raise SystemExit(f"Stop file {path} already exists (left by an earlier monitor?); remove it first.")
+    return StopSignal(path)
+
+
+# ============================================================
+# Boundaries
+# ============================================================
+
+_N = NormalDist()
+
+
+def msprt_crossed(est: float, se: float, alpha: float, tau: float) -> bool:
+    """Normal mixture SPRT: likelihood ratio >= 1/alpha."""
+    V, T = se * se, tau * tau
+    if not (V > 0 and T > 0):
+        return False
+    log_lr = 0.5 * math.log(V / (V + T)) + T * est * est / (2.0 * V * (V + T))
+    return log_lr >= math.log(1.0 / alpha)
+
+
+def msprt_halfwidth(se: float, alpha: float, tau: float) -> float:
+    """Half-width of the always-valid confidence sequence matching msprt_crossed."""
+    V, T = se * se, tau * tau
+    return math.sqrt(V * (V + T) / T * (2.0 * math.log(1.0 / alpha) + math.log((V + T) / V)))
+
+
+def obf_spent(t: float, alpha: float) -> float:
+    """Lan-DeMets O'Brien-Fleming-type alpha spent by information fraction t (two-sided)."""
+    if t <= 0:
+        return 0.0
+    t = min(t, 1.0)
+    return 2.0 - 2.0 * _N.cdf(_N.inv_cdf(1.0 - alpha / 2.0) / math.sqrt(t))
+
+
+# ============================================================
+# Monitor
+# ============================================================
+
+
+class SequentialMonitor:
+    def __init__(self, args) -> None:
+        self.args = args
+        self.decided: Dict[str, Dict[str, Any]] = {}
+        self.looks = 0
+        # obf: information at each contrast's last testable look
+        self.t_prev: Dict[str, float] = {}
+
+    def checkpoint(self, running, planned: Optional[int]) -> Dict[str, Any]:
+        """Refit on the rows so far; return the checkpoint record (rec["stop"] says whether to stop)."""
+        import numpy as np
+
+        from src.count_logit import prepare_cells
+        from src.logit_fit import fit_models
+
+        args = self.args
+        self.looks += 1
+        counts = running.to_counts()
+        cells = prepare_cells(counts.per_question_frame())
+        n_q = int(cells["question_id"].nunique())
+        q_by_t = cells.groupby(cells["treatment"].astype(str))["question_id"].nunique()
+        rec: Dict[str, Any] = {
+            "look": self.looks,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "rows": running.n_rows,
+            "questions": n_q,
+            "configs": len(running.configs),
+            "questions_by_treatment": {t: int(v) for t, v in q_by_t.items()},
+            "stop": False,
+        }
+        if cells["treatment"].nunique() < 2:
+            rec["note"] = "fewer than two treatments so far"
+            return rec
+        with np.errstate(invalid="ignore"):  # a single temp leaves temp / Intercept without an SE
+            res = fit_models(cells, model_types=[args.model_type], prefix="logit", cov_type="cluster")[
+                f"logit_{args.model_type}"
+            ]
+        terms = [t for t in res.params.index if t.startswith("C(treatment)[T.") and ":" not in t]
+        m = max(len(terms), 1)
+        a = args.alpha / m
+
+        t_info = None
+        if args.boundary == "obf":
+            t_info = min(running.n_rows / planned, 1.0) if planned else None
+            if t_info is None:
+                raise SystemExit("--boundary obf needs the planned row count: a status file or --max-rows.")
+            rec["information"] = round(t_info, 4)
+        treated = {t[len("C(treatment)[T."):-1] for t in terms}
+        baseline_q = int(q_by_t[[t for t in q_by_t.index if t not in treated]].min())
+
+        contrasts = []
+        for term in terms:
+            est, se = float(res.params[term]), float(res.bse[term])
+            treatment = term[len("C(treatment)[T."):-1]
+            c: Dict[str, Any] = {
+                "treatment": treatment,
+                "log_or": round(est, 4),
+                "se": round(se, 4),
+                "odds_ratio": round(math.exp(est), 4),
+                "or_ci_low": round(math.exp(est - 1.96 * se), 4),
+                "or_ci_high": round(math.exp(est + 1.96 * se), 4),
+                "halfwidth": round(1.96 * se, 4),
+            }
+            ok = math.isfinite(se) and se > 0
+            c["precise"] = bool(ok and 1.96 * se <= args.target_halfwidth)
+            # Both sides of the contrast need enough clusters before it may be decided
+            c["testable"] = bool(ok and min(int(q_by_t.get(treatment, 0)), baseline_q) >= args.min_questions)
+            crossed = False
+            if args.boundary == "msprt" and ok:
+                hw = msprt_halfwidth(se, a, args.mixture_sd)
+                c["cs_low"], c["cs_high"] = round(math.exp(est - hw), 4), round(math.exp(est + hw), 4)
+                crossed = c["testable"] and msprt_crossed(est, se, a, args.mixture_sd)
+            elif args.boundary == "obf" and c["testable"]:
+                t_prev = self.t_prev.get(treatment, 0.0)
+                spend = max(obf_spent(t_info, a) - obf_spent(t_prev, a), 0.0)
+                self.t_prev[treatment] = t_info
+                p = 2.0 * (1.0 - _N.cdf(abs(est) / se))
+                c["p_value"] = p
+                c["alpha_spent_this_look"] = spend
+                crossed = p < spend
+            if crossed and treatment not in self.decided:
+                self.decided[treatment] = {"look": self.looks, "rows": running.n_rows, "log_or": round(est, 4)}
+            c["decided"] = treatment in self.decided
+            if c["decided"]:
+                c["decided_at"] = self.decided[treatment]
+            contrasts.append(c)
+        rec["contrasts"] = contrasts
+
+        if args.rule == "precision":
+            done = all(c["precise"] for c in contrasts)
+        elif args.rule == "decision":
+            done = all(c["decided"] for c in contrasts)
+        else:
+            done = all(c["precise"] or c["decided"] for c in contrasts)
+        # Every treatment (the baseline too) needs enough questions, and all expected ones must be in
+        covered = int(q_by_t.min()) >= args.min_questions and set(args.treatments or []) <= set(q_by_t.index)
+        rec["stop"] = bool(contrasts) and done and covered
+        return rec
+
+
+def sweep_stem(path: str) -> str:
+    """
+    Stem of the sweep's --out-jsonl for a run file, a shard or a shard glob:
+    outputs/runs.shard-*.jsonl -> outputs/runs, where the runners look for runs.stop.
+    """
+    stem = os.path.splitext(path)[0]
+    return stem.split(".shard-", 1)[0]
+
+
+def _runner_state(status_path: Optional[str]) -> Dict[str, Any]:
+    if not status_path:
+        return {}
+    try:
+        with open(status_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _sweep_state(status_paths: List[str]) -> Tuple[Optional[int], bool]:
+    """
+    (planned rows summed over the status files found, whether every one of
+    them is finished). Each shard's runner writes its own status file.
+    """
+    states = [st for st in (_runner_state(p) for p in status_paths) if st]
+    if not states:
+        return None, False
+    planned = sum(int(st.get("planned") or 0) for st in states) or None
+    return planned, all(st.get("state") in ("done", "aborted", "stopped") for st in states)
+
+
+def _format(rec: Dict[str, Any]) -> str:
+    head = f"[monitor {rec['time'][11:]}] look {rec['look']}: {rec['rows']} rows, {rec['questions']} questions"
+    if "information" in rec:
+        head += f", information {rec['information']:.2f}"
+    parts = []
+    for c in rec.get("contrasts", []):
+        flags = ("P" if c["precise"] else "") + ("D" if c["decided"] else "")
+        parts.append(f"{c['treatment']} OR {c['odds_ratio']:.2f} [{c['or_ci_low']:.2f}, {c['or_ci_high']:.2f}]{'*' + flags if flags else ''}")
+    return head + ("; " + "  ".join(parts) if parts else "") + ("  -> STOP" if rec["stop"] else "")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Stop a running sweep once the treatment odds ratios are pinned down.")
+    ap.add_argument("--in-jsonl", nargs="+", required=True, help="Run file(s) or shard globs being written.")
+    ap.add_argument(
+        "--stop-file",
+        default=None,
+        help="Written to stop the runners (default: <sweep stem>.stop, the shard suffix stripped, as the runners expect).",
+    )
+    ap.add_argument(
+        "--status-json",
+        default=None,
+        help="Runner status file (default: each input's own <stem>.status.json, summed over shards).",
+    )
+    ap.add_argument("--out-jsonl", default=None, help="Checkpoint log (default: <sweep stem>.sequential.jsonl).")
+    ap.add_argument("--every-rows", type=int, default=500, help="Refit after this many new rows.")
+    ap.add_argument("--min-questions", type=int, default=20, help="Never stop while a treatment has fewer questions (clusters).")
+    ap.add_argument("--treatments", nargs="+", default=None, help="Never stop before all of these have rows.")
+    ap.add_argument("--model-type", choices=["additive", "interaction"], default="additive")
+    ap.add_argument("--target-halfwidth", type=float, default=0.25, help="95%% CI half-width on the log-OR scale.")
+    ap.add_argument("--rule", choices=RULES, default="either", help="What each contrast must reach before stopping.")
+    ap.add_argument("--boundary", choices=BOUNDARIES, default="msprt")
+    ap.add_argument("--alpha", type=float, default=0.05, help="Family-wise error over all contrasts and looks.")
+    ap.add_argument("--mixture-sd", type=float, default=0.5, help="msprt: prior sd of the log OR.")
+    ap.add_argument(
+        "--max-rows",
+        type=int,
+        default=None,
+        help="obf: planned rows (default: planned summed over the status files; give it for --queue workers, "
+        "whose status files each count the whole queue).",
+    )
+    ap.add_argument("--poll-sec", type=float, default=2.0)
+    ap.add_argument("--idle-exit-sec", type=float, default=0.0, help="Give up after this long without new rows (0 = never).")
+    ap.add_argument("--dry-run", action="store_true", help="Report checkpoints but never write the stop file.")
+    args = ap.parse_args()
+
+    from src.answer_counts import RunningAnswerCounts
+
+    stem = sweep_stem(args.in_jsonl[0])
+    stop_file = args.stop_file or stem + ".stop"
+    log_path = args.out_jsonl or stem + ".sequential.jsonl"
+
+    def input_paths() -> List[str]:
+        return sorted({p for pat in args.in_jsonl for p in (glob.glob(pat) or ([] if glob.has_magic(pat) else [pat]))})
+
+    def status_paths() -> List[str]:
+        if args.status_json:
+            return [args.status_json]
+        return [os.path.splitext(p)[0] + ".status.json" for p in input_paths()]
+
+    if os.path.exists(stop_file) and not args.dry_run:
+        raise SystemExit(f"Stop file {stop_file} already exists; remove it before monitoring a new sweep.")
+
+    monitor = SequentialMonitor(args)
+    running = RunningAnswerCounts()
+    pos: Dict[str, int] = {}
+    partial: Dict[str, bytes] = {}
+    line_nos: Dict[str, int] = {}
+    bad_lines = 0
+    last_growth = time.time()
+    rows_at_look = 0
+    stopped = None
+
+    def look(final: bool = False) -> Optional[Dict[str, Any]]:
+        nonlocal rows_at_look
+        rows_at_look = running.n_rows
+        planned = args.max_rows or _sweep_state(status_paths())[0]
+        rec = monitor.checkpoint(running, planned)
+        rec["final"] = final
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        print(_format(rec), flush=True)
+        return rec
+
+    print(
+        f"Monitoring {' '.join(args.in_jsonl)}: {args.model_type} logit every {args.every_rows} rows, "
+        f"rule {args.rule}, half-width <= {args.target_halfwidth:g}, {args.boundary} at alpha {args.alpha:g}"
+    )
+    try:
+        while True:
+            grew = False
+            for path in input_paths():
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                if size <= pos.get(path, 0):
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(pos.get(path, 0))
+                    data = f.read(size - pos.get(path, 0))
+                pos[path] = pos.get(path, 0) + len(data)
+                lines = (partial.get(path, b"") + data).split(b"\n")
+                partial[path] = lines.pop()
+                for line in lines:
+                    line_nos[path] = line_nos.get(path, 0) + 1
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        bad_lines += 1
+                        print(
+                            f"[monitor] {path}:{line_nos[path]}: not valid JSON (truncated write?); skipped",
+                            file=sys.stderr,
+                        )
+                        continue
+                    running.add(row)
+                grew = True
+            if grew:
+                last_growth = time.time()
+            if running.n_rows - rows_at_look >= args.every_rows:
+                rec = look()
+                if rec["stop"]:
+                    stopped = rec
+                    break
+            if not grew:
+                if _sweep_state(status_paths())[1]:
+                    break
+                if args.idle_exit_sec > 0 and time.time() - last_growth >= args.idle_exit_sec:
+                    break
+                time.sleep(args.poll_sec)
+    except KeyboardInterrupt:
+        pass
+
+    if stopped is None:
+        if running.n_rows > rows_at_look:
+            look(final=True)
+        print(
+            f"Sweep ended before the stopping rule was met ({running.n_rows} rows, "
+            f"{bad_lines} bad lines skipped); log: {log_path}"
+        )
+        return
+
+    reason = (
+        f"sequential stop at look {stopped['look']} ({stopped['rows']} rows, {stopped['questions']} questions): "
+        f"rule {args.rule} met for {len(stopped['contrasts'])} treatment contrasts"
+    )
+    if args.dry_run:
+        print(f"[dry run] would stop: {reason}")
+        return
+    tmp = stop_file + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"reason": reason, **stopped}, f, indent=2)
+    os.replace(tmp, stop_file)
+    print(f"Wrote stop file: {stop_file}\n{reason}\nlog: {log_path}")
+
+
+if __name__ == "__main__":
+    main()
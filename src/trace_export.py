@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from src import profiling
+
+
+# ============================================================
+# Chrome Trace Event / Perfetto timeline of a run
+# ============================================================
+#
+# With --trace-out, every profiling.stage() in the runner and backend becomes
+# a span on the track of the thread that ran it, and each generation gets an
+# enclosing "request" span (run_id, config, question and latency components
+# as args), so one request reads as
+#
+#   request
+#     generate
+#       throttle            rate-limiter wait
+#       api_call / api_retry  send + server + response (not streamed)
+#     parse  score  json_encode  write
+#
+# Tracks are per thread (main thread first, workers as they appear), so a
+# concurrent runner shows one lane per worker with no change here.
+#
+# Events are "X" (complete) events in the JSON Array Format, written as each
+# span closes; the file is valid JSON once the run ends, and Perfetto / Chrome
+# still load it if the run is interrupted. Open it in https://ui.perfetto.dev
+# or chrome://tracing.
+
+
+class Tracer:
+    def __init__(self, path: str, process_name: str = "stat496") -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        self._tids: Dict[int, int] = {}
+        self._first = True
+        self.n_events = 0
+        self._f.write("[\n")
+        self._emit({"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": process_name}})
+
+    def _emit(self, ev: Dict[str, Any]) -> None:
+        line = json.dumps(ev, ensure_ascii=False, default=str)
+        with self._lock:
+            self._f.write(("" if self._first else ",\n") + line)
+            self._first = False
+            self.n_events += 1
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        tid = self._tids.get(ident)
+        if tid is None:
+            with self._lock:
+                tid = self._tids.setdefault(ident, len(self._tids) + 1)
+            t = threading.current_thread()
+            name = "main" if t is threading.main_thread() else t.name
+            self._emit({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+            self._emit({"name": "thread_sort_index", "ph": "M", "pid": self._pid, "tid": tid, "args": {"sort_index": tid}})
+        return tid
+
+    def us(self, t_perf: float) -> float:
+        """perf_counter() seconds -> trace microseconds."""
+        return round((t_perf - self._t0) * 1e6, 3)
+
+    def complete(self, name: str, t_start: float, t_end: float, cat: str = "stage", **args: Any) -> None:
+        ev = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": self.us(t_start),
+            "dur": round(max(t_end - t_start, 0.0) * 1e6, 3),
+            "pid": self._pid,
+            "tid": self._tid(),
+        }
+        if args:
+            ev["args"] = args
+        self._emit(ev)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "stage", **args: Any):
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, t_start, time.perf_counter(), cat=cat, **args)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write("\n]\n")
+            self._f.close()
+
+
+def add_trace_args(ap) -> None:
+    ap.add_argument(
+        "--trace-out",
+        default=None,
+        help="Write a Chrome Trace Event / Perfetto JSON timeline of every request (spans per stage, per thread).",
+    )
+
+
+def start_trace(args, process_name: str) -> Optional[Tracer]:
+    if not getattr(args, "trace_out", None):
+        return None
+    tracer = Tracer(args.trace_out, process_name=process_name)
+    profiling.set_tracer(tracer)
+    return tracer
+
+
+def request_span(t_ready: float, **args: Any) -> None:
+    """
+    Emit the enclosing "request" span of one generation, from t_ready
+    (perf_counter when the runner reached it) to now.
+    """
+    tracer = profiling.active_tracer()
+    if tracer is not None:
+        tracer.complete("request", t_ready, time.perf_counter(), cat="request", **args)
+
+
+def finish_trace(tracer: Optional[Tracer]) -> None:
+    if tracer is None:
+        return
+    profiling.set_tracer(None)
+    tracer.close()
+    print(f"Wrote trace: {tracer.path} ({tracer.n_events} events; open in ui.perfetto.dev or chrome://tracing)")
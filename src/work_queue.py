@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# ============================================================
+# Shared work queue: several machines running one sweep
+# ============================================================
+#
+# A coordinator expands the (treatment, temp, question, repeat) grid of a
+# sweep into one unit per run_id in a SQLite file on a filesystem every
+# worker can reach:
+#
+#   python -m src queue init --queue /shared/sweep.sqlite --dataset data/q.jsonl \
+#       --treatments T0 T1 T5 --temps 0.2 0.5 0.7 --k 3
+#
+# Each worker runs the usual runner with --queue; the grid comes from the
+# queue, everything else (model, max tokens, ...) from its own flags:
+#
+#   python -m src run gpt4all --queue /shared/sweep.sqlite --dataset data/q.jsonl \
+#       --model-filename model.gguf --out-jsonl outputs/runs_box1.jsonl
+#
+# Workers lease a few units at a time (--queue-batch) for --lease-sec. A
+# heartbeat thread renews the leases of units the worker still holds, so a
+# slow request keeps its lease. A worker that dies stops renewing, its units
+# expire, and the next lease() re-issues them. A unit that fails
+# --max-attempts times is marked failed (`queue requeue` puts it back).
+#
+# Completion is exactly-once per run_id. complete() marks a unit done only if
+# the caller still holds the lease it was issued (same lease_id), and stores
+# the run row in the same transaction (results.run_id is the primary key). A
+# worker whose lease expired mid-request gets False back and drops its row.
+# The queue's results table is then the authoritative copy of the sweep
+# (`queue export`); each worker's own --out-jsonl holds only the rows it
+# completed.
+#
+# Every write is one short BEGIN IMMEDIATE transaction. The journal stays in
+# rollback (DELETE) mode because WAL needs shared memory that network
+# filesystems do not provide. Lease expiry compares wall clocks across
+# machines, so keep --lease-sec well above any clock skew between them.
+
+STATES = ("pending", "leased", "done", "failed")
+
+# Per-unit generation settings a plan can set (stored as JSON in units.params)
+UNIT_PARAMS = ("top_p", "max_tokens", "model")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS units (
+    run_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    config_id TEXT NOT NULL,
+    treatment TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    question_id TEXT NOT NULL,
+    rep INTEGER NOT NULL,
+    model TEXT,
+    params TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS units_state_seq ON units (state, seq);
+CREATE INDEX IF NOT EXISTS units_worker ON units (worker, state);
+CREATE TABLE IF NOT EXISTS results (run_id TEXT PRIMARY KEY, worker TEXT NOT NULL, row TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started_at REAL,
+    last_seen REAL,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def dataset_fingerprint(items: Sequence[Dict[str, Any]]) -> str:
+    """
+    Content hash of the loaded dataset items, so workers can check they have
+    the same questions whatever path the file sits at on their machine.
+    """
+    h = hashlib.sha256()
+    for it in items:
+        h.update(json.dumps(it, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def grid_units(
+    treatments: Sequence[str], temps: Sequence[float], items: Sequence[Dict[str, Any]], k: int
+) -> Iterator[Dict[str, Any]]:
+    """The runners' (treatment, temp, question, repeat) order, one dict per run_id."""
+    for t in treatments:
+        for temp in temps:
+            config_id = f"{t}_temp{temp}"
+            for item in items:
+                for r in range(k):
+                    yield {
+                        "run_id": f"{config_id}__{item['id']}__r{r}",
+                        "config_id": config_id,
+                        "treatment": t,
+                        "temperature": temp,
+                        "question_id": item["id"],
+                        "rep": r,
+                    }
+
+
+def interleave_units(units: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Units reordered repeat by repeat, question by question, every config per
+    question, so a sweep stopped early (src.sequential) is balanced and paired.
+    """
+    units = list(units)
+    q_pos: Dict[str, int] = {}
+    c_pos: Dict[str, int] = {}
+    for u in units:
+        q_pos.setdefault(u["question_id"], len(q_pos))
+        c_pos.setdefault(u["config_id"], len(c_pos))
+    return sorted(units, key=lambda u: (u["rep"], q_pos[u["question_id"]], c_pos[u["config_id"]]))
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(path, timeout=120.0, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=DELETE")
+    con.execute("PRAGMA busy_timeout=120000")
+    return con
+
+
+class WorkQueue:
+    def __init__(self, path: str) -> None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No work queue at {path} (create it with `queue init`).")
+        self.path = path
+        self.con = _connect(path)
+        self.meta = {r["key"]: json.loads(r["value"]) for r in self.con.execute("SELECT key, value FROM meta")}
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        items: Sequence[Dict[str, Any]],
+        treatments: Sequence[str],
+        temps: Sequence[float],
+        k: int,
+        max_attempts: int = 5,
+        overwrite: bool = False,
+        units: Optional[Iterable[Dict[str, Any]]] = None,
+    ) -> "WorkQueue":
+        """
+        A queue over the treatments x temps x k grid, or over `units` (e.g. a
+        src.design plan's, whose top_p / max_tokens / model ride along per unit).
+        """
+        if os.path.exists(path):
+            if not overwrite:
+                raise FileExistsError(f"{path} exists (pass --overwrite to replace it).")
+            os.remove(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = _connect(path)
+        con.executescript(SCHEMA)
+        meta = {
+            "treatments": list(treatments),
+            "temps": [float(x) for x in temps],
+            "k": int(k),
+            "n_items": len(items),
+            "dataset_sha256": dataset_fingerprint(items),
+            "max_attempts": int(max_attempts),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        con.execute("BEGIN IMMEDIATE")
+        con.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [(k_, json.dumps(v)) for k_, v in meta.items()])
+        if units is None:
+            units = grid_units(treatments, temps, items, k)
+        con.executemany(
+            "INSERT INTO units (run_id, seq, config_id, treatment, temperature, question_id, rep, model, params) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    u["run_id"], i, u["config_id"], u["treatment"], u["temperature"], u["question_id"], u["rep"],
+                    u.get("model"), json.dumps({a: u[a] for a in UNIT_PARAMS if a in u}) if any(a in u for a in UNIT_PARAMS) else None,
+                )
+                for i, u in enumerate(units)
+            ),
+        )
+        con.execute("COMMIT")
+        con.close()
+        return cls(path)
+
+    def close(self) -> None:
+        self.con.close()
+
+    # ---------------- workers ----------------
+
+    def register(self, worker: str) -> None:
+        now = time.time()
+        self.con.execute(
+            "INSERT INTO workers (worker, host, pid, started_at, last_seen) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(worker) DO UPDATE SET host = excluded.host, pid = excluded.pid, "
+            "started_at = excluded.started_at, last_seen = excluded.last_seen",
+            (worker, socket.gethostname(), os.getpid(), now, now),
+        )
+
+    def _model_filter(self, model: Optional[str]) -> Tuple[str, List[Any]]:
+        if model is None:
+            return "", []
+        return " AND (model IS NULL OR model IN (?, ?))", [model, os.path.basename(model)]
+
+    def lease(self, worker: str, n: int, lease_sec: float, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Up to n units in grid order, expired leases (a dead worker's units)
+        before pending ones. A unit already tried max_attempts times is marked
+        failed instead of being issued again. With `model`, only units for
+        that model (or for any model).
+        """
+        where, params = self._model_filter(model)
+        now = time.time()
+        max_attempts = int(self.meta.get("max_attempts", 5))
+        out: List[Dict[str, Any]] = []
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            while len(out) < n:
+                rows = self.con.execute(
+                    "SELECT * FROM units WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?))"
+                    + where
+                    + " ORDER BY state = 'pending', seq LIMIT ?",
+                    [now] + params + [n - len(out)],
+                ).fetchall()
+                if not rows:
+                    break
+                for r in rows:
+                    if r["attempts"] >= max_attempts:
+                        self.con.execute(
+                            "UPDATE units SET state = 'failed', worker = NULL, lease_id = NULL, lease_expires = NULL "
+                            "WHERE run_id = ?",
+                            (r["run_id"],),
+                        )
+                        continue
+                    lease_id = uuid.uuid4().hex
+                    self.con.execute(
+                        "UPDATE units SET state = 'leased', worker = ?, lease_id = ?, lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE run_id = ?",
+                        (worker, lease_id, now + lease_sec, r["run_id"]),
+                    )
+                    unit = {c: r[c] for c in r.keys() if c not in ("model", "params")}
+                    unit.update(json.loads(r["params"] or "{}"))
+                    unit.update(worker=worker, lease_id=lease_id, attempts=r["attempts"] + 1)
+                    out.append(unit)
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        return out
+
+    def heartbeat(self, worker: str, lease_sec: float) -> int:
+        """Renew every lease the worker holds; returns how many."""
+        now = time.time()
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.con.execute(
+                "UPDATE units SET lease_expires = ? WHERE worker = ? AND state = 'leased'", (now + lease_sec, worker)
+            )
+            self.con.execute("UPDATE workers SET last_seen = ? WHERE worker = ?", (now, worker))
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        return cur.rowcount
+
+    def complete(self, unit: Dict[str, Any], row: Dict[str, Any]) -> bool:
+        """
+        Mark the unit done and store its run row, if this lease is still the
+        current one. False means the lease was lost (expired and re-issued, or
+        already completed) and the row must be discarded.
+        """
+        line = json.dumps(row, ensure_ascii=False)
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.con.execute(
+                "UPDATE units SET state = 'done', completed_at = ?, lease_expires = NULL "
+                "WHERE run_id = ? AND lease_id = ? AND state = 'leased'",
+                (time.time(), unit["run_id"], unit["lease_id"]),
+            )
+            if cur.rowcount != 1:
+                self.con.execute("ROLLBACK")
+                return False
+            self.con.execute(
+                "INSERT INTO results (run_id, worker, row) VALUES (?, ?, ?)", (unit["run_id"], unit["worker"], line)
+            )
+            self.con.execute("UPDATE workers SET completed = completed + 1 WHERE worker = ?", (unit["worker"],))
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        return True
+
+    def release(self, worker: str, run_ids: Optional[Sequence[str]] = None) -> int:
+        """Hand a worker's leased units (or just run_ids) back as pending, e.g. on Ctrl-C."""
+        sql = "UPDATE units SET state = 'pending', worker = NULL, lease_id = NULL, lease_expires = NULL WHERE worker = ? AND state = 'leased'"
+        params: List[Any] = [worker]
+        if run_ids is not None:
+            if not run_ids:
+                return 0
+            sql += f" AND run_id IN ({','.join('?' * len(run_ids))})"
+            params += list(run_ids)
+        self.con.execute("BEGIN IMMEDIATE")
+        cur = self.con.execute(sql, params)
+        self.con.execute("COMMIT")
+        return cur.rowcount
+
+    # ---------------- status / export ----------------
+
+    def counts(self) -> Dict[str, int]:
+        out = {s: 0 for s in STATES}
+        for r in self.con.execute("SELECT state, COUNT(*) AS n FROM units GROUP BY state"):
+            out[r["state"]] = r["n"]
+        out["total"] = sum(out[s] for s in STATES)
+        return out
+
+    def open_units(self, model: Optional[str] = None) -> int:
+        """Units not yet done or failed (pending, or leased by someone)."""
+        where, params = self._model_filter(model)
+        return self.con.execute("SELECT COUNT(*) FROM units WHERE state IN ('pending', 'leased')" + where, params).fetchone()[0]
+
+    def worker_records(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        held = dict(self.con.execute("SELECT worker, COUNT(*) FROM units WHERE state = 'leased' GROUP BY worker").fetchall())
+        out = []
+        for r in self.con.execute("SELECT * FROM workers ORDER BY started_at"):
+            out.append(
+                {
+                    "worker": r["worker"],
+                    "host": r["host"],
+                    "pid": r["pid"],
+                    "completed": r["completed"],
+                    "leased": held.get(r["worker"], 0),
+                    "last_seen_sec_ago": round(now - r["last_seen"], 1) if r["last_seen"] else None,
+                }
+            )
+        return out
+
+    def iter_results(self) -> Iterator[str]:
+        """Stored run rows (JSON lines) in grid order."""
+        for (line,) in self.con.execute("SELECT r.row FROM results r JOIN units u USING (run_id) ORDER BY u.seq"):
+            yield line
+
+
+class QueueWorker:
+    """
+    A runner's side of the queue: leases batches, keeps them alive from a
+    heartbeat thread (its own connection), and yields units in lease order.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        worker_id: str,
+        lease_sec: float = 120.0,
+        batch: int = 4,
+        poll_sec: float = 5.0,
+        model: Optional[str] = None,
+    ) -> None:
+        self.queue = WorkQueue(path)
+        self.worker_id = worker_id
+        self.model = model
+        self.lease_sec = lease_sec
+        self.batch = max(1, batch)
+        self.poll_sec = poll_sec
+        self.completed = 0
+        self.lost = 0
+        self._held: List[Dict[str, Any]] = []
+        self._stop = threading.Event()
+        self.queue.register(worker_id)
+        self._hb = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        self._hb.start()
+
+    @property
+    def treatments(self) -> List[str]:
+        return list(self.queue.meta["treatments"])
+
+    @property
+    def temps(self) -> List[float]:
+        return [float(x) for x in self.queue.meta["temps"]]
+
+    @property
+    def k(self) -> int:
+        return int(self.queue.meta["k"])
+
+    def check_dataset(self, items: Sequence[Dict[str, Any]]) -> None:
+        if dataset_fingerprint(items) != self.queue.meta["dataset_sha256"]:
+            raise ValueError(f"--dataset does not match the dataset the queue {self.queue.path} was created from.")
+
+    def _heartbeat_loop(self) -> None:
+        con_queue = WorkQueue(self.queue.path)
+        try:
+            while not self._stop.wait(max(self.lease_sec / 3.0, 1.0)):
+                try:
+                    con_queue.heartbeat(self.worker_id, self.lease_sec)
+                except sqlite3.OperationalError as e:
+                    # Shared filesystem hiccup; the next beat retries well before the leases expire
+                    print(f"[queue] heartbeat failed: {e}", file=sys.stderr, flush=True)
+        finally:
+            con_queue.close()
+
+    def units(self) -> Iterator[Dict[str, Any]]:
+        """
+        Leased units until the queue has nothing left to issue. While other
+        workers still hold leases, keep polling: if they die, their units come
+        back here.
+        """
+        while True:
+            self._held = self.queue.lease(self.worker_id, self.batch, self.lease_sec, model=self.model)
+            if not self._held:
+                if self.queue.open_units(self.model) == 0:
+                    return
+                time.sleep(self.poll_sec)
+                continue
+            while self._held:
+                yield self._held[0]
+                self._held.pop(0)
+
+    def complete(self, unit: Dict[str, Any], row: Dict[str, Any]) -> bool:
+        ok = self.queue.complete(unit, row)
+        if ok:
+            self.completed += 1
+        else:
+            self.lost += 1
+            print(f"[queue] lease on {unit['run_id']} was lost; dropping this attempt", file=sys.stderr, flush=True)
+        return ok
+
+    def close(self) -> None:
+        self._stop.set()
+        self._hb.join()
+        released = self.queue.release(self.worker_id)
+        c = self.queue.counts()
+        print(
+            f"[queue] worker {self.worker_id}: completed {self.completed}, lost leases {self.lost}, released {released}; "
+            f"queue {c['done']}/{c['total']} done, {c['pending']} pending, {c['leased']} leased, {c['failed']} failed"
+        )
+        self.queue.close()
+
+
+def add_queue_args(ap) -> None:
+    ap.add_argument(
+        "--queue",
+        default=None,
+        help="Work-queue SQLite file (src.work_queue): take units from it instead of running the whole grid.",
+    )
+    ap.add_argument("--worker-id", default=None, help="Worker name in the queue (default: <host>-<pid>).")
+    ap.add_argument("--lease-sec", type=float, default=120.0, help="Lease length; renewed every third of it.")
+    ap.add_argument("--queue-batch", type=int, default=4, help="Units leased per round trip.")
+
+
+def start_worker(args, model: Optional[str] = None) -> Optional[QueueWorker]:
+    """A QueueWorker when --queue was given; `model` limits it to that model's units of a plan."""
+    if not getattr(args, "queue", None):
+        return None
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    return QueueWorker(args.queue, worker_id, lease_sec=args.lease_sec, batch=args.queue_batch, model=model)
+
+
+# ============================================================
+# Coordinator CLI
+# ============================================================
+
+
+def _print_status(q: WorkQueue) -> None:
+    c = q.counts()
+    pct = 100.0 * c["done"] / c["total"] if c["total"] else 100.0
+    print(
+        f"{q.path}: {c['done']}/{c['total']} done ({pct:.1f}%), {c['pending']} pending, "
+        f"{c['leased']} leased, {c['failed']} failed"
+    )
+    workers = q.worker_records()
+    if workers:
+        print(f"{'worker':<28} {'host':<20} {'completed':>9} {'leased':>6} {'last seen':>10}")
+        for w in workers:
+            seen = f"{w['last_seen_sec_ago']:.0f}s ago" if w["last_seen_sec_ago"] is not None else "-"
+            print(f"{w['worker']:<28} {str(w['host']):<20} {w['completed']:>9} {w['leased']:>6} {seen:>10}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Shared SQLite work queue for distributed sweeps.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("init", help="Expand a sweep grid into work units.")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--dataset", required=True, help="JSONL dataset path.")
+    p.add_argument("--treatments", nargs="+", default=["T0", "T5"])
+    p.add_argument("--temps", type=float, nargs="+", default=[0.2])
+    p.add_argument("--k", type=int, default=1)
+    p.add_argument("--plan", default=None, help="Design plan (src.design): its points replace --treatments / --temps / --k.")
+    p.add_argument("--max-attempts", type=int, default=5, help="Leases per unit before it is marked failed.")
+    p.add_argument("--interleave", action="store_true", help="Lease question by question across configs (see `monitor`).")
+    p.add_argument("--overwrite", action="store_true")
+
+    p = sub.add_parser("status", help="Unit counts and per-worker progress.")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--json", action="store_true")
+
+    p = sub.add_parser("export", help="Write the completed run rows to one JSONL, in grid order.")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--out-jsonl", required=True)
+
+    p = sub.add_parser("requeue", help="Put failed (or, with --leased, all leased) units back to pending.")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--leased", action="store_true", help="Also reclaim units leased by any worker (all workers stopped).")
+
+    args = ap.parse_args()
+
+    if args.cmd == "init":
+        from src.data_io import iter_dataset_items
+
+        items = list(iter_dataset_items(args.dataset))
+        if not items:
+            raise ValueError(f"No items found in dataset: {args.dataset}")
+        treatments, temps, k, units = args.treatments, args.temps, args.k, None
+        if args.plan:
+            from src.design import load_plan, plan_treatments, plan_units
+
+            plan = load_plan(args.plan)
+            treatments, k = plan_treatments(plan), int(plan.get("k", 1))
+            temps = sorted({float(p["temp"]) for p in plan["points"]})
+            units = plan_units(plan, items)
+        if args.interleave:
+            units = interleave_units(units if units is not None else grid_units(treatments, temps, items, k))
+        q = WorkQueue.create(
+            args.queue, items, treatments, temps, k, max_attempts=args.max_attempts, overwrite=args.overwrite, units=units
+        )
+        _print_status(q)
+        return
+
+    q = WorkQueue(args.queue)
+    if args.cmd == "status":
+        if args.json:
+            print(json.dumps({"counts": q.counts(), "workers": q.worker_records(), "meta": q.meta}, indent=2))
+        else:
+            _print_status(q)
+    elif args.cmd == "export":
+        os.makedirs(os.path.dirname(args.out_jsonl) or ".", exist_ok=True)
+        n = 0
+        with open(args.out_jsonl, "w", encoding="utf-8") as f:
+            for line in q.iter_results():
+                f.write(line + "\n")
+                n += 1
+        c = q.counts()
+        print(f"Wrote {n} runs to: {args.out_jsonl} ({c['total'] - n} of {c['total']} units not done)")
+    elif args.cmd == "requeue":
+        states = ("failed", "leased") if args.leased else ("failed",)
+        q.con.execute("BEGIN IMMEDIATE")
+        cur = q.con.execute(
+            f"UPDATE units SET state = 'pending', worker = NULL, lease_id = NULL, lease_expires = NULL, attempts = 0 "
+            f"WHERE state IN ({','.join('?' * len(states))})",
+            states,
+        )
+        q.con.execute("COMMIT")
+        print(f"Requeued {cur.rowcount} units")
+        _print_status(q)
+    q.close()
+
+
+if __name__ == "__main__":
+    main()
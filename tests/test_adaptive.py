@@ -0,0 +1,21 @@
+import math
+
+import numpy as np
+import pytest
+
+from src.adaptive import AdaptiveScheduler
+
+
+@pytest.mark.parametrize("m", [1, 4, 9])
+def test_contrast_gives_shared_baseline_sqrt_m_share(m):
+    """Equal accuracies, every contrast kept open: the baseline gets sqrt(m) x a treatment's calls."""
+    arms = [{"config_id": f"T{t}_temp0.7", "treatment": f"T{t}", "temperature": 0.7} for t in range(m + 1)]
+    items = [{"id": f"q{i}"} for i in range(50)]
+    sched = AdaptiveScheduler(
+        arms, items, policy="contrast", budget=400 * (m + 1), warmup=5, floor=0.0, target_width=0.01, seed=0
+    )
+    rng = np.random.default_rng(1)
+    for unit in sched.units():
+        sched.observe({**unit, "correct": bool(rng.random() < 0.5), "parsed_answer": "A"})
+    issued = np.array(sched.issued, dtype=float)
+    assert issued[0] / issued[1:].mean() == pytest.approx(math.sqrt(m), rel=0.05)
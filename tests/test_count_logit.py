@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analyze_plot_regression import expand_to_run_level, fit_logistic_regression
+from src.count_logit import fit_logit_from_counts, prepare_cells
+
+
+def per_question_frame() -> pd.DataFrame:
+    """30 questions x 3 treatments x 3 temps with uneven k_runs, like a sweep with dropped calls."""
+    rng = np.random.default_rng(7)
+    effect = {"T0": 0.0, "T1": 0.5, "T5": -0.4}
+    rows = []
+    for q in range(30):
+        u = rng.normal(0.0, 1.0)
+        for t, b in effect.items():
+            for temp in (0.2, 0.7, 1.0):
+                k = int(rng.integers(3, 7))
+                p = 1.0 / (1.0 + np.exp(-(0.4 + b - 0.6 * temp + u)))
+                rows.append(
+                    {
+                        "config_id": f"{t}_temp{temp}",
+                        "question_id": f"q{q}",
+                        "treatment": t,
+                        "temp": temp,
+                        "k_runs": k,
+                        "successes": int(rng.binomial(k, p)),
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("model_type", ["additive", "interaction"])
+def test_count_fit_matches_expanded_run_level_fit(model_type):
+    df = per_question_frame()
+    _, counts = fit_logit_from_counts(prepare_cells(df), model_type)
+    _, runs = fit_logistic_regression(expand_to_run_level(df), model_type)
+
+    assert list(counts.params.index) == list(runs.params.index)
+    np.testing.assert_allclose(counts.params.to_numpy(), runs.params.to_numpy(), rtol=0, atol=1e-9)
+    np.testing.assert_allclose(counts.bse.to_numpy(), runs.bse.to_numpy(), rtol=1e-9, atol=0)
+    np.testing.assert_allclose(counts.pvalues.to_numpy(), runs.pvalues.to_numpy(), rtol=1e-7, atol=1e-12)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.special import logsumexp
+
+from src.glmm_logit import RandomInterceptLogit, fit_glmm
+from src.logit_fit import TreatmentTempDesign
+
+
+def separated_cells() -> pd.DataFrame:
+    """12 questions x 2 treatments x 2 temps, k=30; a third of the questions at 0% or 100%."""
+    rng = np.random.default_rng(0)
+    rows = []
+    for q in range(12):
+        u = rng.normal(0.0, 1.5)
+        for t, b in (("T0", 0.0), ("T1", 0.6)):
+            for temp in (0.2, 1.0):
+                if q < 2:
+                    s = 30
+                elif q < 4:
+                    s = 0
+                else:
+                    s = int(rng.binomial(30, 1.0 / (1.0 + np.exp(-(0.3 + b - 0.4 * temp + u)))))
+                rows.append(
+                    {"question_id": f"q{q}", "treatment": t, "temp": temp, "config_id": f"{t}_temp{temp}", "k_runs": 30, "successes": s}
+                )
+    return pd.DataFrame(rows)
+
+
+def brute_force_loglik(model: RandomInterceptLogit, beta: np.ndarray, log_sigma: float) -> float:
+    sigma2 = np.exp(2.0 * log_sigma)
+    grid = np.linspace(-60.0, 60.0, 120001)
+    eta0 = model.X @ beta
+    total = model.log_binom
+    for g in range(model.G):
+        idx = model.q == g
+        eta = eta0[idx][:, None] + grid[None, :]
+        ll = (model.y[idx][:, None] * eta - model.n[idx][:, None] * np.logaddexp(0.0, eta)).sum(axis=0)
+        log_prior = -0.5 * grid**2 / sigma2 - 0.5 * np.log(2.0 * np.pi * sigma2)
+        total += logsumexp(ll + log_prior) + np.log(grid[1] - grid[0])
+    return float(total)
+
+
+def make_model(cells: pd.DataFrame, nagq: int) -> RandomInterceptLogit:
+    design = TreatmentTempDesign(cells["treatment"], cells["temp"])
+    qcodes, groups = pd.factorize(cells["question_id"])
+    return RandomInterceptLogit(
+        design.exog("additive"),
+        cells["successes"].to_numpy(dtype=float),
+        cells["k_runs"].to_numpy(dtype=float),
+        qcodes,
+        len(groups),
+        nagq=nagq,
+    )
+
+
+@pytest.mark.parametrize("intercept", [0.3, 4.0])
+@pytest.mark.parametrize("log_sigma", [-1.0, 0.0, 1.0, 1.5])
+def test_loglik_matches_brute_force_with_separated_questions(log_sigma, intercept):
+    cells = separated_cells()
+    beta = np.array([intercept, 0.6, -0.4])
+    exact = brute_force_loglik(make_model(cells, 1), beta, log_sigma)
+
+    # a 0% / 100% question has a skewed integrand: many nodes are needed, but AGHQ converges to it
+    aghq = make_model(cells, 60)
+    assert aghq.loglik(beta, log_sigma) == pytest.approx(exact, abs=1e-4)
+    assert np.all(np.abs(aghq.u_hat) < 20.0)
+
+    laplace = make_model(cells, 1)
+    laplace.loglik(beta, -2.0)  # warm start the mode search from a small-sigma solution, as the optimizer does
+    assert laplace.loglik(beta, log_sigma) == pytest.approx(exact, abs=0.05 * cells["question_id"].nunique())
+
+
+def test_fit_reaches_the_brute_force_optimum():
+    cells = separated_cells()
+    _, res = fit_glmm(cells, "additive", nagq=60)
+    model = make_model(cells, 1)
+    theta = np.append(res.params.to_numpy(), np.log(res.sigma))
+    best = brute_force_loglik(model, theta[:-1], theta[-1])
+    assert res.loglik == pytest.approx(best, abs=1e-4)
+    # no coordinate move improves the exact log-likelihood
+    for i in range(len(theta)):
+        for h in (-0.05, 0.05):
+            moved = theta.copy()
+            moved[i] += h
+            assert brute_force_loglik(model, moved[:-1], moved[-1]) < best
+    assert res.sigma > 0.6
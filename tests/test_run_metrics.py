@@ -0,0 +1,14 @@
+from src.run_metrics import LatencyHistogram
+
+
+def test_le_buckets_count_every_value_at_or_below_the_bound():
+    """0.004999 s shares an HDR bucket (ending at 0.005024 s) with values above 0.005."""
+    h = LatencyHistogram(le_bounds=(0.005, 0.01))
+    for v in (0.004999, 0.005, 0.0050001, 0.0099, 0.3):
+        h.record(v)
+    assert h.cumulative() == [2, 4]
+
+    other = LatencyHistogram(le_bounds=(0.005, 0.01))
+    other.record(0.001)
+    h.merge(other)
+    assert h.cumulative() == [3, 5] and h.n == 6
@@ -0,0 +1,62 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from src.answer_counts import RunningAnswerCounts
+from src.sequential import SequentialMonitor
+
+
+def monitor_args(boundary: str) -> argparse.Namespace:
+    return argparse.Namespace(
+        model_type="additive",
+        alpha=0.05,
+        boundary=boundary,
+        mixture_sd=1.0,
+        target_halfwidth=0.25,
+        min_questions=20,
+        rule="decision",
+        treatments=None,
+    )
+
+
+def add_questions(running: RunningAnswerCounts, questions: range, k: int, seed: int) -> None:
+    """T0 / T2 rows at two temps; T2 is right far more often."""
+    rng = np.random.default_rng(seed)
+    for q in questions:
+        for t, p in (("T0", 0.3), ("T2", 0.9)):
+            for r in range(k):
+                temp = (0.2, 1.0)[r % 2]
+                running.add(
+                    {
+                        "config_id": f"{t}_temp{temp}",
+                        "treatment": t,
+                        "temperature": temp,
+                        "question_id": f"q{q}",
+                        "correct": bool(rng.random() < p),
+                        "parsed_answer": "A",
+                    }
+                )
+
+
+@pytest.mark.parametrize("boundary", ["msprt", "obf"])
+def test_no_decision_before_min_questions(boundary):
+    mon = SequentialMonitor(monitor_args(boundary))
+    running = RunningAnswerCounts()
+    add_questions(running, range(2), k=40, seed=0)
+    rec = mon.checkpoint(running, planned=2000)
+    (c,) = rec["contrasts"]
+    # Two clusters give a tiny sandwich SE, but the contrast must not be decided on it
+    assert not c["testable"] and not c["decided"] and not rec["stop"]
+    assert mon.decided == {} and mon.t_prev == {}
+
+    add_questions(running, range(2, 25), k=4, seed=1)
+    rec = mon.checkpoint(running, planned=2000)
+    (c,) = rec["contrasts"]
+    assert c["testable"] and c["decided"] and rec["stop"]
+    assert c["decided_at"]["look"] == 2
+    if boundary == "obf":
+        # The untestable first look spent nothing: all alpha up to this information is available
+        from src.sequential import obf_spent
+
+        assert c["alpha_spent_this_look"] == pytest.approx(obf_spent(rec["information"], 0.05))